@@ -0,0 +1,346 @@
+# coding: utf-8
+"""Load fixtures from a compiled, pre-deserialized form.
+
+Most of the time loaddata spends on a fixture goes into parsing it, turning
+each field into a Python value, and saving the objects one at a time. A
+compiled fixture is what's left after the first two: the field values of each
+object, grouped by model. It's kept on disk under a hash of the fixture's
+contents, so later runs skip straight to inserting the rows, many to a
+statement, with FK targets ahead of the models that point to them.
+"""
+import hashlib
+import json
+import os
+import pickle
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.management.color import no_style
+from django.core.serializers.python import Deserializer as PythonDeserializer
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+
+from django_nose.fixture_tables import (
+    _allow_model,
+    _open_fixture,
+    dependency_order,
+    find_fixture_files,
+    get_model,
+)
+from django_nose.utils import _atomic_write, cache_dir
+
+__all__ = ("compile_fixture", "compiling_fixtures", "load_compiled_fixtures")
+
+# Bump this when the layout of compiled fixtures changes:
+_VERSION = 2
+
+# Compiled fixtures already loaded this run, by hash:
+_compiled = {}
+
+# How many primary keys to look up at once:
+_PK_BATCH_SIZE = 500
+
+
+def compiling_fixtures():
+    """Return whether the ``COMPILED_FIXTURES`` flag was passed."""
+    return os.getenv("COMPILED_FIXTURES", "false").lower() in ("true", "1")
+
+
+def _content_hash(path, format, compression_format):
+    digest = hashlib.sha1(("%s.%s\n" % (format, compression_format)).encode())
+    with open(path, "rb") as fixture:
+        for chunk in iter(lambda: fixture.read(64 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class _Missing(object):
+    """Stands in for the value of a field a fixture leaves out.
+
+    The field's default is worked out when the fixture is loaded, so callable
+    ones, like ``timezone.now``, aren't frozen at whatever they returned when
+    it was compiled. (The class itself is the marker, as it survives pickling
+    as itself.)
+    """
+
+
+def _columns(model):
+    """Return the attnames of the fields a raw save of a model writes."""
+    return [field.attname for field in model._meta.local_concrete_fields]
+
+
+def _column_types(model):
+    """Return the internal types of the fields a raw save of a model writes."""
+    return [field.get_internal_type() for field in model._meta.local_concrete_fields]
+
+
+def _is_current(compiled):
+    """Return whether a compiled fixture still fits the models."""
+    try:
+        if compiled["version"] != _VERSION:
+            return False
+        for label, columns, _, _ in compiled["models"]:
+            model = get_model(*label.split("."))
+            if _columns(model) != columns:
+                return False
+            if _column_types(model) != compiled["types"][label]:
+                return False
+    except (KeyError, LookupError, TypeError, ValueError):
+        return False
+    return True
+
+
+def _read_objects(fixture, format):
+    """Return the objects in a JSON or YAML fixture, or None for other formats."""
+    if format == "json":
+        return json.loads(fixture.read().decode("utf-8"))
+    if format == "yaml":
+        import yaml
+
+        return yaml.load(fixture, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+    return None
+
+
+def _compilable(objects):
+    """Return whether some objects can be deserialized without the DB.
+
+    Objects with natural primary keys, and relations given as natural keys,
+    are looked up in the DB, and could deserialize differently next time.
+    Anything we can't make sense of is left to loaddata to complain about.
+    """
+    if not isinstance(objects, list):
+        return False
+    try:
+        for obj in objects:
+            if obj.get("pk") is None:
+                return False
+            model = get_model(*obj["model"].split("."))
+            for name, value in obj.get("fields", {}).items():
+                field = model._meta.get_field(name)
+                if field.remote_field is None:
+                    continue
+                if field.many_to_many:
+                    if not field.remote_field.through._meta.auto_created:
+                        return False
+                    if any(isinstance(v, (list, tuple)) for v in value):
+                        return False
+                elif isinstance(value, (list, tuple)):
+                    return False
+    except (AttributeError, FieldDoesNotExist, KeyError, LookupError, TypeError):
+        return False
+    return True
+
+
+def _compile(objects, using):
+    """Deserialize some objects, and group their field values by model.
+
+    Fields an object leaves out get ``_Missing`` rather than their default.
+    """
+    models = OrderedDict()
+    types = {}
+    for fixture_obj, obj in zip(objects, PythonDeserializer(objects, using=using)):
+        instance = obj.object
+        # A raw save of a proxy writes to the table of its concrete model:
+        model = instance._meta.concrete_model
+        label = "%s.%s" % (model._meta.app_label, model._meta.model_name)
+        if label not in models:
+            models[label] = (label, _columns(model), [], [])
+            types[label] = _column_types(model)
+        _, columns, rows, m2m = models[label]
+        given = fixture_obj.get("fields", {})
+        rows.append(
+            tuple(
+                getattr(instance, field.attname)
+                if field.primary_key or field.name in given or field.attname in given
+                else _Missing
+                for field in model._meta.local_concrete_fields
+            )
+        )
+        m2m.append(obj.m2m_data or {})
+    return {"version": _VERSION, "models": list(models.values()), "types": types}
+
+
+def _with_defaults(model, row):
+    """Return a compiled row, with the defaults of fields it left out."""
+    if not any(value is _Missing for value in row):
+        return row
+    return tuple(
+        field.get_default() if value is _Missing else value
+        for field, value in zip(model._meta.local_concrete_fields, row)
+    )
+
+
+def compile_fixture(path, format, compression_format=None, using=DEFAULT_DB_ALIAS):
+    """Return a fixture file, compiled, or None if it can't be compiled.
+
+    A compiled fixture is a dict holding, under ``models``, a list of
+    ``(model label, columns, rows, m2m)`` in order of appearance: the attnames
+    of the fields the model's table holds, a tuple of their values for each
+    object, and each object's many-to-many data. Fields left out of the
+    fixture hold ``_Missing``, and get their defaults when it's loaded.
+
+    Only JSON and YAML fixtures without natural keys are compiled. Compiled
+    fixtures are kept for the rest of the run and, by a hash of the file's
+    contents, in the cache directory for later runs.
+    """
+    digest = _content_hash(path, format, compression_format)
+    compiled = _compiled.get(digest)
+    if compiled is not None and _is_current(compiled):
+        return compiled
+
+    directory = cache_dir()
+    cache_path = directory and os.path.join(directory, digest + ".pickle")
+    if cache_path:
+        try:
+            with open(cache_path, "rb") as cache_file:
+                compiled = pickle.load(cache_file)
+        except Exception:
+            compiled = None
+        if compiled is not None and _is_current(compiled):
+            _compiled[digest] = compiled
+            return compiled
+
+    try:
+        with _open_fixture(path, compression_format) as fixture:
+            objects = _read_objects(fixture, format)
+        if not _compilable(objects):
+            return None
+        compiled = _compile(objects, using)
+    except Exception:
+        # loaddata will say what's wrong with the fixture.
+        return None
+    _compiled[digest] = compiled
+
+    if cache_path:
+        try:
+            _atomic_write(
+                cache_path,
+                lambda cache_file: pickle.dump(
+                    compiled, cache_file, pickle.HIGHEST_PROTOCOL
+                ),
+                mode="wb",
+            )
+        except (IOError, OSError, pickle.PicklingError):
+            # It's only a cache.
+            pass
+    return compiled
+
+
+def _existing_pks(model, pks, using):
+    """Return which of some primary keys a model's table already holds."""
+    manager = model._base_manager.using(using)
+    existing = set()
+    for start in range(0, len(pks), _PK_BATCH_SIZE):
+        batch = pks[start : start + _PK_BATCH_SIZE]
+        existing.update(manager.filter(pk__in=batch).values_list("pk", flat=True))
+    return existing
+
+
+def _insert(model, columns, objects, using):
+    """Write the objects of a model to its table, like loaddata would.
+
+    New objects are inserted many to a statement. Objects whose primary key
+    is taken are saved over the existing rows one at a time, and so are the
+    objects of models with multi-table parents, which ``bulk_create`` refuses.
+    Return the primary keys of the objects inserted in bulk.
+    """
+    pks = list(objects)
+    new = []
+    if model._meta.parents:
+        saved = pks
+    else:
+        existing = _existing_pks(model, pks, using)
+        new = [pk for pk in pks if pk not in existing]
+        if new:
+            # Raw saves write only the model's own fields, which here are all
+            # of them, in order, so the rows can be passed straight to
+            # __init__:
+            model._base_manager.using(using).bulk_create(
+                [model(*objects[pk][0]) for pk in new]
+            )
+            for field in model._meta.many_to_many:
+                _insert_m2m(field, [(pk, objects[pk][1]) for pk in new], using)
+        saved = [pk for pk in pks if pk in existing]
+
+    for pk in saved:
+        row, m2m = objects[pk]
+        instance = model(**dict(zip(columns, row)))
+        model.save_base(instance, using=using, raw=True)
+        for accessor, values in m2m.items():
+            getattr(instance, accessor).set(values)
+    return new
+
+
+def _insert_m2m(field, objects, using):
+    """Insert the many-to-many rows of some new objects for one field."""
+    through = field.remote_field.through
+    source = through._meta.get_field(field.m2m_field_name())
+    target = through._meta.get_field(field.m2m_reverse_field_name())
+    objects = [(pk, m2m[field.name]) for pk, m2m in objects if field.name in m2m]
+    if not objects:
+        return
+    # Rows of an earlier object with the same primary key may linger, and
+    # loaddata would have replaced them:
+    manager = through._base_manager.using(using)
+    manager.filter(**{"%s__in" % source.name: [pk for pk, _ in objects]}).delete()
+    manager.bulk_create(
+        [
+            through(**{source.attname: pk, target.attname: value})
+            for pk, values in objects
+            for value in values
+        ]
+    )
+
+
+def load_compiled_fixtures(fixture_labels, using=DEFAULT_DB_ALIAS, added=None):
+    """Load some fixtures from their compiled form, and return whether we did.
+
+    If any of the fixtures can't be found or compiled, nothing is loaded, and
+    False is returned, so loaddata can take over. Otherwise, objects of the
+    same model from all the fixtures are inserted together, later ones
+    replacing earlier ones with the same primary key, just as loaddata would
+    leave them. Unlike loaddata's saves, bulk inserts send no signals, so the
+    primary keys they insert are added to ``added``, a dict of sets by model,
+    if it's given.
+    """
+    compiled = []
+    for fixture_label in fixture_labels:
+        files = find_fixture_files(fixture_label, using)
+        if not files:
+            return False
+        for path, format, compression_format in files:
+            fixture = compile_fixture(path, format, compression_format, using)
+            if fixture is None:
+                return False
+            compiled.append(fixture)
+
+    # The objects of each model, by primary key: a row and the m2m data.
+    objects = OrderedDict()
+    columns = {}
+    for fixture in compiled:
+        for label, model_columns, rows, m2m in fixture["models"]:
+            model = get_model(*label.split("."))
+            columns[model] = model_columns
+            pk_index = model_columns.index(model._meta.pk.attname)
+            model_objects = objects.setdefault(model, OrderedDict())
+            for row, m2m_data in zip(rows, m2m):
+                model_objects[row[pk_index]] = (_with_defaults(model, row), m2m_data)
+
+    models = [model for model in objects if _allow_model(using, model)]
+    if not models:
+        return True
+    connection = connections[using]
+    with transaction.atomic(using=using):
+        with connection.constraint_checks_disabled():
+            for model in dependency_order(models):
+                new = _insert(model, columns[model], objects[model], using)
+                if added is not None and new:
+                    added.setdefault(model, set()).update(new)
+        connection.check_constraints(
+            table_names=[model._meta.db_table for model in models]
+        )
+        sequence_sql = connection.ops.sequence_reset_sql(no_style(), models)
+        if sequence_sql:
+            with connection.cursor() as cursor:
+                for line in sequence_sql:
+                    cursor.execute(line)
+    return True
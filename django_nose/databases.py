@@ -0,0 +1,590 @@
+# coding: utf-8
+"""Helpers for inspecting and reusing test databases.
+
+These back the ``REUSE_DB`` machinery in ``django_nose.runner``. They keep a
+small metadata table inside each test DB so a later test run can tell whether
+the DB it finds is still good enough to reuse, and they know how to copy a
+whole test DB using the cheapest method each backend offers.
+"""
+import glob
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import sys
+
+import django
+from django.apps import apps
+from django.db import transaction
+
+from django_nose.utils import _atomic_write, cache_dir
+
+__all__ = (
+    "METADATA_TABLE",
+    "read_metadata",
+    "write_metadata",
+    "schema_fingerprint",
+    "sequence_positions",
+    "record_sequence_positions",
+    "moved_sequences",
+    "sqlite_sequence_reset_sql",
+    "row_counts",
+    "record_row_counts",
+    "changed_tables",
+    "connect_to",
+    "database_exists",
+    "template_db_name",
+    "clone_database",
+    "pooled_db_name",
+    "is_pooled_db_name",
+    "DatabasePool",
+    "snapshot_path",
+    "save_snapshot",
+    "prune_snapshots",
+    "restore_snapshot",
+)
+
+# Backends we know how to probe for and copy whole databases on:
+CLONEABLE_VENDORS = ("sqlite", "postgresql", "mysql")
+
+
+# Name of the table that django-nose keeps its bookkeeping in. It isn't backed
+# by a model, so Django's flush and sql_flush() leave it alone.
+METADATA_TABLE = "django_nose_metadata"
+
+
+def _metadata_table_exists(connection):
+    """Return whether the metadata table exists in the connected DB."""
+    with connection.cursor() as cursor:
+        return METADATA_TABLE in connection.introspection.table_names(cursor)
+
+
+def read_metadata(connection, name, default=None):
+    """Return the metadata value stored under ``name``, or ``default``."""
+    if not _metadata_table_exists(connection):
+        return default
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT %s FROM %s WHERE %s = %%s"
+            % (qn("value"), qn(METADATA_TABLE), qn("name")),
+            [name],
+        )
+        row = cursor.fetchone()
+    return default if row is None else row[0]
+
+
+def write_metadata(connection, name, value):
+    """Store ``value`` under ``name``, creating the metadata table if needed."""
+    qn = connection.ops.quote_name
+    exists = _metadata_table_exists(connection)
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            if not exists:
+                cursor.execute(
+                    "CREATE TABLE %s (%s VARCHAR(100) PRIMARY KEY, %s TEXT)"
+                    % (qn(METADATA_TABLE), qn("name"), qn("value"))
+                )
+            cursor.execute(
+                "DELETE FROM %s WHERE %s = %%s" % (qn(METADATA_TABLE), qn("name")),
+                [name],
+            )
+            cursor.execute(
+                "INSERT INTO %s (%s, %s) VALUES (%%s, %%s)"
+                % (qn(METADATA_TABLE), qn("name"), qn("value")),
+                [name, value],
+            )
+
+
+def _migration_state():
+    """Yield a description of every migration on disk.
+
+    This looks only at the migration files, never at the DB, so it is cheap:
+    the migration modules are imported anyway when the test DB is migrated.
+    Each migration contributes its name and the contents of its source file,
+    so editing a migration in place is noticed, too.
+    """
+    from django.db.migrations.loader import MigrationLoader
+
+    loader = MigrationLoader(None, ignore_no_migrations=True)
+    for key in sorted(loader.disk_migrations):
+        migration = loader.disk_migrations[key]
+        yield "%s.%s" % key
+        module = sys.modules.get(migration.__module__)
+        path = getattr(module, "__file__", None)
+        if path:
+            try:
+                with open(path, "rb") as source:
+                    yield hashlib.sha1(source.read()).hexdigest()
+            except OSError:
+                pass
+
+
+def _model_state(connection):
+    """Yield a description of every model's table and columns.
+
+    This catches schema changes in apps without migrations, including
+    test-only models, which the migration state can't see.
+    """
+    models = apps.get_models(include_auto_created=True)
+    for model in sorted(models, key=lambda m: m._meta.db_table):
+        yield model._meta.db_table
+        for field in model._meta.local_fields:
+            yield "%s %s" % (field.column, field.db_type(connection))
+
+
+# The migrations and models can't change during a run, so their part of the
+# fingerprint is worked out once: the migrations' for all DBs, and the whole
+# fingerprint by DB alias.
+_migration_parts = None
+_fingerprints = {}
+
+
+def schema_fingerprint(connection):
+    """Return a hash of the schema the test DB for ``connection`` should have.
+
+    The fingerprint covers the Django version, the DB engine, every migration
+    on disk, and the table and column definitions of every installed model.
+    It doesn't touch the DB, so it can be compared against the value recorded
+    in a reused DB before deciding whether to rebuild it. It's worked out
+    once per DB alias per process.
+    """
+    global _migration_parts
+
+    if connection.alias in _fingerprints:
+        return _fingerprints[connection.alias]
+    if _migration_parts is None:
+        _migration_parts = list(_migration_state())
+    fingerprint = hashlib.sha1()
+    parts = [django.get_version(), connection.settings_dict["ENGINE"]]
+    for part in parts + _migration_parts + list(_model_state(connection)):
+        fingerprint.update(part.encode("utf-8"))
+        fingerprint.update(b"\n")
+    _fingerprints[connection.alias] = fingerprint.hexdigest()
+    return _fingerprints[connection.alias]
+
+
+# Queries returning (table, position) for every auto-increment sequence, in one
+# round-trip:
+_SEQUENCE_POSITION_SQL = {
+    "sqlite": "SELECT name, seq FROM sqlite_sequence",
+    # Serial and identity columns own their sequences. pg_sequences appeared
+    # in PostgreSQL 10.
+    "postgresql": """
+        SELECT t.relname, array_agg(s.last_value ORDER BY seq.relname)
+        FROM pg_catalog.pg_depend d
+        JOIN pg_catalog.pg_class seq ON seq.oid = d.objid AND seq.relkind = 'S'
+        JOIN pg_catalog.pg_namespace n ON n.oid = seq.relnamespace
+        JOIN pg_catalog.pg_class t ON t.oid = d.refobjid
+        JOIN pg_catalog.pg_sequences s
+            ON s.schemaname = n.nspname AND s.sequencename = seq.relname
+        WHERE d.classid = 'pg_catalog.pg_class'::regclass
+            AND d.refclassid = 'pg_catalog.pg_class'::regclass
+            AND d.deptype IN ('a', 'i')
+            AND pg_catalog.pg_table_is_visible(t.oid)
+        GROUP BY t.relname
+    """,
+    "mysql": """
+        SELECT table_name, auto_increment FROM information_schema.tables
+        WHERE table_schema = DATABASE() AND auto_increment IS NOT NULL
+    """,
+}
+
+
+def sequence_positions(connection):
+    """Return where each table's auto-increment sequence stands, by table.
+
+    Return None if we don't know how to ask the backend. Positions are only
+    good for comparing with each other.
+    """
+    sql = _SEQUENCE_POSITION_SQL.get(connection.vendor)
+    if sql is None:
+        return None
+    if connection.vendor == "postgresql" and connection.pg_version < 100000:
+        return None
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            # SQLite makes this table when the first AUTOINCREMENT one is, and
+            # Django's introspection hides it.
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_sequence'"
+            )
+            if cursor.fetchone() is None:
+                return {}
+        if (
+            connection.vendor == "mysql"
+            and not connection.mysql_is_mariadb
+            and connection.mysql_version >= (8,)
+        ):
+            # Otherwise MySQL 8 may answer from a stale cache of table stats.
+            cursor.execute("SET SESSION information_schema_stats_expiry = 0")
+        cursor.execute(sql)
+        return dict((table, position) for table, position in cursor.fetchall())
+
+
+def record_sequence_positions(connection):
+    """Note in the test DB where its sequences stand, as a high-water mark.
+
+    Call this when the DB is clean, so ``moved_sequences`` can tell later which
+    sequences tests have advanced since.
+    """
+    positions = sequence_positions(connection)
+    if positions is not None:
+        write_metadata(connection, "sequence_positions", json.dumps(positions))
+
+
+def moved_sequences(connection):
+    """Return the tables whose sequences moved since they were recorded.
+
+    Return None if nothing was recorded or we can't tell, in which case every
+    sequence should be treated as moved.
+    """
+    recorded = read_metadata(connection, "sequence_positions")
+    if recorded is None:
+        return None
+    current = sequence_positions(connection)
+    if current is None:
+        return None
+    recorded = json.loads(recorded)
+    return set(
+        table
+        for table in set(recorded) | set(current)
+        if recorded.get(table) != current.get(table)
+    )
+
+
+def sqlite_sequence_reset_sql(connection, tables):
+    """Return SQL putting SQLite's sequences for ``tables`` back where recorded.
+
+    SQLite keeps its AUTOINCREMENT counters as rows of ``sqlite_sequence``,
+    which Django's ``sequence_reset_sql`` leaves alone. Tables that had no
+    counter when the positions were recorded lose theirs, and start over.
+    """
+    recorded = json.loads(read_metadata(connection, "sequence_positions") or "{}")
+    statements = []
+    for table in sorted(tables):
+        name = "'%s'" % table.replace("'", "''")
+        statements.append("DELETE FROM sqlite_sequence WHERE name = %s" % name)
+        if table in recorded:
+            statements.append(
+                "INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %d)"
+                % (name, recorded[table])
+            )
+    return statements
+
+
+# SQLite refuses compound SELECTs of more than 500 terms, so row counts are
+# fetched this many tables at a time:
+_ROW_COUNT_BATCH_SIZE = 400
+
+
+def _model_tables(connection):
+    """Return the existing tables of installed models, without views."""
+    return sorted(
+        connection.introspection.django_table_names(
+            only_existing=True, include_views=False
+        )
+    )
+
+
+def row_counts(connection, tables):
+    """Return the number of rows in each of ``tables``, by table."""
+    qn = connection.ops.quote_name
+    counts = {}
+    with connection.cursor() as cursor:
+        for start in range(0, len(tables), _ROW_COUNT_BATCH_SIZE):
+            batch = tables[start : start + _ROW_COUNT_BATCH_SIZE]
+            cursor.execute(
+                " UNION ALL ".join(
+                    "SELECT %%s, COUNT(*) FROM %s" % qn(table) for table in batch
+                ),
+                batch,
+            )
+            counts.update(cursor.fetchall())
+    return counts
+
+
+def record_row_counts(connection):
+    """Note in the test DB how many rows each table has, as a clean baseline.
+
+    Call this right after the DB is built, so ``changed_tables`` can tell
+    later which tables an interrupted test run left junk in.
+    """
+    counts = row_counts(connection, _model_tables(connection))
+    write_metadata(connection, "row_counts", json.dumps(counts))
+
+
+def changed_tables(connection):
+    """Return the tables whose row counts differ from the clean baseline.
+
+    The result maps each such table to its baseline and current row counts.
+    Return None if no baseline was recorded.
+    """
+    baseline = read_metadata(connection, "row_counts")
+    if baseline is None:
+        return None
+    baseline = json.loads(baseline)
+    current = row_counts(connection, _model_tables(connection))
+    return dict(
+        (table, (baseline.get(table, 0), count))
+        for table, count in current.items()
+        if baseline.get(table, 0) != count
+    )
+
+
+def connect_to(connection, name):
+    """Return a new, unopened connection like ``connection`` but to DB ``name``.
+
+    This lets us peek into a DB other than the one ``connection`` points at
+    without disturbing it. Close the returned connection when you're done.
+    """
+    settings_dict = dict(connection.settings_dict, NAME=name)
+    return connection.__class__(settings_dict, alias=connection.alias)
+
+
+def database_exists(connection, name):
+    """Return whether a DB called ``name`` exists on ``connection``'s server.
+
+    SQLite DBs are files, so we just look for the file. Elsewhere, we ask the
+    server's catalog over a connection to its maintenance DB, so we never have
+    to connect to (or, by accident, create) the DB in question.
+    """
+    if connection.vendor == "sqlite":
+        return os.path.exists(name)
+    if connection.vendor == "postgresql":
+        sql = "SELECT 1 FROM pg_catalog.pg_database WHERE datname = %s"
+    elif connection.vendor == "mysql":
+        sql = "SELECT 1 FROM information_schema.schemata WHERE schema_name = %s"
+    else:
+        raise NotImplementedError(
+            "Can't probe for %s databases." % connection.vendor
+        )
+    with connection.creation._nodb_connection.cursor() as cursor:
+        cursor.execute(sql, [name])
+        return cursor.fetchone() is not None
+
+
+def template_db_name(connection, test_db_name):
+    """Return the name of the template DB kept for ``test_db_name``."""
+    if connection.vendor == "sqlite":
+        root, ext = os.path.splitext(test_db_name)
+        return "%s_template%s" % (root, ext)
+    return "%s_template" % test_db_name
+
+
+def pooled_db_name(connection, test_db_name, fingerprint):
+    """Return the name of the pooled test DB kept for a schema fingerprint."""
+    if connection.vendor == "sqlite":
+        root, ext = os.path.splitext(test_db_name)
+        return "%s_%s%s" % (root, fingerprint[:12], ext)
+    return "%s_%s" % (test_db_name, fingerprint[:12])
+
+
+def is_pooled_db_name(connection, test_db_name, name):
+    """Return whether ``pooled_db_name`` could have made ``name``."""
+    if connection.vendor == "sqlite":
+        root, ext = os.path.splitext(test_db_name)
+    else:
+        root, ext = test_db_name, ""
+    pattern = "%s_[0-9a-f]{12}%s" % (re.escape(root), re.escape(ext))
+    return isinstance(name, str) and re.match(pattern + r"\Z", name) is not None
+
+
+class DatabasePool(object):
+    """Which pooled test DBs exist for a test DB name, and which was used last.
+
+    The pool is remembered in a small JSON file in the cache directory, one
+    per DB server and test DB name, so that the least recently used DB can be
+    dropped when a new one would make the pool too big. The DBs it names get
+    dropped, so only names of pooled DBs for the test DB name are believed.
+    Without a safe cache directory, nothing is remembered or dropped.
+    """
+
+    def __init__(self, connection, test_db_name):
+        """Find the file the pool for ``test_db_name`` is remembered in."""
+        self.connection = connection
+        self.test_db_name = test_db_name
+        settings_dict = connection.settings_dict
+        key = "\n".join(
+            [
+                connection.vendor,
+                settings_dict.get("HOST") or "",
+                str(settings_dict.get("PORT") or ""),
+                test_db_name,
+            ]
+        )
+        directory = cache_dir()
+        self.path = directory and os.path.join(
+            directory,
+            "pool_%s.json" % hashlib.sha1(key.encode("utf-8")).hexdigest()[:16],
+        )
+
+    def _load(self):
+        if not self.path:
+            return {}
+        try:
+            with open(self.path) as pool_file:
+                last_used = json.load(pool_file)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(last_used, dict):
+            return {}
+        return dict(
+            (name, count)
+            for name, count in last_used.items()
+            if isinstance(count, int)
+            and is_pooled_db_name(self.connection, self.test_db_name, name)
+        )
+
+    def _save(self, last_used):
+        if self.path:
+            _atomic_write(self.path, lambda pool_file: json.dump(last_used, pool_file))
+
+    def use(self, name, size):
+        """Note that DB ``name`` is being used, and keep at most ``size`` DBs.
+
+        Return the names of the DBs that no longer fit, least recently used
+        first. They're forgotten; dropping them is up to the caller.
+        """
+        if not self.path:
+            return []
+        last_used = self._load()
+        # A counter rather than a timestamp, so that ties are impossible:
+        last_used[name] = max(last_used.values() or [0]) + 1
+        by_age = sorted(last_used, key=last_used.get, reverse=True)
+        evicted = by_age[size:]
+        for evicted_name in evicted:
+            del last_used[evicted_name]
+        self._save(last_used)
+        return evicted[::-1]
+
+
+def _clone_sqlite(source_name, target_name):
+    """Copy a SQLite DB file, using the backup API if we can."""
+    if os.path.exists(target_name):
+        os.remove(target_name)
+    source = sqlite3.connect(source_name)
+    try:
+        if hasattr(source, "backup"):
+            # Python 3.7 and later: copy page by page, consistently, even if
+            # somebody is writing to the source.
+            target = sqlite3.connect(target_name)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+        else:
+            shutil.copy(source_name, target_name)
+    finally:
+        source.close()
+
+
+def clone_database(connection, source_name, target_name):
+    """Replace the DB ``target_name`` with a copy of ``source_name``.
+
+    * PostgreSQL: ``CREATE DATABASE ... TEMPLATE``, a file-level copy done by
+      the server. Nobody may be connected to the source while it runs.
+    * SQLite: the backup API, or a plain file copy on old Pythons.
+    * MySQL: a fresh DB, then a schema-plus-data copy through mysqldump, the
+      same way Django clones DBs for parallel test runs.
+    """
+    if connection.vendor == "sqlite":
+        _clone_sqlite(source_name, target_name)
+        return
+
+    if connection.vendor not in CLONEABLE_VENDORS:
+        raise NotImplementedError(
+            "Can't clone %s databases." % connection.vendor
+        )
+
+    qn = connection.ops.quote_name
+    with connection.creation._nodb_connection.cursor() as cursor:
+        cursor.execute("DROP DATABASE IF EXISTS %s" % qn(target_name))
+        if connection.vendor == "postgresql":
+            cursor.execute(
+                "CREATE DATABASE %s WITH TEMPLATE %s"
+                % (qn(target_name), qn(source_name))
+            )
+        else:
+            cursor.execute(
+                "CREATE DATABASE %s %s"
+                % (qn(target_name), connection.creation.sql_table_creation_suffix())
+            )
+    if connection.vendor == "mysql":
+        connection.creation._clone_db(source_name, target_name)
+
+
+def _snapshot_name(alias, fingerprint):
+    return "snapshot_%s_%s.sqlite3" % (alias, fingerprint)
+
+
+def snapshot_path(connection):
+    """Return where to keep a snapshot of the connection's in-memory test DB.
+
+    The file is named after the alias and the schema fingerprint, so a
+    snapshot is never loaded into a DB with a different schema; a new one is
+    saved instead. Without a safe cache directory, return None.
+    """
+    directory = cache_dir()
+    return directory and os.path.join(
+        directory,
+        _snapshot_name(connection.alias, schema_fingerprint(connection)[:16]),
+    )
+
+
+def _copy_sqlite_connection(source, target):
+    """Copy everything in one open SQLite DB to another."""
+    if hasattr(source, "backup"):
+        source.backup(target)
+    else:
+        # Python < 3.7
+        target.executescript("\n".join(source.iterdump()))
+        target.commit()
+
+
+def save_snapshot(connection, path):
+    """Write the connection's SQLite DB, typically an in-memory one, to a file.
+
+    The snapshot is written next to its final place, then moved there, so a
+    test run that's interrupted halfway never leaves a partial one behind.
+    """
+    connection.ensure_connection()
+
+    def write(partial_path):
+        target = sqlite3.connect(partial_path)
+        try:
+            _copy_sqlite_connection(connection.connection, target)
+        finally:
+            target.close()
+
+    _atomic_write(path, write, mode=None)
+
+
+def prune_snapshots(connection, path):
+    """Remove the connection's snapshots, for older schemas, other than ``path``."""
+    pattern = os.path.join(
+        glob.escape(os.path.dirname(path)),
+        _snapshot_name(glob.escape(connection.alias), "[0-9a-f]" * 16),
+    )
+    for old_path in glob.glob(pattern):
+        if old_path != path:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+
+def restore_snapshot(connection, path):
+    """Load a snapshot file into the connection's SQLite DB.
+
+    For an in-memory DB, the connection has to stay open afterward, or the DB
+    goes away with it.
+    """
+    connection.ensure_connection()
+    source = sqlite3.connect(path)
+    try:
+        _copy_sqlite_connection(source, connection.connection)
+    finally:
+        source.close()
@@ -0,0 +1,212 @@
+# coding: utf-8
+"""Keep track of the time fixtures take to load and unload.
+
+A profile counts, for each fixture, how many times it was loaded and how many
+rows that took, how many times fixture bundling spared loading it, and how
+long unloading it took. Django's own test cases load fixtures with loaddata,
+one label at a time, so timing that is enough for them. FastFixtureTestCase
+loads all its fixtures at once, some of them without loaddata, and tells the
+profile what it did itself.
+"""
+import json
+import os
+import time
+
+from django.core.management.commands import loaddata
+from django.db import DEFAULT_DB_ALIAS
+from django.test.testcases import TransactionTestCase
+
+from django_nose.fixture_tables import fixture_paths
+
+__all__ = ("FixtureProfile", "current_profile")
+
+# The profile being recorded, if any:
+_current = None
+
+
+def current_profile():
+    """Return the ``FixtureProfile`` being recorded, or None."""
+    return _current
+
+
+def _fixture_keys(fixture_labels, using):
+    """Return the names to file what happens to some fixtures under.
+
+    Those are the paths of their files, relative to the current directory, so
+    a fixture is filed under the same name however it's referred to.
+    """
+    keys = []
+    for path in fixture_paths(fixture_labels, using=using):
+        if os.path.isabs(path):
+            path = os.path.relpath(path)
+        keys.append(path)
+    return keys
+
+
+class FixtureProfile(object):
+    """What loading and unloading each fixture cost during a test run."""
+
+    def __init__(self):
+        """Start with nothing recorded."""
+        # Stats by fixture:
+        self.fixtures = {}
+        # TransactionTestCases' flushes of the whole DB:
+        self.flushes = 0
+        self.flush_seconds = 0.0
+
+    def _stats(self, key):
+        if key not in self.fixtures:
+            self.fixtures[key] = {
+                "loads": 0,
+                "load_seconds": 0.0,
+                "rows_loaded": 0,
+                "bundle_hits": 0,
+                "bundle_misses": 0,
+                "unloads": 0,
+                "unload_seconds": 0.0,
+                "rows_unloaded": 0,
+            }
+        return self.fixtures[key]
+
+    def loaded(self, fixture_labels, seconds, rows, using=DEFAULT_DB_ALIAS):
+        """Record loading some fixtures at once.
+
+        There's no telling which fixture took what, so the time and rows are
+        shared out evenly among them.
+        """
+        keys = _fixture_keys(fixture_labels, using)
+        for key in keys:
+            stats = self._stats(key)
+            stats["loads"] += 1
+            stats["load_seconds"] += seconds / len(keys)
+            stats["rows_loaded"] += rows // len(keys)
+
+    def unloaded(self, fixture_labels, seconds, rows, using=DEFAULT_DB_ALIAS):
+        """Record unloading some fixtures at once, sharing out like ``loaded``."""
+        keys = _fixture_keys(fixture_labels, using)
+        for key in keys:
+            stats = self._stats(key)
+            stats["unloads"] += 1
+            stats["unload_seconds"] += seconds / len(keys)
+            stats["rows_unloaded"] += rows // len(keys)
+
+    def bundled(self, fixture_labels, loaded_labels, using=DEFAULT_DB_ALIAS):
+        """Record which fixtures a class wanted, and which it had to load.
+
+        The others were hits: fixture bundling had them loaded already.
+        """
+        loaded_keys = set(_fixture_keys(loaded_labels, using))
+        for key in _fixture_keys(fixture_labels, using):
+            if key in loaded_keys:
+                self._stats(key)["bundle_misses"] += 1
+            else:
+                self._stats(key)["bundle_hits"] += 1
+
+    def start(self):
+        """Start recording, including every loaddata run and flush."""
+        global _current
+
+        profile = self
+        load_label = loaddata.Command.load_label
+        fixture_teardown = TransactionTestCase._fixture_teardown
+
+        def timed_load_label(command, fixture_label):
+            rows_before = command.loaded_object_count
+            start = time.time()
+            try:
+                return load_label(command, fixture_label)
+            finally:
+                if _current is profile:
+                    profile.loaded(
+                        [fixture_label],
+                        time.time() - start,
+                        command.loaded_object_count - rows_before,
+                        using=command.using,
+                    )
+
+        def timed_fixture_teardown(test):
+            start = time.time()
+            try:
+                return fixture_teardown(test)
+            finally:
+                if _current is profile:
+                    profile.flushes += 1
+                    profile.flush_seconds += time.time() - start
+
+        self._originals = (load_label, fixture_teardown)
+        loaddata.Command.load_label = timed_load_label
+        TransactionTestCase._fixture_teardown = timed_fixture_teardown
+        _current = self
+
+    def stop(self):
+        """Stop recording."""
+        global _current
+
+        load_label, fixture_teardown = self._originals
+        loaddata.Command.load_label = load_label
+        TransactionTestCase._fixture_teardown = fixture_teardown
+        _current = None
+
+    def take(self):
+        """Return what was recorded so far, as a dict, and start over.
+
+        ``--parallel`` workers send this back, for ``merge`` in the parent.
+        """
+        taken = self._as_dict()
+        self.fixtures = {}
+        self.flushes = 0
+        self.flush_seconds = 0.0
+        return taken
+
+    def merge(self, taken):
+        """Add what another profile recorded, as ``take`` returned it."""
+        for key, stats in taken["fixtures"].items():
+            mine = self._stats(key)
+            for name, value in stats.items():
+                mine[name] += value
+        self.flushes += taken["flushes"]
+        self.flush_seconds += taken["flush_seconds"]
+
+    def _as_dict(self):
+        return {
+            "fixtures": self.fixtures,
+            "flushes": self.flushes,
+            "flush_seconds": self.flush_seconds,
+        }
+
+    def _total_seconds(self, key):
+        stats = self.fixtures[key]
+        return stats["load_seconds"] + stats["unload_seconds"]
+
+    def summary(self, limit=None):
+        """Return lines summing up the profile, costliest fixtures first."""
+        keys = sorted(self.fixtures, key=self._total_seconds, reverse=True)
+        lines = [
+            "%8s %6s %9s %5s %6s %8s  %s"
+            % ("seconds", "loads", "rows", "hits", "misses", "unloads", "fixture")
+        ]
+        for key in keys[:limit]:
+            stats = self.fixtures[key]
+            lines.append(
+                "%8.3f %6d %9d %5d %6d %8d  %s"
+                % (
+                    self._total_seconds(key),
+                    stats["loads"],
+                    stats["rows_loaded"],
+                    stats["bundle_hits"],
+                    stats["bundle_misses"],
+                    stats["unloads"],
+                    key,
+                )
+            )
+        if self.flushes:
+            lines.append(
+                "%8.3f %d flushes by TransactionTestCases"
+                % (self.flush_seconds, self.flushes)
+            )
+        return lines
+
+    def write(self, path):
+        """Write the profile to a JSON file."""
+        with open(path, "w") as profile_file:
+            json.dump(self._as_dict(), profile_file, indent=2, sort_keys=True)
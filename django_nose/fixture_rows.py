@@ -0,0 +1,99 @@
+# coding: utf-8
+"""Keep track of the rows fixtures add, so as to remove just those afterward.
+
+Emptying every table a fixture touched also throws away rows that were there
+before it, such as the example.com ``Site`` or data put in by migrations, and
+takes longer the bigger the tables are. Instead, we note the primary keys of
+the rows each set of fixtures inserts, and delete exactly those. Rows that
+were there already and that a fixture saved over are left alone.
+"""
+from contextlib import contextmanager
+
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.models.signals import post_save
+
+from django_nose.fixture_tables import dependency_order
+
+__all__ = ("delete_rows", "noting_added_rows", "record_added_rows", "rows_added_by")
+
+# The rows each set of fixtures added, by DB alias and fixture labels: a set
+# of primary keys for each model.
+_added = {}
+
+# How many rows to delete per statement:
+_DELETE_BATCH_SIZE = 500
+
+
+def rows_added_by(fixture_labels, using=DEFAULT_DB_ALIAS):
+    """Return the rows loading some fixtures added, or None if we don't know."""
+    return _added.get((using, tuple(fixture_labels)))
+
+
+def record_added_rows(fixture_labels, added, using=DEFAULT_DB_ALIAS):
+    """Remember the rows loading some fixtures added."""
+    _added[(using, tuple(fixture_labels))] = added
+
+
+@contextmanager
+def noting_added_rows(using=DEFAULT_DB_ALIAS, updated=None):
+    """Note the rows inserted by raw saves, as loaddata does them, into a DB.
+
+    Yield the dict to note them in, which takes the primary keys of the rows
+    of each model. Rows inserted some other way can be noted in it, too. If
+    ``updated``, a dict like that, is given, the rows raw saves wrote over
+    are noted in it.
+    """
+    added = {}
+
+    def note(sender, instance, created, raw, **kwargs):
+        if raw and kwargs.get("using") == using:
+            model = sender._meta.concrete_model
+            if created:
+                added.setdefault(model, set()).add(instance.pk)
+            elif updated is not None:
+                updated.setdefault(model, set()).add(instance.pk)
+
+    post_save.connect(note, weak=False)
+    try:
+        yield added
+    finally:
+        post_save.disconnect(note)
+
+
+def _delete_in_batches(cursor, connection, table, column, values):
+    qn = connection.ops.quote_name
+    for start in range(0, len(values), _DELETE_BATCH_SIZE):
+        batch = values[start : start + _DELETE_BATCH_SIZE]
+        cursor.execute(
+            "DELETE FROM %s WHERE %s IN (%s)"
+            % (qn(table), qn(column), ", ".join(["%s"] * len(batch))),
+            batch,
+        )
+
+
+def delete_rows(rows, using=DEFAULT_DB_ALIAS):
+    """Delete some rows, given as a set of primary keys for each model.
+
+    The rows of the models' many-to-many fields that refer to them go, too.
+    Models are emptied in reverse dependency order, with constraint checks
+    off, so rows referring to each other are no trouble.
+    """
+    connection = connections[using]
+    with connection.constraint_checks_disabled():
+        with connection.cursor() as cursor:
+            for model in reversed(dependency_order(list(rows))):
+                pks = list(rows[model])
+                for field in model._meta.local_many_to_many:
+                    through = field.remote_field.through
+                    if through._meta.auto_created:
+                        source = through._meta.get_field(field.m2m_field_name())
+                        _delete_in_batches(
+                            cursor,
+                            connection,
+                            through._meta.db_table,
+                            source.column,
+                            pks,
+                        )
+                _delete_in_batches(
+                    cursor, connection, model._meta.db_table, model._meta.pk.column, pks
+                )
@@ -0,0 +1,122 @@
+# coding: utf-8
+"""Bring back the state a set of fixtures left the DB in, without reloading.
+
+Fixture bundling saves reloading fixtures only between neighbouring classes
+that share them. When the same fixtures come back later in the run, copying
+back the rows they wrote, from a snapshot taken after the first load, is much
+cheaper than parsing and saving every object again. Snapshots are temporary
+tables, so they belong to the connection that made them and vanish with it.
+"""
+import os
+
+from django.core.management.color import no_style
+from django.db import connections, DEFAULT_DB_ALIAS
+
+from django_nose.fixture_tables import dependency_order
+
+__all__ = (
+    "restore_fixture_snapshot",
+    "save_fixture_snapshot",
+    "snapshotting_fixtures",
+)
+
+# Snapshots by DB alias and fixture labels: the DB-API connection holding
+# them, and the models they're of, each with the table holding its rows.
+_snapshots = {}
+_shadow_count = 0
+
+# How many rows to copy per statement:
+_COPY_BATCH_SIZE = 500
+
+
+def snapshotting_fixtures():
+    """Return whether the ``FIXTURE_SNAPSHOTS`` flag was passed."""
+    return os.getenv("FIXTURE_SNAPSHOTS", "false").lower() in ("true", "1")
+
+
+def _copy_in_batches(cursor, connection, shadow, table, column, values):
+    qn = connection.ops.quote_name
+    for start in range(0, len(values), _COPY_BATCH_SIZE):
+        batch = values[start : start + _COPY_BATCH_SIZE]
+        cursor.execute(
+            "INSERT INTO %s SELECT * FROM %s WHERE %s IN (%s)"
+            % (qn(shadow), qn(table), qn(column), ", ".join(["%s"] * len(batch))),
+            batch,
+        )
+
+
+def save_fixture_snapshot(fixture_labels, rows, using=DEFAULT_DB_ALIAS):
+    """Copy the rows some just-loaded fixtures wrote to temporary tables.
+
+    ``rows`` are the rows they wrote, as a set of primary keys for each model:
+    both those they added and those they saved over, which may have come from
+    fixtures loaded underneath these ones, and have to be written again when
+    the snapshot is restored on top of something else. The rows of those
+    models' many-to-many fields that refer to them are copied, too. Just those
+    rows are copied, rather than whole tables, since other fixtures may be
+    loaded underneath these ones.
+    """
+    global _shadow_count
+
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    shadows = []
+    with connection.cursor() as cursor:
+        for model, pks in rows.items():
+            pks = list(pks)
+            copies = [(model, model._meta.pk.column)]
+            for field in model._meta.local_many_to_many:
+                through = field.remote_field.through
+                if through._meta.auto_created:
+                    source = through._meta.get_field(field.m2m_field_name())
+                    copies.append((through, source.column))
+            for copied_model, column in copies:
+                _shadow_count += 1
+                shadow = "django_nose_snapshot_%d" % _shadow_count
+                table = copied_model._meta.db_table
+                cursor.execute(
+                    "CREATE TEMPORARY TABLE %s AS SELECT * FROM %s WHERE 1 = 0"
+                    % (qn(shadow), qn(table))
+                )
+                _copy_in_batches(cursor, connection, shadow, table, column, pks)
+                shadows.append((copied_model, shadow))
+    _snapshots[(using, tuple(fixture_labels))] = (connection.connection, shadows)
+
+
+def restore_fixture_snapshot(fixture_labels, using=DEFAULT_DB_ALIAS):
+    """Put back the rows some fixtures wrote, and return whether we did.
+
+    Rows with the same primary keys are replaced. If there's no snapshot of
+    these fixtures on the current connection, nothing is done, and False is
+    returned.
+    """
+    connection = connections[using]
+    key = (using, tuple(fixture_labels))
+    snapshot = _snapshots.get(key)
+    if snapshot is None:
+        return False
+    snapshot_connection, shadows = snapshot
+    if connection.connection is not snapshot_connection:
+        # The connection was closed since, and the snapshot went with it.
+        del _snapshots[key]
+        return False
+
+    qn = connection.ops.quote_name
+    shadow_by_model = dict(shadows)
+    models = dependency_order(list(shadow_by_model))
+    with connection.constraint_checks_disabled():
+        with connection.cursor() as cursor:
+            for model in reversed(models):
+                pk = qn(model._meta.pk.column)
+                cursor.execute(
+                    "DELETE FROM %s WHERE %s IN (SELECT %s FROM %s)"
+                    % (qn(model._meta.db_table), pk, pk, qn(shadow_by_model[model]))
+                )
+            for model in models:
+                cursor.execute(
+                    "INSERT INTO %s SELECT * FROM %s"
+                    % (qn(model._meta.db_table), qn(shadow_by_model[model]))
+                )
+            for line in connection.ops.sequence_reset_sql(no_style(), models):
+                cursor.execute(line)
+    return True
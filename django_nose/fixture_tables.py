@@ -7,21 +7,36 @@ can truncate them (and no others) quickly after we're finished with them.
 
 import os
 import gzip
+import io
+import json
+import multiprocessing
+import re
 import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from itertools import product
+from xml.etree import ElementTree
 
 from django.conf import settings
 from django.core import serializers
 from django.db import router, DEFAULT_DB_ALIAS
 
+from django_nose.utils import _atomic_write, cache_dir
+
 try:
-    from django.db.models import get_apps
+    from django.db.models import get_apps, get_model
 except ImportError:
     from django.apps import apps
 
     def get_apps():
         """Emulate get_apps in Django 1.9 and later."""
-        return [a.models_module for a in apps.get_app_configs()]
+        return [
+            a.models_module
+            for a in apps.get_app_configs()
+            if a.models_module is not None
+        ]
+
+    get_model = apps.get_model
 
 
 try:
@@ -32,33 +47,312 @@ except ImportError:
     has_bz2 = False
 
 
-def tables_used_by_fixtures(fixture_labels, using=DEFAULT_DB_ALIAS):
-    """Get tables used by a fixture.
+class SingleZipReader(zipfile.ZipFile):
+    """Zip file holding a single fixture."""
 
-    Acts like Django's stock loaddata command, but, instead of loading data,
-    return an iterable of the names of the tables into which data would be
-    loaded.
+    def __init__(self, *args, **kwargs):
+        """Open the zip file, and make sure it holds only one file."""
+        zipfile.ZipFile.__init__(self, *args, **kwargs)
+        if settings.DEBUG:
+            assert (
+                len(self.namelist()) == 1
+            ), "Zip-compressed fixtures must contain only one file."
+
+    def read(self):
+        """Return the contents of the fixture."""
+        return zipfile.ZipFile.read(self, self.namelist()[0])
+
+
+compression_types = {None: open, "gz": gzip.GzipFile, "zip": SingleZipReader}
+if has_bz2:
+    compression_types["bz2"] = bz2.BZ2File
+
+
+@contextmanager
+def _open_fixture(path, compression_format):
+    """Open a fixture file as a binary stream, uncompressing it if need be."""
+    if compression_format == "zip":
+        with SingleZipReader(path) as archive:
+            with archive.open(archive.namelist()[0]) as fixture:
+                yield fixture
+    else:
+        with compression_types[compression_format](path, "rb") as fixture:
+            yield fixture
+
+
+# The file in the cache directory where the models found in each fixture file
+# are remembered between runs:
+CACHE_NAME = "fixture_tables.json"
+
+# The cache, by fixture path, once read: a dict of the file's size and mtime
+# when it was scanned, and the models found in it.
+_cache = None
+
+
+def _cache_path():
+    directory = cache_dir()
+    return directory and os.path.join(directory, CACHE_NAME)
+
+
+def _load_cache():
+    global _cache
+    if _cache is None:
+        try:
+            with open(_cache_path()) as cache_file:
+                _cache = json.load(cache_file)
+        except (IOError, OSError, TypeError, ValueError):
+            _cache = {}
+    return _cache
+
+
+def _save_cache():
+    cache_path = _cache_path()
+    if not cache_path:
+        return
+    try:
+        _atomic_write(cache_path, lambda cache_file: json.dump(_cache, cache_file))
+    except (IOError, OSError):
+        # It's only a cache.
+        pass
+
+
+# How much of a JSON fixture to read at once:
+_JSON_CHUNK_SIZE = 64 * 1024
+
+# What may come between objects in a JSON fixture:
+_JSON_SEPARATORS = re.compile(r"[\s,]*")
+
+
+def _scan_json(fixture):
+    """Yield the model label of each object in a JSON fixture.
+
+    The fixture is read a chunk at a time, and decoded an object at a time, so
+    memory use is bounded by the size of the largest object.
     """
-    # Keep a count of the installed objects and fixtures
-    fixture_count = 0
-    loaded_object_count = 0
-    fixture_object_count = 0
-    tables = set()
+    text = io.TextIOWrapper(fixture, encoding="utf-8")
+    decoder = json.JSONDecoder()
+    buffer = text.read(_JSON_CHUNK_SIZE).lstrip()
+    if not buffer.startswith("["):
+        raise ValueError("A JSON fixture must hold a list of objects.")
+    position = 1
+    at_end = False
+    while True:
+        position = _JSON_SEPARATORS.match(buffer, position).end()
+        if buffer.startswith("]", position):
+            return
+        try:
+            obj, position = decoder.raw_decode(buffer, position)
+        except ValueError:
+            # The object may be cut off at the end of the chunk we have:
+            if at_end:
+                raise
+            chunk = text.read(_JSON_CHUNK_SIZE)
+            at_end = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield obj["model"]
+
+
+def _scan_yaml(fixture):
+    """Yield the model label of each object in a YAML fixture.
+
+    This walks the parser's events rather than building the documents, keeping
+    track of just enough nesting to spot the ``model`` key of each object.
+    """
+    import yaml
+
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    # For each enclosing collection: whether it's a mapping, and whether the
+    # next node in it is a key.
+    stack = []
+    model_comes_next = False
+    for event in yaml.parse(fixture, Loader=loader):
+        if isinstance(event, yaml.CollectionEndEvent):
+            stack.pop()
+            continue
+        if not isinstance(event, yaml.NodeEvent):
+            continue
+
+        is_key = False
+        if stack and stack[-1][0]:
+            is_key = stack[-1][1]
+            stack[-1][1] = not is_key
+
+        if isinstance(event, yaml.ScalarEvent):
+            if model_comes_next:
+                yield event.value
+            # Objects are mappings in a top-level list:
+            model_comes_next = is_key and len(stack) == 2 and event.value == "model"
+        else:
+            model_comes_next = False
+            if isinstance(event, yaml.MappingStartEvent):
+                stack.append([True, True])
+            elif isinstance(event, yaml.SequenceStartEvent):
+                stack.append([False, False])
+
+
+def _scan_xml(fixture):
+    """Yield the model label of each object in an XML fixture.
+
+    Elements are thrown away as soon as they're parsed, so memory use stays
+    bounded no matter how big the fixture is.
+    """
+    root = None
+    for event, element in ElementTree.iterparse(fixture, events=("start", "end")):
+        if root is None:
+            root = element
+        elif event == "start" and element.tag == "object":
+            # Related objects are <object>s, too, but without a model.
+            model = element.get("model")
+            if model:
+                yield model
+        elif event == "end" and element.tag == "object":
+            root.clear()
+
+
+_scanners = {"json": _scan_json, "yaml": _scan_yaml, "xml": _scan_xml}
+
+
+def _scan_models(fixture, format, using):
+    """Return the labels of the models in an open fixture, in order of appearance.
+
+    The common formats are scanned for model labels without building any model
+    instances. Other formats are deserialized.
+    """
+    scanner = _scanners.get(format)
+    if scanner is not None:
+        labels = (label.lower() for label in scanner(fixture))
+    else:
+        labels = (
+            "%s.%s" % (obj.object._meta.app_label, obj.object._meta.model_name)
+            for obj in serializers.deserialize(format, fixture, using=using)
+        )
+    models = []
+    for label in labels:
+        if label not in models:
+            models.append(label)
+    return models
+
+
+def _cached_models(path, stat):
+    """Return what the cache says a fixture file holds, or None if it can't say."""
+    entry = _load_cache().get(path)
+    if (
+        entry is not None
+        and entry["size"] == stat.st_size
+        and entry["mtime"] == stat.st_mtime
+    ):
+        return entry["models"]
+    return None
+
+
+def _remember_models(path, stat, models):
+    _load_cache()[path] = {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "models": models,
+    }
+
+
+def _scan_file(path, format, compression_format, using=DEFAULT_DB_ALIAS):
+    """Return the labels of the models in a fixture file."""
+    with _open_fixture(path, compression_format) as fixture:
+        return _scan_models(fixture, format, using)
+
+
+def models_in_fixture(path, format, compression_format=None, using=DEFAULT_DB_ALIAS):
+    """Return the labels of the models a fixture file has objects of.
+
+    Reading a big fixture takes a while, so what's found is remembered, both
+    for the rest of this process and, in a cache file, for later runs. An
+    entry is good for as long as the file keeps its size and mtime.
+
+    Raise OSError (or IOError) if there is no such file.
+    """
+    stat = os.stat(path)
+    path = os.path.abspath(path)
+    models = _cached_models(path, stat)
+    if models is None:
+        models = _scan_file(path, format, compression_format, using)
+        _remember_models(path, stat, models)
+        _save_cache()
+    return models
 
-    class SingleZipReader(zipfile.ZipFile):
-        def __init__(self, *args, **kwargs):
-            zipfile.ZipFile.__init__(self, *args, **kwargs)
-            if settings.DEBUG:
-                assert (
-                    len(self.namelist()) == 1
-                ), "Zip-compressed fixtures must contain only one file."
 
-        def read(self):
-            return zipfile.ZipFile.read(self, self.namelist()[0])
+# Scanning fixtures is CPU-bound, so when there's at least this much of them
+# to scan, it's worth sharing them out among processes:
+_PARALLEL_SCAN_MIN_BYTES = 1024 * 1024
 
-    compression_types = {None: open, "gz": gzip.GzipFile, "zip": SingleZipReader}
-    if has_bz2:
-        compression_types["bz2"] = bz2.BZ2File
+
+def _scan_in_parallel(files):
+    """Scan the uncached ones of some fixture files in a pool of processes.
+
+    ``files`` is a list of ``(path, format, compression_format)``. What's found
+    goes into the cache, for ``models_in_fixture`` to find. Only formats we can
+    scan without Django are sent to other processes, and only if there's
+    enough of them to make up for starting the processes. Errors, and files
+    left unscanned because the processes couldn't start, are left for
+    ``models_in_fixture`` to deal with in this process.
+    """
+    if "fork" not in multiprocessing.get_all_start_methods():
+        return
+    if multiprocessing.current_process().daemon:
+        # Workers of --parallel's pool aren't allowed processes of their own.
+        return
+    to_scan = {}
+    for path, format, compression_format in files:
+        if format not in _scanners:
+            continue
+        try:
+            stat = os.stat(path)
+        except (IOError, OSError):
+            continue
+        path = os.path.abspath(path)
+        if _cached_models(path, stat) is None:
+            to_scan[path] = (stat, format, compression_format)
+    if len(to_scan) < 2:
+        return
+    if sum(stat.st_size for stat, _, _ in to_scan.values()) < _PARALLEL_SCAN_MIN_BYTES:
+        return
+
+    context = multiprocessing.get_context("fork")
+    try:
+        with ProcessPoolExecutor(
+            max_workers=min(len(to_scan), os.cpu_count() or 1), mp_context=context
+        ) as executor:
+            futures = dict(
+                (path, executor.submit(_scan_file, path, format, compression_format))
+                for path, (_, format, compression_format) in to_scan.items()
+            )
+            for path, future in futures.items():
+                try:
+                    models = future.result()
+                except Exception:
+                    continue
+                _remember_models(path, to_scan[path][0], models)
+    except (AssertionError, OSError):
+        # The processes couldn't be started.
+        pass
+    _save_cache()
+
+
+def _allow_model(using, model):
+    """Return whether the router lets a model's objects be loaded into a DB."""
+    if hasattr(router, "allow_migrate_model"):
+        # Django 1.8 and later
+        return router.allow_migrate_model(using, model)
+    return router.allow_syncdb(using, model)
+
+
+_app_fixture_dirs_cache = None
+
+
+def _app_fixture_dirs():
+    """Return the fixtures directory of every installed app with models."""
+    global _app_fixture_dirs_cache
+    if _app_fixture_dirs_cache is not None:
+        return _app_fixture_dirs_cache
 
     app_module_paths = []
     for app in get_apps():
@@ -70,102 +364,200 @@ def tables_used_by_fixtures(fixture_labels, using=DEFAULT_DB_ALIAS):
             # It's a models.py module
             app_module_paths.append(app.__file__)
 
-    app_fixtures = [
+    _app_fixture_dirs_cache = [
         os.path.join(os.path.dirname(path), "fixtures") for path in app_module_paths
     ]
-    for fixture_label in fixture_labels:
-        parts = fixture_label.split(".")
+    return _app_fixture_dirs_cache
+
+
+# The index: the files in each directory fixtures were looked for in, and the
+# files each fixture label was resolved to, by label, DB, and fixture dirs.
+_listings = {}
+_resolved = {}
 
-        if len(parts) > 1 and parts[-1] in compression_types:
-            compression_formats = [parts[-1]]
-            parts = parts[:-1]
+
+def _listing(directory):
+    """Return the names of the files in a directory, listing it only once."""
+    if directory not in _listings:
+        try:
+            _listings[directory] = frozenset(os.listdir(directory or os.curdir))
+        except (IOError, OSError):
+            _listings[directory] = frozenset()
+    return _listings[directory]
+
+
+def _exists(path):
+    """Return whether a file exists, according to the index."""
+    directory, file_name = os.path.split(path)
+    return file_name in _listing(directory)
+
+
+def find_fixture_files(fixture_label, using=DEFAULT_DB_ALIAS):
+    """Return the files a fixture label refers to, like loaddata would find them.
+
+    The result is a list of ``(path, format, compression_format)``, with at most
+    one file per fixture directory, or None if the label is no good: it names
+    an unknown format, or more than one file in a directory.
+
+    Rather than trying to open every combination of directory, DB, format, and
+    compression, this looks names up in a listing of each directory, made the
+    first time it's needed. What each label resolves to is remembered, too, so
+    finding the tables of a fixture and loading it share the work.
+    """
+    fixture_dirs = tuple(_app_fixture_dirs()) + tuple(settings.FIXTURE_DIRS)
+    key = (fixture_label, using, fixture_dirs)
+    if key not in _resolved:
+        _resolved[key] = _find_fixture_files(fixture_label, using, fixture_dirs)
+    return _resolved[key]
+
+
+def _find_fixture_files(fixture_label, using, fixture_dirs):
+    parts = fixture_label.split(".")
+
+    if len(parts) > 1 and parts[-1] in compression_types:
+        compression_formats = [parts[-1]]
+        parts = parts[:-1]
+    else:
+        compression_formats = list(compression_types.keys())
+
+    if len(parts) == 1:
+        fixture_name = parts[0]
+        formats = serializers.get_public_serializer_formats()
+    else:
+        fixture_name, format = ".".join(parts[:-1]), parts[-1]
+        if format in serializers.get_public_serializer_formats():
+            formats = [format]
         else:
-            compression_formats = list(compression_types.keys())
+            formats = []
+
+    if not formats:
+        # stderr.write(style.ERROR("Problem installing fixture '%s': %s is
+        # not a known serialization format.\n" % (fixture_name, format)))
+        return None
+
+    if os.path.isabs(fixture_name):
+        fixture_dirs = [os.path.dirname(fixture_name)]
+        fixture_name = os.path.basename(fixture_name)
+    else:
+        fixture_dirs = list(fixture_dirs) + [""]
 
-        if len(parts) == 1:
-            fixture_name = parts[0]
-            formats = serializers.get_public_serializer_formats()
+    files = []
+    for fixture_dir in fixture_dirs:
+        # stdout.write("Checking %s for fixtures...\n" %
+        # humanize(fixture_dir))
+
+        label_found = False
+        for combo in product([using, None], formats, compression_formats):
+            database, format, compression_format = combo
+            file_name = ".".join(
+                p for p in [fixture_name, database, format, compression_format] if p
+            )
+
+            # stdout.write("Trying %s for %s fixture '%s'...\n" % \
+            # (humanize(fixture_dir), file_name, fixture_name))
+            full_path = os.path.join(fixture_dir, file_name)
+            if not _exists(full_path):
+                # stdout.write("No %s fixture '%s' in %s.\n" % \ (format,
+                # fixture_name, humanize(fixture_dir)))
+                continue
+            if label_found:
+                # stderr.write(style.ERROR("Multiple fixtures named
+                # '%s' in %s. Aborting.\n" % (fixture_name,
+                # humanize(fixture_dir))))
+                return None
+            label_found = True
+            files.append((full_path, format, compression_format))
+    return files
+
+
+def fixture_paths(fixture_labels, using=DEFAULT_DB_ALIAS):
+    """Return the paths of the files to hand loaddata for some fixture labels.
+
+    This spares loaddata from searching for the files itself. Labels that
+    don't resolve to any files are passed through as they are, so loaddata
+    can complain about them.
+    """
+    paths = []
+    for fixture_label in fixture_labels:
+        files = find_fixture_files(fixture_label, using)
+        if files:
+            paths.extend(os.path.abspath(path) for path, _, _ in files)
         else:
-            fixture_name, format = ".".join(parts[:-1]), parts[-1]
-            if format in serializers.get_public_serializer_formats():
-                formats = [format]
-            else:
-                formats = []
-
-        if not formats:
-            # stderr.write(style.ERROR("Problem installing fixture '%s': %s is
-            # not a known serialization format.\n" % (fixture_name, format)))
+            paths.append(fixture_label)
+    return paths
+
+
+def tables_used_by_fixtures(fixture_labels, using=DEFAULT_DB_ALIAS):
+    """Get tables used by a fixture.
+
+    Acts like Django's stock loaddata command, but, instead of loading data,
+    return an iterable of the names of the tables into which data would be
+    loaded.
+    """
+    files_by_label = []
+    for fixture_label in fixture_labels:
+        files = find_fixture_files(fixture_label, using)
+        if files is None:
             return set()
+        files_by_label.append(files)
+    _scan_in_parallel([f for files in files_by_label for f in files])
 
-        if os.path.isabs(fixture_name):
-            fixture_dirs = [fixture_name]
-        else:
-            fixture_dirs = app_fixtures + list(settings.FIXTURE_DIRS) + [""]
-
-        for fixture_dir in fixture_dirs:
-            # stdout.write("Checking %s for fixtures...\n" %
-            # humanize(fixture_dir))
-
-            label_found = False
-            for combo in product([using, None], formats, compression_formats):
-                database, format, compression_format = combo
-                file_name = ".".join(
-                    p for p in [fixture_name, database, format, compression_format] if p
-                )
-
-                # stdout.write("Trying %s for %s fixture '%s'...\n" % \
-                # (humanize(fixture_dir), file_name, fixture_name))
-                full_path = os.path.join(fixture_dir, file_name)
-                open_method = compression_types[compression_format]
-                try:
-                    fixture = open_method(full_path, "r")
-                    if label_found:
-                        fixture.close()
-                        # stderr.write(style.ERROR("Multiple fixtures named
-                        # '%s' in %s. Aborting.\n" % (fixture_name,
-                        # humanize(fixture_dir))))
-                        return set()
-                    else:
-                        fixture_count += 1
-                        objects_in_fixture = 0
-                        loaded_objects_in_fixture = 0
-                        # stdout.write("Installing %s fixture '%s' from %s.\n"
-                        # % (format, fixture_name, humanize(fixture_dir)))
-                        try:
-                            objects = serializers.deserialize(
-                                format, fixture, using=using
-                            )
-                            for obj in objects:
-                                objects_in_fixture += 1
-                                cls = obj.object.__class__
-                                if router.allow_syncdb(using, cls):
-                                    loaded_objects_in_fixture += 1
-                                    tables.add(cls._meta.db_table)
-                            loaded_object_count += loaded_objects_in_fixture
-                            fixture_object_count += objects_in_fixture
-                            label_found = True
-                        except (SystemExit, KeyboardInterrupt):
-                            raise
-                        except Exception:
-                            fixture.close()
-                            # stderr.write( style.ERROR("Problem installing
-                            # fixture '%s': %s\n" % (full_path, ''.join(tra
-                            # ceback.format_exception(sys.exc_type,
-                            # sys.exc_value, sys.exc_traceback)))))
-                            return set()
-                        fixture.close()
-
-                        # If the fixture we loaded contains 0 objects, assume
-                        # that an error was encountered during fixture loading.
-                        if objects_in_fixture == 0:
-                            # stderr.write( style.ERROR("No fixture data found
-                            # for '%s'. (File format may be invalid.)\n" %
-                            # (fixture_name)))
-                            return set()
+    tables = set()
+    for files in files_by_label:
+        for full_path, format, compression_format in files:
+            # stdout.write("Installing %s fixture '%s' from %s.\n"
+            # % (format, fixture_name, humanize(fixture_dir)))
+            try:
+                models = [
+                    get_model(*label.split("."))
+                    for label in models_in_fixture(
+                        full_path, format, compression_format, using
+                    )
+                ]
+            except (SystemExit, KeyboardInterrupt):
+                raise
+            except Exception:
+                # stderr.write( style.ERROR("Problem installing
+                # fixture '%s': %s\n" % (full_path, ''.join(tra
+                # ceback.format_exception(sys.exc_type,
+                # sys.exc_value, sys.exc_traceback)))))
+                return set()
 
-                except Exception:
-                    # stdout.write("No %s fixture '%s' in %s.\n" % \ (format,
-                    # fixture_name, humanize(fixture_dir)))
-                    pass
+            # If the fixture contains 0 objects, assume that an error was
+            # encountered during fixture loading.
+            if not models:
+                # stderr.write( style.ERROR("No fixture data found
+                # for '%s'. (File format may be invalid.)\n" %
+                # (fixture_name)))
+                return set()
+
+            for model in models:
+                if _allow_model(using, model):
+                    tables.add(model._meta.db_table)
 
     return tables
+
+
+def dependency_order(models):
+    """Return models ordered so that each comes after those its FKs point to.
+
+    Models in a cycle keep the order they came in; constraint checks are off
+    while fixtures load, so that's all right.
+    """
+    ordered = []
+    visiting = set()
+
+    def visit(model):
+        if model in ordered or model in visiting:
+            return
+        visiting.add(model)
+        for field in model._meta.local_concrete_fields:
+            target = getattr(field.remote_field, "model", None)
+            if target is not None and target._meta.concrete_model in models:
+                visit(target._meta.concrete_model)
+        visiting.discard(model)
+        ordered.append(model)
+
+    for model in models:
+        visit(model)
+    return ordered
@@ -0,0 +1,41 @@
+# coding: utf-8
+"""Remember things about tests from one run to the next."""
+import json
+
+from django_nose.utils import _atomic_write
+
+__all__ = ("context_name", "read_history", "write_history")
+
+
+def context_name(context):
+    """Return a name for a test class or module that lasts between runs.
+
+    Return None for anything else.
+    """
+    if isinstance(context, type):
+        return "%s.%s" % (context.__module__, context.__qualname__)
+    return getattr(context, "__name__", None)
+
+
+def read_history(path):
+    """Return the dict kept in a history file, or {} if there isn't one."""
+    try:
+        with open(path) as history_file:
+            history = json.load(history_file)
+    except (IOError, OSError, ValueError):
+        return {}
+    return history if isinstance(history, dict) else {}
+
+
+def write_history(path, history):
+    """Replace the dict kept in a history file."""
+    try:
+        _atomic_write(
+            path,
+            lambda history_file: json.dump(
+                history, history_file, indent=0, sort_keys=True
+            ),
+        )
+    except (IOError, OSError):
+        # It's only history.
+        pass
@@ -0,0 +1,192 @@
+# coding: utf-8
+"""Find out which source files each test class runs, to run only those hit.
+
+While recording, every Python function that starts running is noted, by the
+file it's in, against each test class and module that's running. On Python
+3.12 and later, that's done with ``sys.monitoring``, which stops reporting a
+function once it's been noted, until the next class starts; before that, a
+profile function sees every call. Only files in the project count: those
+under the root of its git checkout, or else the current directory.
+
+Code that runs only when a module is imported, like that of models and
+constants, has usually run before any test does, so it's found another way:
+by following the project modules a test module refers to.
+"""
+import os
+import subprocess
+import sys
+import types
+
+__all__ = ("FileRecorder", "changed_files", "check_ref", "project_root")
+
+# The sys.monitoring tool ids nobody has claimed:
+_FREE_TOOL_IDS = (3, 4)
+
+
+def _source(filename):
+    """Return the source file a module was loaded from."""
+    if filename.endswith((".pyc", ".pyo")):
+        return filename[:-1]
+    return filename
+
+
+def _git(*args):
+    """Return the lines git prints for a command, or raise ValueError."""
+    try:
+        output = subprocess.check_output(
+            ("git",) + args, stderr=subprocess.STDOUT, universal_newlines=True
+        )
+    except (OSError, subprocess.CalledProcessError) as exc:
+        raise ValueError(
+            "git %s failed: %s" % (" ".join(args), getattr(exc, "output", None) or exc)
+        )
+    return output.splitlines()
+
+
+def project_root():
+    """Return the root of the project's git checkout, or the current dir."""
+    try:
+        return _git("rev-parse", "--show-toplevel")[0]
+    except (ValueError, IndexError):
+        return os.getcwd()
+
+
+def check_ref(ref):
+    """Raise ValueError unless git knows ``ref`` as a commit."""
+    _git("-C", project_root(), "rev-parse", "--verify", "--quiet", ref + "^{commit}")
+
+
+def changed_files(ref):
+    """Return the paths, relative to the project root, changed since ``ref``.
+
+    That includes changes not committed yet, and files git doesn't track.
+    """
+    root = project_root()
+    changed = set(_git("-C", root, "diff", "--name-only", ref, "--"))
+    changed.update(_git("-C", root, "ls-files", "--others", "--exclude-standard"))
+    return changed
+
+
+class FileRecorder(object):
+    """Note the project files that run while each of some contexts is open."""
+
+    def __init__(self, root=None, ignore=()):
+        """Get ready to record files under ``root``.
+
+        The files in ``ignore``, such as those of whatever opens and closes
+        the contexts, aren't noted, and neither is this one.
+        """
+        self.root = os.path.realpath(root or project_root())
+        # Files by context, for the ones open now:
+        self.open = {}
+        self._relpaths = {}
+        self._ignored = set(
+            os.path.realpath(_source(filename)) for filename in (__file__,) + ignore
+        )
+        self._tool_id = None
+        self._old_profile = None
+
+    def relpath(self, filename):
+        """Return a project file's path relative to the root, or None."""
+        if filename not in self._relpaths:
+            relpath = None
+            realpath = os.path.realpath(filename)
+            if not filename.startswith("<") and realpath not in self._ignored:
+                path = os.path.relpath(realpath, self.root)
+                if not path.startswith(os.pardir) and "site-packages" not in path:
+                    relpath = path.replace(os.sep, "/")
+            self._relpaths[filename] = relpath
+        return self._relpaths[filename]
+
+    def _note(self, filename):
+        relpath = self.relpath(filename)
+        if relpath is not None:
+            for files in self.open.values():
+                files.add(relpath)
+
+    def start(self):
+        """Start noting which files run."""
+        monitoring = getattr(sys, "monitoring", None)
+        if monitoring is not None:
+            for tool_id in _FREE_TOOL_IDS:
+                try:
+                    monitoring.use_tool_id(tool_id, "django-nose")
+                except ValueError:
+                    continue
+                self._tool_id = tool_id
+                break
+        if self._tool_id is not None:
+
+            def py_start(code, instruction_offset):
+                self._note(code.co_filename)
+                return monitoring.DISABLE
+
+            monitoring.register_callback(
+                self._tool_id, monitoring.events.PY_START, py_start
+            )
+            monitoring.set_events(self._tool_id, monitoring.events.PY_START)
+        else:
+
+            def profile(frame, event, arg):
+                if event == "call":
+                    self._note(frame.f_code.co_filename)
+
+            self._old_profile = sys.getprofile()
+            sys.setprofile(profile)
+
+    def stop(self):
+        """Stop noting which files run."""
+        if self._tool_id is not None:
+            monitoring = sys.monitoring
+            monitoring.set_events(self._tool_id, 0)
+            monitoring.register_callback(
+                self._tool_id, monitoring.events.PY_START, None
+            )
+            monitoring.free_tool_id(self._tool_id)
+            self._tool_id = None
+        else:
+            sys.setprofile(self._old_profile)
+
+    def open_context(self, name):
+        """Start noting files against a context."""
+        self.open[name] = set()
+        if self._tool_id is not None:
+            # Report the functions noted for earlier contexts again. This
+            # re-enables what every tool disabled, not just us, but any tool
+            # may call it, so the others have to cope already: at worst, they
+            # hear of each function once more, and disable it again.
+            sys.monitoring.restart_events()
+
+    def close_context(self, name):
+        """Stop noting files against a context, and return the ones noted."""
+        return self.open.pop(name, set())
+
+    def module_files(self, module):
+        """Return the project files of a module and of those it refers to.
+
+        The modules a module's globals are, or were defined in, are followed
+        as far as they're in the project, however they were imported.
+        """
+        files = set()
+        seen = set([id(module)])
+        modules = [module]
+        while modules:
+            module = modules.pop()
+            filename = getattr(module, "__file__", None)
+            relpath = filename and self.relpath(_source(filename))
+            if relpath is None:
+                continue
+            files.add(relpath)
+            for value in list(vars(module).values()):
+                if isinstance(value, types.ModuleType):
+                    referred = value
+                else:
+                    try:
+                        referred = sys.modules.get(getattr(value, "__module__", None))
+                    except Exception:
+                        # Lazy objects may do anything when asked.
+                        continue
+                if referred is not None and id(referred) not in seen:
+                    seen.add(id(referred))
+                    modules.append(referred)
+        return files
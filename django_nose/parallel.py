@@ -0,0 +1,304 @@
+# coding: utf-8
+"""Run tests in several processes, each with its own copy of the test DBs.
+
+Django's own parallel runner wants flat, picklable suites of TestCases. nose
+hands us a tree of lazily-built ContextSuites instead, so we fork workers that
+inherit the already-prepared suite, tell them only which chunk of it to run,
+and replay what happened into the real result in the parent process.
+
+Plugins hear of the classes and modules a worker runs only in the worker, in
+their copy there. A plugin that keeps something about them can have it sent
+back by having a ``workerReport()`` method, which returns what it kept since
+it was last called, picklably, and a ``mergeWorkerReport(report)`` method,
+which the parent process calls with it after each chunk.
+"""
+import multiprocessing
+import pickle
+import unittest
+
+from nose.proxy import ResultProxy
+
+from django.db import connections
+
+__all__ = ("ParallelSuite", "partition_suite")
+
+
+def partition_suite(suite):
+    """Split a flattened suite into chunks that must run in the same process.
+
+    Each top-level test of ``suite`` (a ContextSuite per class or module, as
+    laid out by ``TestReorderer``) keeps its own setup and teardown, so it can
+    run anywhere. The only exception is a fixture bundle: a class advised to
+    leave some of its fixtures loaded leaves them for the next one, so the two
+    have to stay together, in order.
+    """
+    chunks = []
+    keep_with_previous = False
+    for test in suite:
+        if keep_with_previous:
+            chunks[-1].append(test)
+        else:
+            chunks.append([test])
+        context = getattr(test, "context", None)
+        keep_with_previous = getattr(
+            context,
+            "_fb_leaves_fixtures",
+            getattr(context, "_fb_should_teardown_fixtures", True) is False,
+        )
+    return chunks
+
+
+class RemoteError(Exception):
+    """Stand-in for an exception raised in a worker process.
+
+    Tracebacks can't be pickled, so the worker formats them, and we show the
+    text in place of the original exception's message.
+    """
+
+    def __str__(self):
+        """Return the traceback from the worker."""
+        return "raised in a worker process\n" + self.args[0]
+
+
+class RemoteTest(object):
+    """Stand-in for a test that ran in a worker process.
+
+    It carries just enough to print the test's outcome and to tell it apart
+    from other tests afterward.
+    """
+
+    failureException = unittest.TestCase.failureException
+
+    def __init__(self, name, test_id, description):
+        """Remember how the test described itself."""
+        self.name = name
+        self.test_id = test_id
+        self.description = description
+
+    def __str__(self):
+        """Return the test's name."""
+        return self.name
+
+    def id(self):
+        """Return the test's id."""
+        return self.test_id
+
+    def shortDescription(self):
+        """Return the first line of the test's docstring."""
+        return self.description
+
+
+def _describe(test):
+    """Return what we need to build a ``RemoteTest`` for ``test``."""
+    test_id = test.id() if hasattr(test, "id") else str(test)
+    description = None
+    if hasattr(test, "shortDescription"):
+        description = test.shortDescription()
+    return (str(test), test_id, description)
+
+
+def _picklable_type(exc_type):
+    """Return ``exc_type`` if it survives pickling, or ``Exception``."""
+    try:
+        pickle.dumps(exc_type)
+    except Exception:
+        return Exception
+    return exc_type
+
+
+class WorkerResult(unittest.TestResult):
+    """Test result that records events for replay in the parent process."""
+
+    def __init__(self):
+        """Start with no events."""
+        super(WorkerResult, self).__init__()
+        self.events = []
+        # nose's error class plugins (Skip, Deprecated) patch their own
+        # addError and addSkip into any result without this. We want the raw
+        # events; the result in the parent process sorts them out.
+        self.errorClasses = {}
+
+    def _record(self, name, test, *args):
+        self.events.append((name, _describe(test), args))
+
+    def _record_err(self, name, test, err):
+        exc_type = _picklable_type(err[0])
+        self._record(name, test, exc_type, self._exc_info_to_string(err, test))
+
+    def startTest(self, test):
+        """Record the start of a test."""
+        super(WorkerResult, self).startTest(test)
+        self._record("startTest", test)
+
+    def stopTest(self, test):
+        """Record the end of a test."""
+        super(WorkerResult, self).stopTest(test)
+        self._record("stopTest", test)
+
+    def addSuccess(self, test):
+        """Record a passing test."""
+        self._record("addSuccess", test)
+
+    def addError(self, test, err):
+        """Record a test that raised an exception."""
+        super(WorkerResult, self).addError(test, err)
+        self._record_err("addError", test, err)
+
+    def addFailure(self, test, err):
+        """Record a failing test."""
+        super(WorkerResult, self).addFailure(test, err)
+        self._record_err("addFailure", test, err)
+
+    def addSkip(self, test, reason):
+        """Record a skipped test."""
+        self._record("addSkip", test, str(reason))
+
+    def addExpectedFailure(self, test, err):
+        """Record a test that failed as expected."""
+        self._record_err("addExpectedFailure", test, err)
+
+    def addUnexpectedSuccess(self, test):
+        """Record a test that passed but was expected to fail."""
+        self._record("addUnexpectedSuccess", test)
+
+
+# The chunks of tests being run, and the plugins hearing of them. Workers are
+# forked after these are set, so they find the tests here and need to be sent
+# only the index of a chunk.
+_chunks = []
+_plugins = []
+_worker_id = 0
+
+
+def _init_worker(counter):
+    """Point this worker's connections at its own clones of the test DBs.
+
+    The clones were made by ``setup_databases`` and are named with a numeric
+    suffix, just like the ones Django's own parallel runner uses.
+    """
+    global _worker_id
+
+    with counter.get_lock():
+        counter.value += 1
+        _worker_id = counter.value
+
+    for alias in connections:
+        connection = connections[alias]
+        clone_settings = connection.creation.get_test_db_clone_settings(
+            str(_worker_id)
+        )
+        connection.settings_dict.update(clone_settings)
+        connection.close()
+
+
+def _worker_reports():
+    """Return what the plugins that report from workers kept, by plugin name."""
+    return dict(
+        (plugin.name, plugin.workerReport())
+        for plugin in _plugins
+        if hasattr(plugin, "workerReport")
+    )
+
+
+def _run_chunk(index):
+    """Run a chunk of tests, and return the events and plugin reports for it."""
+    result = WorkerResult()
+    for test in _chunks[index]:
+        if result.shouldStop:
+            break
+        test(result)
+    return index, result.events, _worker_reports(), result.shouldStop
+
+
+class ParallelSuite(object):
+    """Run the chunks of a suite in a pool of worker processes."""
+
+    def __init__(self, suite, processes, config):
+        """Split up the suite, and note how many processes to use."""
+        self.chunks = partition_suite(suite)
+        self.processes = min(processes, len(self.chunks))
+        self.config = config
+
+    def __call__(self, result):
+        """Run the tests, like a suite does when called."""
+        return self.run(result)
+
+    def run(self, result):
+        """Run the chunks in workers, replaying the results into ``result``.
+
+        Workers are forked, so each inherits the prepared tests and the state
+        of Django. Chunks are handed out in order, one at a time, so every
+        worker runs its share in the order ``TestReorderer`` chose.
+        """
+        global _chunks, _plugins
+
+        if not self.chunks:
+            return result
+
+        # Give plugins the chance to set up the result that nose would
+        # otherwise give them when the first suite runs, so that skips and
+        # other special errors are reported properly:
+        plug_result = self.config.plugins.prepareTestResult(result)
+        if plug_result is not None:
+            result = plug_result
+
+        _chunks = self.chunks
+        _plugins = list(getattr(self.config.plugins, "plugins", ()))
+        # Forked children mustn't share open DB sockets with us:
+        for connection in connections.all():
+            connection.close()
+
+        context = multiprocessing.get_context("fork")
+        counter = context.Value("i", 0)
+        pool = context.Pool(
+            processes=self.processes, initializer=_init_worker, initargs=[counter]
+        )
+        try:
+            outcomes = pool.imap_unordered(_run_chunk, range(len(self.chunks)))
+            for index, events, reports, should_stop in outcomes:
+                self._replay(events, result)
+                self._merge_reports(reports)
+                if should_stop or result.shouldStop:
+                    result.shouldStop = True
+                    pool.terminate()
+                    break
+            else:
+                pool.close()
+        finally:
+            pool.join()
+            _chunks = []
+            _plugins = []
+        return result
+
+    def _merge_reports(self, reports):
+        """Hand plugins what their copies in a worker kept."""
+        for plugin in getattr(self.config.plugins, "plugins", ()):
+            if plugin.name in reports and hasattr(plugin, "mergeWorkerReport"):
+                plugin.mergeWorkerReport(reports[plugin.name])
+
+    def _replay(self, events, result):
+        """Report the events a worker recorded to ``result``.
+
+        Each goes through a nose result proxy, as it would have in a serial
+        run, so plugins hear of it, too. The proxy stands for nose's
+        ``beforeTest`` and ``afterTest`` around starting and stopping a test.
+        """
+        proxies = {}
+        for name, description, args in events:
+            proxy = proxies.get(description)
+            if proxy is None:
+                proxy = proxies[description] = ResultProxy(
+                    result, RemoteTest(*description), config=self.config
+                )
+            test = proxy.test
+            if name in ("addError", "addFailure", "addExpectedFailure"):
+                exc_type, traceback = args
+                args = ((exc_type, RemoteError(traceback), None),)
+            if name == "startTest":
+                proxy.beforeTest(test)
+            # The proxy lacks the rarer events; those go straight to the result:
+            handler = getattr(proxy, name, None) or getattr(result, name, None)
+            if handler is not None:
+                handler(test, *args)
+            if name == "stopTest":
+                proxy.afterTest(test)
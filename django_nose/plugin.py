@@ -1,12 +1,20 @@
 # coding: utf-8
 """Included django-nose plugins."""
+import os
 import sys
+import time
 
 from nose.plugins.base import Plugin
 from nose.suite import ContextSuite
 
 from django.test.testcases import TransactionTestCase, TestCase
 
+from django_nose.fixture_profile import FixtureProfile
+from django_nose.fixture_tables import find_fixture_files, fixture_paths
+from django_nose import history, parallel
+from django_nose.history import context_name, read_history, write_history
+from django_nose.impact import FileRecorder, changed_files, check_ref
+from django_nose.parallel import ParallelSuite
 from django_nose.testcases import FastFixtureTestCase
 from django_nose.utils import process_tests, is_subclass_at_all
 
@@ -28,19 +36,114 @@ class AlwaysOnPlugin(Plugin):
         self.enabled = True
 
 
+def _test_name(test):
+    """Return a name for a test, or for the class or module it failed to set up.
+
+    Tests run by ``--parallel`` worker processes have only their ids to go by.
+    """
+    if isinstance(test, ContextSuite):
+        name = context_name(test.context)
+        if name is not None:
+            return name
+    return test.id() if hasattr(test, "id") else str(test)
+
+
+def _name_prefixes(names):
+    """Return the dotted names, and every leading part of them."""
+    prefixes = set()
+    for name in names:
+        parts = name.split(".")
+        for length in range(1, len(parts) + 1):
+            prefixes.add(".".join(parts[:length]))
+    return prefixes
+
+
+def _parse_shard(value):
+    """Return the 0-based index and count of shards ``--shard`` asks for."""
+    try:
+        index, count = [int(part) for part in value.split("/")]
+    except ValueError:
+        index = count = 0
+    if not 1 <= index <= count:
+        raise ValueError("--shard takes i/N, with i from 1 to N, not %r." % (value,))
+    return index - 1, count
+
+
+def _may_exist(name):
+    """Return whether a test could still exist, as far as we can tell cheaply.
+
+    Only modules loaded already are looked in: if the module a test's name
+    starts with is loaded but lacks the rest, the test is gone.
+    """
+    parts = name.split("(")[0].split(".")
+    for length in range(len(parts), 0, -1):
+        obj = sys.modules.get(".".join(parts[:length]))
+        if obj is not None:
+            for part in parts[length:]:
+                obj = getattr(obj, part, None)
+                if obj is None:
+                    return False
+            return True
+    return True
+
+
 class ResultPlugin(AlwaysOnPlugin):
     """Captures the TestResult object for later inspection.
 
     nose doesn't return the full test result object from any of its runner
     methods.  Pass an instance of this plugin to the TestProgram and use
     ``result`` after running the tests to get the TestResult object.
+
+    With ``--failed-first``, the failures and errors are also kept in a
+    cache file, to go by in the next run.
     """
 
     name = "result"
 
+    def configure(self, options, conf):
+        """Configure plugin, reading the failed_first options."""
+        super(ResultPlugin, self).configure(options, conf)
+        self.failure_cache_file = None
+        if getattr(options, "failed_first", False):
+            self.failure_cache_file = options.failure_cache_file
+        self.ran = set()
+
+    def startTest(self, test):
+        """Note that a test ran, so its old failure can be forgotten."""
+        self.ran.add(_test_name(test))
+
     def finalize(self, result):
         """Finalize test run by capturing the result."""
         self.result = result
+        if getattr(self, "failure_cache_file", None):
+            self._cache_failures(result)
+
+    def _cache_failures(self, result):
+        """Replace the cached failures of the tests that ran with this run's.
+
+        Failures of tests that didn't run this time are kept, unless the tests
+        are gone. Once there are none left, the cache is removed, so green runs
+        don't leave one behind.
+        """
+        old = read_history(self.failure_cache_file)
+        ran = _name_prefixes(self.ran)
+        failures = dict(
+            (name, kind)
+            for name, kind in old.items()
+            if name not in ran and _may_exist(name)
+        )
+        for kind, outcomes in (("error", result.errors), ("failure", result.failures)):
+            for test, _ in outcomes:
+                failures[_test_name(test)] = kind
+        if failures == old:
+            return
+        if failures:
+            write_history(self.failure_cache_file, failures)
+        else:
+            try:
+                os.remove(self.failure_cache_file)
+            except OSError:
+                pass
 
 
 class DjangoSetUpPlugin(AlwaysOnPlugin):
@@ -118,6 +221,156 @@ class Bucketer(object):
             self.remainder.append(test)
 
 
+def _containment_order(fixture_sets):
+    """Return sets of fixtures in a depth-first walk of their containment tree.
+
+    The parent of each set is the biggest of the others it contains, the first
+    of them in case of a tie. Sets that contain none of the others are roots,
+    taken in the order they came in, as are the children of each set.
+    """
+    children = dict((fixtures, []) for fixtures in fixture_sets)
+    roots = []
+    for fixtures in fixture_sets:
+        subsets = [other for other in fixture_sets if other < fixtures]
+        if subsets:
+            children[max(subsets, key=len)].append(fixtures)
+        else:
+            roots.append(fixtures)
+
+    order = []
+    to_visit = list(reversed(roots))
+    while to_visit:
+        fixtures = to_visit.pop()
+        order.append(fixtures)
+        to_visit.extend(reversed(children[fixtures]))
+    return order
+
+
+def _fixture_size(fixture_label):
+    """Return how big the files a fixture label refers to are, at least 1."""
+    files = find_fixture_files(fixture_label) or []
+    size = 0
+    for path, _, _ in files:
+        try:
+            size += os.path.getsize(path)
+        except OSError:
+            pass
+    return max(size, 1)
+
+
+def _transition(loaded, fixtures):
+    """Return what going from some loaded fixtures to a set of them takes.
+
+    ``loaded`` is a stack of groups of fixtures, as in
+    ``_advise_fixture_loading``. Return the groups to unload, most recent
+    first, until what's left is all in ``fixtures``, and the fixtures that
+    then need loading.
+    """
+    loaded = list(loaded)
+    to_tear_down = []
+    while loaded and not fixtures.issuperset(
+        label for group in loaded for label in group
+    ):
+        to_tear_down.append(loaded.pop())
+    present = set(label for group in loaded for label in group)
+    return to_tear_down, [label for label in fixtures if label not in present]
+
+
+def _nearest_order(fixture_sets):
+    """Return sets of fixtures in an order that loads and unloads little.
+
+    Starting with nothing loaded, this repeatedly picks the set that's
+    cheapest to go to next, the first of them in case of a tie. The cost of
+    going from one set to another is the size of the fixture files unloaded
+    and loaded on the way, with fixtures loaded in groups as
+    ``_advise_fixture_loading`` does.
+    """
+    sizes = {}
+    for fixtures in fixture_sets:
+        for label in fixtures:
+            if label not in sizes:
+                sizes[label] = _fixture_size(label)
+
+    remaining = list(fixture_sets)
+    order = []
+    loaded = []
+    while remaining:
+        best = None
+        for i, fixtures in enumerate(remaining):
+            to_tear_down, to_set_up = _transition(loaded, fixtures)
+            cost = sum(sizes[label] for group in to_tear_down for label in group)
+            cost += sum(sizes[label] for label in to_set_up)
+            if best is None or cost < best[0]:
+                best = (cost, i, len(to_tear_down), to_set_up)
+        _, i, popped, to_set_up = best
+        order.append(remaining.pop(i))
+        loaded = loaded[: len(loaded) - popped]
+        if to_set_up:
+            loaded.append(to_set_up)
+    return order
+
+
+# The ways fixture bundles can be ordered, by --fixture-bundling-strategy:
+_bundle_orders = {"containment": _containment_order, "nearest": _nearest_order}
+
+
+def _advise_fixture_loading(bundles):
+    """Advise test classes which fixtures to set up and tear down.
+
+    ``bundles`` is a list of ``(fixtures, [ContextSuite, ...], is_exempt)`` in
+    the order they'll run. The fixtures loaded at any point are a stack of
+    groups. The first class of a bundle loads, as one group, those of its
+    fixtures that aren't loaded already. The last class unloads groups, most
+    recent first, until what's left is all wanted by the next bundle. Exempt
+    bundles want nothing left for them, and leave nothing behind.
+
+    Each class gets these attrs:
+
+    * ``_fb_should_setup_fixtures`` and ``_fb_fixtures_to_set_up``: whether
+      to load fixtures, and which
+    * ``_fb_should_teardown_fixtures`` and
+      ``_fb_fixture_groups_to_tear_down``: whether to unload fixtures, and
+      which groups of them
+    * ``_fb_leaves_fixtures``: whether fixtures are left loaded after it, for
+      a later class to use
+    """
+    loaded = []
+    for i, (fixtures, fixture_bundle, is_exempt) in enumerate(bundles):
+        # Ones with fixtures are sure to be classes, which means they're sure
+        # to be ContextSuites with contexts. Fixtureless ones don't care.
+        if not fixtures:
+            continue
+        first = fixture_bundle[0].context
+        _, missing = _transition(loaded, fixtures)
+        # Load them in the order the class lists them:
+        to_set_up = [label for label in first.fixtures if label in missing]
+        if to_set_up:
+            loaded.append(to_set_up)
+
+        wanted_next = frozenset()
+        if i + 1 < len(bundles) and not is_exempt and not bundles[i + 1][2]:
+            wanted_next = bundles[i + 1][0]
+        to_tear_down, _ = _transition(loaded, wanted_next)
+        del loaded[len(loaded) - len(to_tear_down) :]
+
+        for cls in fixture_bundle:
+            cls.context._fb_should_setup_fixtures = False
+            cls.context._fb_fixtures_to_set_up = []
+            cls.context._fb_should_teardown_fixtures = False
+            cls.context._fb_fixture_groups_to_tear_down = []
+            cls.context._fb_leaves_fixtures = True
+
+        # First class sets up what's missing:
+        first._fb_should_setup_fixtures = bool(to_set_up)
+        first._fb_fixtures_to_set_up = to_set_up
+
+        # Last class tears down what the next bundle doesn't want:
+        last = fixture_bundle[-1].context
+        last._fb_should_teardown_fixtures = bool(to_tear_down)
+        last._fb_fixture_groups_to_tear_down = to_tear_down
+        last._fb_leaves_fixtures = bool(loaded)
+
+
 class TestReorderer(AlwaysOnPlugin):
     """Reorder tests for various reasons."""
 
@@ -135,11 +388,115 @@ class TestReorderer(AlwaysOnPlugin):
             "across test classes. "
             "[NOSE_WITH_FIXTURE_BUNDLING]",
         )
+        parser.add_option(
+            "--fixture-bundling-strategy",
+            action="store",
+            type="choice",
+            choices=sorted(_bundle_orders),
+            dest="fixture_bundling_strategy",
+            default=env.get("NOSE_FIXTURE_BUNDLING_STRATEGY", "containment"),
+            metavar="STRATEGY",
+            help="How to order bundles of fixtures: 'containment' runs sets "
+            "of fixtures right after the biggest set they include; 'nearest' "
+            "goes from each set to the one that's cheapest to load next. "
+            "[NOSE_FIXTURE_BUNDLING_STRATEGY]",
+        )
+        parser.add_option(
+            "--duration-order",
+            action="store",
+            type="choice",
+            choices=["longest-first", "shortest-first"],
+            dest="duration_order",
+            default=env.get("NOSE_DURATION_ORDER"),
+            metavar="ORDER",
+            help="Order test classes and modules by how long they took last "
+            "time, as recorded by --with-duration-history: 'longest-first' "
+            "packs parallel runs best; 'shortest-first' gives feedback "
+            "soonest. TransactionTestCases still come last. "
+            "[NOSE_DURATION_ORDER]",
+        )
+        parser.add_option(
+            "--failed-first",
+            action="store_true",
+            dest="failed_first",
+            default=env.get("NOSE_FAILED_FIRST", False),
+            help="Run the test classes and modules that failed last time "
+            "first, and keep this run's failures for next time. "
+            "[NOSE_FAILED_FIRST]",
+        )
+        parser.add_option(
+            "--failure-cache-file",
+            action="store",
+            dest="failure_cache_file",
+            default=env.get("NOSE_FAILURE_CACHE_FILE", ".django-nose-failures.json"),
+            metavar="FILE",
+            help="Keep the tests that failed in FILE, for --failed-first. "
+            "Default: .django-nose-failures.json [NOSE_FAILURE_CACHE_FILE]",
+        )
+        parser.add_option(
+            "--changed-since",
+            action="store",
+            dest="changed_since",
+            default=env.get("NOSE_CHANGED_SINCE"),
+            metavar="REF",
+            help="Run only the test classes and modules that ran files "
+            "changed since the git REF, as recorded by --with-test-impact, "
+            "and the ones with nothing recorded. [NOSE_CHANGED_SINCE]",
+        )
+        parser.add_option(
+            "--shard",
+            action="store",
+            dest="shard",
+            default=env.get("NOSE_SHARD"),
+            metavar="I/N",
+            help="Split the tests into N shards of about the same duration, "
+            "as recorded by --with-duration-history, and run the Ith. Every "
+            "machine with the same tests and history splits them the same "
+            "way. [NOSE_SHARD]",
+        )
+        parser.add_option(
+            "--parallel",
+            action="store",
+            type="int",
+            dest="parallel",
+            default=1,
+            metavar="N",
+            help="Run test classes in N processes, each with its own copy "
+            "of the test databases. Set by the test command's --parallel "
+            "option, which also creates the copies.",
+        )
 
     def configure(self, options, conf):
         """Configure plugin, reading the with_fixture_bundling option."""
         super(TestReorderer, self).configure(options, conf)
         self.should_bundle = options.with_fixture_bundling
+        self.bundling_strategy = options.fixture_bundling_strategy
+        self.duration_order = options.duration_order
+        self.duration_history_file = getattr(
+            options, "duration_history_file", DurationHistory.default_file
+        )
+        self.failed_first = options.failed_first
+        self.failure_cache_file = options.failure_cache_file
+        self.changed_since = options.changed_since
+        if self.changed_since:
+            try:
+                check_ref(self.changed_since)
+            except ValueError:
+                conf.getParser().error(
+                    "--changed-since takes a git ref, and git doesn't know %r."
+                    % (self.changed_since,)
+                )
+        self.test_impact_file = getattr(
+            options, "test_impact_file", TestImpact.default_file
+        )
+        self.shard = None
+        if options.shard:
+            try:
+                self.shard = _parse_shard(options.shard)
+            except ValueError as exc:
+                # Say what's wrong, with the usage, rather than a traceback:
+                conf.getParser().error(str(exc))
+        self.parallel = options.parallel
 
     def _put_transaction_test_cases_last(self, test):
         """Reorder test suite so TransactionTestCase-based tests come last.
@@ -193,15 +550,122 @@ class TestReorderer(AlwaysOnPlugin):
 
         flattened = []
         process_tests(test, flattened.append)
-        flattened.sort(key=filthiness)
-        return ContextSuite(flattened)
+        if self.duration_order:
+            # This is then the order within each filthiness:
+            self._sort_by_duration(flattened)
+        # There are only two scores, so rather than sorting, share the tests
+        # out in one pass, keeping their order:
+        by_filthiness = {1: [], 2: []}
+        for t in flattened:
+            by_filthiness[filthiness(t)].append(t)
+        return ContextSuite(by_filthiness[1] + by_filthiness[2])
+
+    def _select_impacted(self, test):
+        """Return the suites in a flattened suite that changes may affect.
+
+        Those are the ones that ran a file changed since the ``changed_since``
+        git ref, and the ones we have no record of.
+        """
+        impact = read_history(self.test_impact_file)
+        changed = changed_files(self.changed_since)
+        selected = []
+        for suite in test:
+            files = impact.get(context_name(getattr(suite, "context", None)))
+            if files is None or changed.intersection(files):
+                selected.append(suite)
+        return selected
+
+    def _select_shard(self, test):
+        """Return the suites in a flattened suite that this shard runs.
+
+        With fixture bundling, the classes sharing a bundle go to the same
+        shard. Starting from the longest, each bundle or lone suite goes to the
+        shard with the least duration so far, by the duration history; ones
+        we have no history of are taken to last as long as the average. Ties
+        go to the first, so the split is the same wherever it's done. Each
+        shard keeps the suite's order.
+        """
+        index, count = self.shard
+        tests = list(test)
+        if self.should_bundle:
+            bucketer = Bucketer()
+            for t in tests:
+                bucketer.add(t)
+            groups = []
+            for (_, is_exempt), bucket in bucketer.buckets.items():
+                if is_exempt:
+                    groups.extend([t] for t in bucket)
+                else:
+                    groups.append(bucket)
+            groups.extend([t] for t in bucketer.remainder)
+        else:
+            groups = [[t] for t in tests]
+        position = dict((id(t), i) for i, t in enumerate(tests))
+        groups.sort(key=lambda group: position[id(group[0])])
+
+        history = read_history(self.duration_history_file)
+        durations = [
+            [history.get(context_name(getattr(t, "context", None))) for t in group]
+            for group in groups
+        ]
+        known = [d for group in durations for d in group if d is not None]
+        average = sum(known) / len(known) if known else 1.0
+        weights = [
+            sum(average if d is None else d for d in group) for group in durations
+        ]
+
+        loads = [0.0] * count
+        mine = set()
+        for i in sorted(range(len(groups)), key=lambda i: (-weights[i], i)):
+            shard = min(range(count), key=lambda shard: (loads[shard], shard))
+            loads[shard] += weights[i]
+            if shard == index:
+                mine.update(id(t) for t in groups[i])
+        return [t for t in tests if id(t) in mine]
+
+    def _split_failed(self, test):
+        """Split a flattened suite into lists that failed last time, or not.
+
+        Each list keeps the order the suite had.
+        """
+        failed_names = _name_prefixes(read_history(self.failure_cache_file))
+        failed, passed = [], []
+        for suite in test:
+            if context_name(getattr(suite, "context", None)) in failed_names:
+                failed.append(suite)
+            else:
+                passed.append(suite)
+        return failed, passed
+
+    def _sort_by_duration(self, tests):
+        """Sort tests by how long they took last time, as ordered.
+
+        Ones we have no history of are taken to last as long as the average.
+        """
+        history = read_history(self.duration_history_file)
+        durations = [
+            history.get(context_name(getattr(t, "context", None))) for t in tests
+        ]
+        known = [duration for duration in durations if duration is not None]
+        average = sum(known) / len(known) if known else 0
+        order = dict(
+            (id(t), average if duration is None else duration)
+            for t, duration in zip(tests, durations)
+        )
+        tests.sort(
+            key=lambda t: order[id(t)], reverse=self.duration_order == "longest-first"
+        )
 
     def _bundle_fixtures(self, test):
         """Reorder tests to minimize fixture loading.
 
         I reorder FastFixtureTestCases so ones using identical sets
-        of fixtures run adjacently. I then put attributes on them
-        to advise them to not reload the fixtures for each class.
+        of fixtures run adjacently, and the sets follow each other in an
+        order that saves loading, according to the bundling strategy: by
+        default, ones whose fixtures include another set's run right after
+        it. I then put attributes on them
+        to advise them to not reload the fixtures for each class, and to
+        load only the fixtures they add to the ones already loaded.
 
         This takes support.mozilla.com's suite from 123s down to 94s.
 
@@ -212,45 +676,42 @@ class TestReorderer(AlwaysOnPlugin):
         """
 
         def suite_sorted_by_fixtures(suite):
-            """Flatten and sort a tree of Suites by fixture.
+            """Sort a flattened Suite by fixture.
 
             Add ``_fb_should_setup_fixtures`` and
-            ``_fb_should_teardown_fixtures`` attrs to each test class to advise
-            it whether to set up or tear down (respectively) the fixtures.
+            ``_fb_should_teardown_fixtures`` attrs, and the others
+            ``_advise_fixture_loading`` describes, to each test class to
+            advise it which fixtures to set up or tear down (respectively).
 
             Return a Suite.
 
             """
             bucketer = Bucketer()
-            process_tests(suite, bucketer.add)
+            for test in suite:
+                bucketer.add(test)
+
+            # Order the bundles of common-fixture-having test classes as the
+            # strategy says, and lay them end to end in a single list so we
+            # can make a test suite out of them. Exempt classes go after, on
+            # their own:
+            bundles = []
+            exempt = []
+            for (fixtures, is_exempt), fixture_bundle in bucketer.buckets.items():
+                if is_exempt:
+                    exempt.extend((fixtures, [cls], True) for cls in fixture_bundle)
+                else:
+                    bundles.append((fixtures, fixture_bundle, False))
+            order = _bundle_orders[self.bundling_strategy](
+                [fixtures for fixtures, _, _ in bundles]
+            )
+            position = dict((fixtures, i) for i, fixtures in enumerate(order))
+            bundles.sort(key=lambda bundle: position[bundle[0]])
+            bundles.extend(exempt)
 
-            # Lay the bundles of common-fixture-having test classes end to end
-            # in a single list so we can make a test suite out of them:
-            flattened = []
-            for (key, fixture_bundle) in bucketer.buckets.items():
-                fixtures, is_exempt = key
-                # Advise first and last test classes in each bundle to set up
-                # and tear down fixtures and the rest not to:
-                if fixtures and not is_exempt:
-                    # Ones with fixtures are sure to be classes, which means
-                    # they're sure to be ContextSuites with contexts.
-
-                    # First class with this set of fixtures sets up:
-                    first = fixture_bundle[0].context
-                    first._fb_should_setup_fixtures = True
-
-                    # Set all classes' 1..n should_setup to False:
-                    for cls in fixture_bundle[1:]:
-                        cls.context._fb_should_setup_fixtures = False
-
-                    # Last class tears down:
-                    last = fixture_bundle[-1].context
-                    last._fb_should_teardown_fixtures = True
-
-                    # Set all classes' 0..(n-1) should_teardown to False:
-                    for cls in fixture_bundle[:-1]:
-                        cls.context._fb_should_teardown_fixtures = False
+            _advise_fixture_loading(bundles)
 
+            flattened = []
+            for _, fixture_bundle, _ in bundles:
                 flattened.extend(fixture_bundle)
             flattened.extend(bucketer.remainder)
 
@@ -259,8 +720,243 @@ class TestReorderer(AlwaysOnPlugin):
         return suite_sorted_by_fixtures(test)
 
     def prepareTest(self, test):
-        """Reorder the tests."""
+        """Reorder the tests, and spread them across processes if asked."""
         test = self._put_transaction_test_cases_last(test)
+        if self.changed_since:
+            test = ContextSuite(self._select_impacted(test))
+        if self.shard:
+            # Before anything particular to this machine, like --failed-first:
+            test = ContextSuite(self._select_shard(test))
+        if self.failed_first:
+            parts = [ContextSuite(part) for part in self._split_failed(test)]
+        else:
+            parts = [test]
         if self.should_bundle:
-            test = self._bundle_fixtures(test)
+            # Each part is bundled on its own, so the failed part can go first:
+            parts = [self._bundle_fixtures(part) for part in parts]
+        test = ContextSuite([suite for part in parts for suite in part])
+        if self.parallel > 1:
+            test = ParallelSuite(test, self.parallel, self.conf)
         return test
+
+
+class DurationHistory(Plugin):
+    """Remember how long each test class and module took to run.
+
+    The durations are kept in a JSON file, for ``--duration-order`` to go by
+    in later runs. Classes and modules run by ``--parallel`` worker processes
+    are timed there, and the durations sent back.
+    """
+
+    name = "duration-history"
+    default_file = ".django-nose-durations.json"
+
+    def options(self, parser, env):
+        """Add --with-duration-history and --duration-history-file to options."""
+        super(DurationHistory, self).options(parser, env)
+        parser.add_option(
+            "--duration-history-file",
+            action="store",
+            dest="duration_history_file",
+            default=env.get("NOSE_DURATION_HISTORY_FILE", self.default_file),
+            metavar="FILE",
+            help="Keep how long test classes and modules took in FILE. "
+            "Default: %s [NOSE_DURATION_HISTORY_FILE]" % self.default_file,
+        )
+
+    def configure(self, options, conf):
+        """Configure plugin, reading the duration_history_file option."""
+        super(DurationHistory, self).configure(options, conf)
+        self.history_file = options.duration_history_file
+        self.started = {}
+        self.durations = {}
+
+    def startContext(self, context):
+        """Note when a test class or module started."""
+        name = context_name(context)
+        if name is not None:
+            self.started[name] = time.time()
+
+    def stopContext(self, context):
+        """Note how long a test class or module took."""
+        start = self.started.pop(context_name(context), None)
+        if start is not None:
+            self.durations[context_name(context)] = time.time() - start
+
+    def workerReport(self):
+        """Return the durations timed in this worker since the last report."""
+        durations, self.durations = self.durations, {}
+        return durations
+
+    def mergeWorkerReport(self, durations):
+        """Add the durations timed in a worker to ours."""
+        self.durations.update(durations)
+
+    def finalize(self, result):
+        """Add this run's durations to the history file."""
+        if self.durations:
+            history = read_history(self.history_file)
+            history.update(self.durations)
+            write_history(self.history_file, history)
+
+
+class FixtureProfiler(Plugin):
+    """Report the time each fixture takes to load and unload.
+
+    The costliest fixtures are listed after the test results, and the whole
+    profile is written to a JSON file. Fixtures loaded by ``--parallel`` worker
+    processes are profiled there, and the profiles sent back.
+    """
+
+    name = "fixture-profile"
+
+    def options(self, parser, env):
+        """Add --with-fixture-profile and --fixture-profile-file to options."""
+        super(FixtureProfiler, self).options(parser, env)
+        parser.add_option(
+            "--fixture-profile-file",
+            action="store",
+            dest="fixture_profile_file",
+            default=env.get("NOSE_FIXTURE_PROFILE_FILE", "fixture-profile.json"),
+            metavar="FILE",
+            help="Write the fixture profile to FILE, as JSON. "
+            "Default: fixture-profile.json [NOSE_FIXTURE_PROFILE_FILE]",
+        )
+
+    def configure(self, options, conf):
+        """Configure plugin, reading the fixture_profile_file option."""
+        super(FixtureProfiler, self).configure(options, conf)
+        self.profile_file = options.fixture_profile_file
+        self.profile = FixtureProfile()
+
+    def begin(self):
+        """Start timing fixtures."""
+        self.profile.start()
+
+    def workerReport(self):
+        """Return the profile recorded in this worker since the last report."""
+        return self.profile.take()
+
+    def mergeWorkerReport(self, profile):
+        """Add the profile recorded in a worker to ours."""
+        self.profile.merge(profile)
+
+    def report(self, stream):
+        """Stop timing fixtures, and report on them."""
+        self.profile.stop()
+        stream.writeln("")
+        stream.writeln("Fixtures, costliest first:")
+        for line in self.profile.summary(limit=20):
+            stream.writeln(line)
+        self.profile.write(self.profile_file)
+        stream.writeln("Full fixture profile written to %s" % self.profile_file)
+
+
+class TestImpact(Plugin):
+    """Remember which project files each test class and module runs.
+
+    The files are kept in a JSON file, for ``--changed-since`` to pick the
+    tests to run by in later runs. Fixture files a class names count as files
+    it runs, and so do the files that run while its module, or a package it's
+    in, is imported, and the project modules its module refers to. Classes
+    and modules run by ``--parallel`` worker processes are recorded there, and
+    the files sent back.
+    """
+
+    name = "test-impact"
+    default_file = ".django-nose-impact.json"
+
+    def options(self, parser, env):
+        """Add --with-test-impact and --test-impact-file to options."""
+        super(TestImpact, self).options(parser, env)
+        parser.add_option(
+            "--test-impact-file",
+            action="store",
+            dest="test_impact_file",
+            default=env.get("NOSE_TEST_IMPACT_FILE", self.default_file),
+            metavar="FILE",
+            help="Keep the files each test class and module runs in FILE. "
+            "Default: %s [NOSE_TEST_IMPACT_FILE]" % self.default_file,
+        )
+
+    def configure(self, options, conf):
+        """Configure plugin, reading the test_impact_file option."""
+        super(TestImpact, self).configure(options, conf)
+        self.impact_file = options.test_impact_file
+        self.impact = {}
+        # Files run while importing each test module or package, by name:
+        self.imported = {}
+        # Project files each test module refers to, by name:
+        self.module_files = {}
+
+    def begin(self):
+        """Start noting which files run."""
+        self.recorder = FileRecorder(
+            ignore=(__file__, history.__file__, parallel.__file__)
+        )
+        self.recorder.start()
+
+    def beforeImport(self, filename, module):
+        """Start noting the files run while a test module is imported."""
+        self.recorder.open_context(("import", module))
+
+    def afterImport(self, filename, module):
+        """Stop noting the files run while a test module is imported."""
+        self.imported[module] = self.recorder.close_context(("import", module))
+
+    def _import_files(self, module_name):
+        """Return the files that a test module runs just by being imported."""
+        files = set()
+        for name in _name_prefixes([module_name]):
+            files.update(self.imported.get(name, ()))
+        if module_name not in self.module_files:
+            module = sys.modules.get(module_name)
+            self.module_files[module_name] = (
+                self.recorder.module_files(module) if module is not None else set()
+            )
+        files.update(self.module_files[module_name])
+        return files
+
+    def workerReport(self):
+        """Return the files noted in this worker since the last report."""
+        impact, self.impact = self.impact, {}
+        return impact
+
+    def mergeWorkerReport(self, impact):
+        """Add the files noted in a worker to ours."""
+        for name, files in impact.items():
+            self.impact.setdefault(name, set()).update(files)
+
+    def startContext(self, context):
+        """Start noting the files a test class or module runs."""
+        name = context_name(context)
+        if name is not None:
+            self.recorder.open_context(name)
+
+    def stopContext(self, context):
+        """Stop noting the files a test class or module runs."""
+        name = context_name(context)
+        if name is None:
+            return
+        files = self.recorder.close_context(name)
+        if isinstance(context, type):
+            files.update(self._import_files(context.__module__))
+        else:
+            files.update(self._import_files(context.__name__))
+        fixtures = getattr(context, "fixtures", None)
+        if fixtures:
+            for path in fixture_paths(fixtures):
+                relpath = self.recorder.relpath(path)
+                if relpath is not None:
+                    files.add(relpath)
+        self.impact.setdefault(name, set()).update(files)
+
+    def finalize(self, result):
+        """Stop noting which files run, and add them to the impact file."""
+        self.recorder.stop()
+        if self.impact:
+            recorded = read_history(self.impact_file)
+            recorded.update(
+                (name, sorted(files)) for name, files in self.impact.items()
+            )
+            write_history(self.impact_file, recorded)
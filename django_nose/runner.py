@@ -10,6 +10,8 @@ in settings.py for arguments that you want always passed to nose.
 """
 import os
 import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from importlib import import_module
 from optparse import NO_DEFAULT
 from types import MethodType
@@ -19,11 +21,50 @@ from django.apps import apps
 from django.conf import settings
 from django.core import exceptions
 from django.core.management.color import no_style
+from django.core.management.commands import flush
 from django.core.management.commands.loaddata import Command
+from django.core.management.sql import emit_post_migrate_signal
 from django.db import connections, transaction, DEFAULT_DB_ALIAS
 from django.test.runner import DiscoverRunner
 
-from django_nose.plugin import DjangoSetUpPlugin, ResultPlugin, TestReorderer
+try:
+    from django.test.utils import get_unique_databases_and_mirrors
+except ImportError:
+    # Django < 1.11
+    get_unique_databases_and_mirrors = None
+
+from django_nose.databases import (
+    CLONEABLE_VENDORS,
+    DatabasePool,
+    changed_tables,
+    clone_database,
+    connect_to,
+    database_exists,
+    is_pooled_db_name,
+    moved_sequences,
+    pooled_db_name,
+    prune_snapshots,
+    read_metadata,
+    record_row_counts,
+    record_sequence_positions,
+    restore_snapshot,
+    row_counts,
+    save_snapshot,
+    schema_fingerprint,
+    snapshot_path,
+    sqlite_sequence_reset_sql,
+    template_db_name,
+    write_metadata,
+)
+from django_nose.plugin import (
+    DjangoSetUpPlugin,
+    DurationHistory,
+    FixtureProfiler,
+    ResultPlugin,
+    TestImpact,
+    TestReorderer,
+)
+from django_nose.tracking import install_write_trackers, write_tracker
 from django_nose.utils import uses_mysql
 import nose.core
 
@@ -44,7 +85,12 @@ def translate_option(opt):
 
 def _get_plugins_from_settings():
     settings_plugins = list(getattr(settings, "NOSE_PLUGINS", []))
-    for plug_path in settings_plugins + ["django_nose.plugin.TestReorderer"]:
+    for plug_path in settings_plugins + [
+        "django_nose.plugin.TestReorderer",
+        "django_nose.plugin.FixtureProfiler",
+        "django_nose.plugin.DurationHistory",
+        "django_nose.plugin.TestImpact",
+    ]:
         try:
             dot = plug_path.rindex(".")
         except ValueError:
@@ -243,7 +289,14 @@ class BasicNoseRunner(BaseRunner):
     def run_suite(self, nose_argv):
         """Run the test suite."""
         result_plugin = ResultPlugin()
-        plugins_to_add = [DjangoSetUpPlugin(self), result_plugin, TestReorderer()]
+        plugins_to_add = [
+            DjangoSetUpPlugin(self),
+            result_plugin,
+            TestReorderer(),
+            FixtureProfiler(),
+            DurationHistory(),
+            TestImpact(),
+        ]
 
         for plugin in _get_plugins_from_settings():
             plugins_to_add.append(plugin)
@@ -311,6 +364,12 @@ class BasicNoseRunner(BaseRunner):
         ):
             nose_argv.append("--verbosity=%s" % str(self.verbosity))
 
+        # Django's --parallel made a copy of the test DBs for each process. Tell
+        # the TestReorderer to farm the tests out to that many:
+        parallel = getattr(self, "parallel", 1)
+        if parallel > 1:
+            nose_argv.append("--parallel=%d" % parallel)
+
         if self.verbosity >= 1:
             print(" ".join(nose_argv))
 
@@ -343,6 +402,90 @@ def _foreign_key_ignoring_handle(self, *fixture_labels, **options):
         cursor.execute("SET foreign_key_checks = 1")
 
 
+def _remote_field(field):
+    """Return what a field relates to, or None if it isn't a relation."""
+    if hasattr(field, "remote_field"):
+        return field.remote_field
+    # Django < 1.9
+    return field.rel
+
+
+def _with_referencing_tables(tables):
+    """Add the tables with foreign keys into ``tables`` to them, recursively.
+
+    Emptying a table means emptying those that refer to it, too; PostgreSQL,
+    for one, refuses to truncate a table without the ones referencing it.
+    """
+    references = []
+    for model in apps.get_models(include_auto_created=True):
+        for field in model._meta.local_fields:
+            remote_field = _remote_field(field)
+            if remote_field is not None and remote_field.model is not None:
+                references.append(
+                    (model._meta.db_table, remote_field.model._meta.db_table)
+                )
+
+    tables = set(tables)
+    added = True
+    while added:
+        added = False
+        for table, referenced in references:
+            if referenced in tables and table not in tables:
+                tables.add(table)
+                added = True
+    return tables
+
+
+_old_flush_handle = flush.Command.handle
+
+
+def _tracked_flush_handle(self, **options):
+    """Wrap the stock flush to empty only the tables tests wrote to.
+
+    TransactionTestCases flush the DB after every test. With write tracking
+    on, only the tables written to since the last flush are emptied, and
+    everything else is left as it is. If we lost track, or somebody asked for
+    a flush interactively, this does what the stock flush does.
+
+    This is monkeypatched into place in setup_databases() when
+    ``TRACKED_FLUSH`` is set.
+    """
+    database = options["database"]
+    tracker = write_tracker(database)
+    if tracker is None or tracker.unsure or options["interactive"]:
+        if tracker is not None:
+            tracker.reset()
+        return _old_flush_handle(self, **options)
+
+    connection = connections[database]
+    written = _with_referencing_tables(tracker.tables)
+    tables = [
+        table
+        for table in connection.introspection.django_table_names(
+            only_existing=True, include_views=False
+        )
+        if table in written
+    ]
+    sequences = []
+    if options.get("reset_sequences", True):
+        sequences = [
+            sequence
+            for sequence in connection.introspection.sequence_list()
+            if sequence["table"] in written
+        ]
+    sql_list = connection.ops.sql_flush(
+        no_style(), tables, sequences, options.get("allow_cascade", False)
+    )
+    if sql_list:
+        connection.ops.execute_sql_flush(database, sql_list)
+        if not options.get("inhibit_post_migrate", False):
+            emit_post_migrate_signal(
+                options["verbosity"], options["interactive"], database
+            )
+    # Whatever the flush and post_migrate handlers wrote is the clean state:
+    tracker.reset()
+
+
 def _skip_create_test_db(
     self, verbosity=1, autoclobber=False, serialize=True, keepdb=True
 ):
@@ -368,53 +511,374 @@ def _skip_create_test_db(
     return self._get_test_db_name()
 
 
+def _env_flag(name):
+    """Return whether the environment variable ``name`` is truthy."""
+    return os.getenv(name, "false").lower() in ("true", "1")
+
+
 def _reusing_db():
     """Return whether the ``REUSE_DB`` flag was passed."""
-    return os.getenv("REUSE_DB", "false").lower() in ("true", "1")
+    return _env_flag("REUSE_DB")
+
+
+def _using_template_db():
+    """Return whether the ``TEMPLATE_DB`` flag was passed."""
+    return _env_flag("TEMPLATE_DB")
+
+
+def _pool_size():
+    """Return how many test DBs to keep per alias, from ``REUSE_DB_POOL``.
+
+    1, the default, means the usual single test DB.
+    """
+    try:
+        return max(1, int(os.getenv("REUSE_DB_POOL", "1")))
+    except ValueError:
+        return 1
+
+
+def _setting_up_concurrently():
+    """Return whether test DBs should be set up concurrently.
+
+    This needs Django 1.11 or later, which tells us which DBs to set up and in
+    what order.
+    """
+    return (
+        _env_flag("CONCURRENT_DB_SETUP")
+        and get_unique_databases_and_mirrors is not None
+    )
+
+
+def _uses_in_memory_db(connection):
+    """Return whether the connection's test DB is a SQLite in-memory DB."""
+    creation = connection.creation
+    test_db_name = creation._get_test_db_name()
+    is_in_memory_db = getattr(creation, "is_in_memory_db", None)
+    if is_in_memory_db is not None:
+        return is_in_memory_db(test_db_name)
+    return test_db_name == ":memory:"
+
+
+def _test_db_dependencies(test_databases):
+    """Map each test DB's signature to the signatures of those it needs first.
+
+    ``test_databases`` is as returned by Django's
+    ``get_unique_databases_and_mirrors()``. As in Django, an alias depends on
+    the aliases in its ``TEST['DEPENDENCIES']`` or, if it doesn't say, on the
+    default DB.
+    """
+    default_sig = connections[DEFAULT_DB_ALIAS].creation.test_db_signature()
+    alias_sigs = {}
+    for sig, (db_name, aliases) in test_databases.items():
+        for alias in aliases:
+            alias_sigs[alias] = sig
+
+    dependencies = {}
+    for sig, (db_name, aliases) in test_databases.items():
+        dependencies[sig] = set()
+        for alias in aliases:
+            test_settings = connections[alias].settings_dict["TEST"]
+            if "DEPENDENCIES" in test_settings:
+                needed = test_settings["DEPENDENCIES"]
+            elif alias != DEFAULT_DB_ALIAS and sig != default_sig:
+                needed = [DEFAULT_DB_ALIAS]
+            else:
+                needed = []
+            dependencies[sig].update(alias_sigs[a] for a in needed if a in alias_sigs)
+        dependencies[sig].discard(sig)
+    return dependencies
 
 
 def _can_support_reuse_db(connection):
     """Return True if REUSE_DB is a sensible option for the backend."""
     # Perhaps this is a SQLite in-memory DB. Those are created implicitly when
-    # you try to connect to them, so our usual test doesn't work.
-    return not connection.creation._get_test_db_name() == ":memory:"
+    # you try to connect to them, so our usual test doesn't work. They are
+    # reused through snapshots instead.
+    return not _uses_in_memory_db(connection)
 
 
-def _should_create_database(connection):
-    """Return whether we should recreate the given DB.
+def _use_pooled_database(connection, verbosity):
+    """Point the connection at the pooled test DB for the current schema.
+
+    The pooled DB is named after the usual test DB and the schema fingerprint,
+    so switching between branches with different migrations switches between
+    DBs rather than rebuilding one. If that makes the pool too big, the least
+    recently used DBs (and their templates) are dropped; never anything but
+    a pooled DB for this test DB name, whatever the pool's file says.
+    """
+    creation = connection.creation
+    test_db_name = creation._get_test_db_name()
+    name = pooled_db_name(connection, test_db_name, schema_fingerprint(connection))
+    connection.settings_dict["TEST"]["NAME"] = name
+
+    for evicted in DatabasePool(connection, test_db_name).use(name, _pool_size()):
+        if not is_pooled_db_name(connection, test_db_name, evicted):
+            continue
+        for evicted_name in (evicted, template_db_name(connection, evicted)):
+            if not database_exists(connection, evicted_name):
+                continue
+            if verbosity >= 1:
+                creation.log(
+                    "Dropping least recently used test database %s..."
+                    % evicted_name
+                )
+            creation._destroy_test_db(evicted_name, verbosity)
+
+
+def _restore_memory_snapshot(connection, verbosity):
+    """Load the snapshot of an in-memory test DB, if there's one to load.
 
-    This is true if the DB doesn't exist or the REUSE_DB env var isn't truthy.
+    Return whether we did.
     """
-    # TODO: Notice when the Model classes change and return True. Worst case,
-    # we can generate sqlall and hash it, though it's a bit slow (2 secs) and
-    # hits the DB for no good reason. Until we find a faster way, I'm inclined
-    # to keep making people explicitly saying REUSE_DB if they want to reuse
-    # the DB.
+    path = snapshot_path(connection)
+    if not path or not os.path.exists(path):
+        return False
+    creation = connection.creation
+    if verbosity >= 1:
+        creation.log(
+            "Loading test database for alias %s from %s..."
+            % (
+                creation._get_database_display_str(
+                    verbosity, connection.settings_dict["NAME"]
+                ),
+                path,
+            )
+        )
+    restore_snapshot(connection, path)
+    return True
 
-    if not _can_support_reuse_db(connection):
-        return True
 
-    # Notice whether the DB exists, and create it if it doesn't:
+def _save_memory_snapshot(connection, verbosity):
+    """Save a freshly built in-memory test DB, for later runs to load.
+
+    Snapshots of the DB taken for older schemas are removed.
+    """
+    path = snapshot_path(connection)
+    if not path:
+        return
+    creation = connection.creation
+    if verbosity >= 1:
+        creation.log(
+            "Saving snapshot of test database for alias %s to %s..."
+            % (
+                creation._get_database_display_str(
+                    verbosity, connection.settings_dict["NAME"]
+                ),
+                path,
+            )
+        )
+    save_snapshot(connection, path)
+    prune_snapshots(connection, path)
+
+
+def _schema_is_current(connection):
+    """Return whether the connected test DB was built from the current schema.
+
+    The schema fingerprint recorded by ``_record_schema_fingerprint`` is
+    compared against one computed from the migrations and models on disk. A
+    DB without a recorded fingerprint is assumed to be stale.
+    """
+    recorded = read_metadata(connection, "schema_fingerprint")
+    return recorded == schema_fingerprint(connection)
+
+
+def _record_schema_fingerprint(connection):
+    """Note in the test DB which schema it was built from."""
+    write_metadata(connection, "schema_fingerprint", schema_fingerprint(connection))
+
+
+def _can_use_template_db(connection):
+    """Return True if we can keep a template of the connection's test DB."""
+    return (
+        connection.vendor in CLONEABLE_VENDORS
+        and _can_support_reuse_db(connection)
+        and not connection.settings_dict["TEST"].get("MIRROR")
+    )
+
+
+def _clone_from_template(connection, verbosity):
+    """Replace the test DB with a copy of its template, if there's a good one.
+
+    Return whether we did. A template built from an outdated schema is left
+    alone; it gets replaced once the test DB has been rebuilt.
+    """
+    test_db_name = connection.settings_dict["NAME"]
+    template_name = template_db_name(connection, test_db_name)
+    if not database_exists(connection, template_name):
+        return False
+    template = connect_to(connection, template_name)
+    try:
+        if not _schema_is_current(template):
+            return False
+    finally:
+        template.close()
+
+    creation = connection.creation
+    if verbosity >= 1:
+        creation.log(
+            "Cloning test database for alias %s from its template..."
+            % creation._get_database_display_str(verbosity, test_db_name)
+        )
+    connection.close()
+    clone_database(connection, template_name, test_db_name)
+    return True
+
+
+def _save_template(connection, verbosity):
+    """Copy a freshly built test DB to its template, for later runs to clone."""
+    test_db_name = connection.settings_dict["NAME"]
+    creation = connection.creation
+    if verbosity >= 1:
+        creation.log(
+            "Saving template of test database for alias %s..."
+            % creation._get_database_display_str(verbosity, test_db_name)
+        )
+    # Some backends refuse to copy a DB that somebody is connected to:
+    for other in connections.all():
+        if other.settings_dict["NAME"] == test_db_name:
+            other.close()
+    clone_database(connection, test_db_name, template_db_name(connection, test_db_name))
+
+
+def _test_db_exists(connection):
+    """Return whether the test DB the connection points at exists.
+
+    Where we can, ask the server's catalog (or look for the SQLite file), which
+    leaves every open connection alone. Other backends are probed the old way,
+    by connecting.
+    """
+    try:
+        return database_exists(connection, connection.settings_dict["NAME"])
+    except NotImplementedError:
+        pass
+    # Connections are cached by some backends. If other code has connected to
+    # the database previously under a different database name, the cached
+    # connection will be used and no exception will be raised.
+    connection.close()
     try:
-        # Connections are cached by some backends, if other code has connected
-        # to the database previously under a different database name the
-        # cached connection will be used and no exception will be raised.
-        # Avoiding this by closing connections and setting to null
-        for connection in connections.all():
-            connection.close()
-        connection.connection = None
         connection.cursor()
     except Exception:  # TODO: Be more discerning but still DB agnostic.
+        return False
+    return True
+
+
+def _should_create_database(connection):
+    """Return whether we should recreate the given DB.
+
+    This is true if the REUSE_DB env var isn't truthy, the DB doesn't exist, or
+    the migrations or models have changed since the DB was built.
+    """
+    if not _reusing_db() or not _can_support_reuse_db(connection):
+        return True
+    if not _test_db_exists(connection):
+        return True
+    # This connection may still be open to the real DB; reconnect to the
+    # test DB:
+    connection.close()
+    return not _schema_is_current(connection)
+
+
+def _drop_stale_database(connection, verbosity):
+    """Drop the test DB the connection points at, to be built afresh."""
+    creation = connection.creation
+    test_db_name = connection.settings_dict["NAME"]
+    if verbosity >= 1:
+        creation.log(
+            "Dropping stale test database for alias %s..."
+            % creation._get_database_display_str(verbosity, test_db_name)
+        )
+    connection.close()
+    creation._destroy_test_db(test_db_name, verbosity)
+
+
+def _uses_tables(model, tables):
+    """Return whether a model's table or its many-to-many tables are in a set."""
+    if model._meta.db_table in tables:
+        return True
+    for field in model._meta.local_many_to_many:
+        remote_field = _remote_field(field)
+        if remote_field.through._meta.db_table in tables:
+            return True
+    return False
+
+
+def _clean_up_after_crash(connection, verbosity):
+    """Empty the tables an interrupted test run left junk in, if we can.
+
+    Return whether the DB is clean now. A DB that wasn't marked clean when the
+    last run finished has its row counts compared with the baseline recorded
+    when it was built. Tables that were empty then are emptied again, along
+    with the tables referring to them, which PostgreSQL insists on truncating
+    together. If any other table changed, or one of those referring tables
+    isn't empty, there's no cheap way back, and the DB must be rebuilt.
+    """
+    if read_metadata(connection, "state", "clean") == "clean":
+        return True
+    changed = changed_tables(connection)
+    if changed is None:
+        return False
+    if any(baseline for baseline, count in changed.values()):
+        return False
+    if not changed:
         return True
-    return not _reusing_db()
+    existing = set(connection.introspection.table_names())
+    tables = existing.intersection(_with_referencing_tables(changed))
+    if any(row_counts(connection, sorted(tables.difference(changed))).values()):
+        return False
+
+    creation = connection.creation
+    if verbosity >= 1:
+        creation.log(
+            "Emptying %d tables left dirty in test database for alias %s..."
+            % (
+                len(tables),
+                creation._get_database_display_str(
+                    verbosity, connection.settings_dict["NAME"]
+                ),
+            )
+        )
+    flush_statements = connection.ops.sql_flush(no_style(), sorted(tables), [])
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            for statement in flush_statements:
+                cursor.execute(statement)
+    return True
+
+
+def _reused_connections():
+    """Yield a connection to each reusable test DB, skipping mirrors."""
+    names = set()
+    for connection in connections.all():
+        if connection.settings_dict["TEST"].get("MIRROR"):
+            continue
+        if _uses_in_memory_db(connection):
+            continue
+        name = connection.settings_dict["NAME"]
+        if name not in names:
+            names.add(name)
+            yield connection
+
+
+def _mark_databases(state):
+    """Note in each reusable test DB whether tests may be using it.
+
+    A DB left marked "in use" was abandoned by an interrupted test run.
+    """
+    for connection in _reused_connections():
+        write_metadata(connection, "state", state)
 
 
-def _mysql_reset_sequences(style, connection):
-    """Return a SQL statements needed to reset Django tables."""
-    tables = connection.introspection.django_table_names(only_existing=True)
-    flush_statements = connection.ops.sql_flush(
-        style, tables, connection.introspection.sequence_list()
-    )
+def _mysql_reset_sequences(style, connection, tables=None):
+    """Return a SQL statements needed to reset Django tables.
+
+    Pass a set of ``tables`` to reset only those.
+    """
+    django_tables = connection.introspection.django_table_names(only_existing=True)
+    sequences = connection.introspection.sequence_list()
+    if tables is not None:
+        django_tables = [t for t in django_tables if t in tables]
+        sequences = [s for s in sequences if s["table"] in tables]
+    flush_statements = connection.ops.sql_flush(style, django_tables, sequences)
 
     # connection.ops.sequence_reset_sql() is not implemented for MySQL,
     # and the base class just returns []. TODO: Implement it by pulling
@@ -434,73 +898,318 @@ class NoseTestSuiteRunner(BasicNoseRunner):
 
     To opt into this behavior, set the environment variable ``REUSE_DB`` to
     "1" or "true" (case insensitive).
+
+    Set ``TEMPLATE_DB`` the same way to keep a pristine copy of each freshly
+    built test DB around and clone it, rather than migrating, on later runs.
+
+    Set ``CONCURRENT_DB_SETUP`` to set up independent test DBs at the same
+    time rather than one after another, and ``TRACKED_FLUSH`` to have
+    TransactionTestCases flush only the tables they wrote to.
     """
 
     def _get_models_for_connection(self, connection):
         """Return a list of models for a connection."""
-        tables = connection.introspection.get_table_list(connection.cursor())
+        tables = set(
+            # Django 1.8 and later return TableInfo tuples:
+            getattr(table, "name", table)
+            for table in connection.introspection.get_table_list(connection.cursor())
+        )
         return [m for m in apps.get_models() if m._meta.db_table in tables]
 
-    def setup_databases(self):
-        """Set up databases. Skip DB creation if requested and possible."""
-        for alias in connections:
-            connection = connections[alias]
-            creation = connection.creation
-            test_db_name = creation._get_test_db_name()
-
-            # Mess with the DB name so other things operate on a test DB
-            # rather than the real one. This is done in create_test_db when
-            # we don't monkeypatch it away with _skip_create_test_db.
-            orig_db_name = connection.settings_dict["NAME"]
-            connection.settings_dict["NAME"] = test_db_name
-
-            if _should_create_database(connection):
-                # We're not using _skip_create_test_db, so put the DB name
-                # back:
-                connection.settings_dict["NAME"] = orig_db_name
-
-                # Since we replaced the connection with the test DB, closing
-                # the connection will avoid pooling issues with SQLAlchemy. The
-                # issue is trying to CREATE/DROP the test database using a
-                # connection to a DB that was established with that test DB.
-                # MySQLdb doesn't allow it, and SQLAlchemy attempts to reuse
-                # the existing connection from its pool.
-                connection.close()
-            else:
-                # Reset auto-increment sequences. Apparently, SUMO's tests are
-                # horrid and coupled to certain numbers.
-                cursor = connection.cursor()
-                style = no_style()
-
-                if uses_mysql(connection):
-                    reset_statements = _mysql_reset_sequences(style, connection)
-                else:
-                    reset_statements = connection.ops.sequence_reset_sql(
-                        style, self._get_models_for_connection(connection)
+    def _reset_sequences(self, connection):
+        """Reset the auto-increment sequences that tests have moved.
+
+        Tables whose sequences still stand where they did when the DB was last
+        clean are left alone. If we can't tell, every sequence is reset, and
+        where they end up is recorded for next time.
+        """
+        moved = moved_sequences(connection)
+        if moved is not None and not moved:
+            return
+
+        style = no_style()
+        if uses_mysql(connection):
+            reset_statements = _mysql_reset_sequences(style, connection, moved)
+        elif connection.vendor == "sqlite":
+            # Without a record of where they stood, SQLite's sequences are left
+            # be; they're right as long as the DB was built this run.
+            reset_statements = sqlite_sequence_reset_sql(connection, moved or ())
+        else:
+            models = self._get_models_for_connection(connection)
+            if moved is not None:
+                models = [m for m in models if _uses_tables(m, moved)]
+            reset_statements = connection.ops.sequence_reset_sql(style, models)
+
+        if reset_statements and connection.vendor == "postgresql":
+            # psycopg2 runs several statements at once, in one round-trip.
+            reset_statements = ["\n".join(reset_statements)]
+
+        cursor = connection.cursor()
+        if hasattr(transaction, "atomic"):
+            with transaction.atomic(using=connection.alias):
+                for reset_statement in reset_statements:
+                    cursor.execute(reset_statement)
+        else:
+            # Django < 1.6
+            for reset_statement in reset_statements:
+                cursor.execute(reset_statement)
+            transaction.commit_unless_managed(using=connection.alias)
+
+        if moved is None:
+            record_sequence_positions(connection)
+
+    def _prepare_database(self, alias):
+        """Point an alias at its test DB, and skip creating it if we can.
+
+        Return whether the test DB still has to be created.
+        """
+        connection = connections[alias]
+        creation = connection.creation
+        if (
+            _reusing_db()
+            and _pool_size() > 1
+            and connection.vendor in CLONEABLE_VENDORS
+            and _can_support_reuse_db(connection)
+            and not connection.settings_dict["TEST"].get("MIRROR")
+        ):
+            _use_pooled_database(connection, self.verbosity)
+        test_db_name = creation._get_test_db_name()
+
+        # Mess with the DB name so other things operate on a test DB
+        # rather than the real one. This is done in create_test_db when
+        # we don't monkeypatch it away with _skip_create_test_db.
+        orig_db_name = connection.settings_dict["NAME"]
+        connection.settings_dict["NAME"] = test_db_name
+
+        if (
+            _using_template_db()
+            and _can_use_template_db(connection)
+            and _clone_from_template(connection, self.verbosity)
+        ):
+            # A fresh copy of a pristine template needs neither migrating
+            # nor resetting:
+            creation.create_test_db = MethodType(_skip_create_test_db, creation)
+            return False
+
+        if (
+            _reusing_db()
+            and _uses_in_memory_db(connection)
+            and _restore_memory_snapshot(connection, self.verbosity)
+        ):
+            # The snapshot was taken right after the DB was built, so it's
+            # clean:
+            creation.create_test_db = MethodType(_skip_create_test_db, creation)
+            return False
+
+        if _should_create_database(connection) or not _clean_up_after_crash(
+            connection, self.verbosity
+        ):
+            if (
+                _reusing_db()
+                and _can_support_reuse_db(connection)
+                and _test_db_exists(connection)
+            ):
+                # It's our own test DB, gone stale, so rather than have Django
+                # ask whether it may be deleted, drop it ourselves:
+                _drop_stale_database(connection, self.verbosity)
+
+            # We're not using _skip_create_test_db, so put the DB name
+            # back:
+            connection.settings_dict["NAME"] = orig_db_name
+
+            # Since we replaced the connection with the test DB, closing
+            # the connection will avoid pooling issues with SQLAlchemy. The
+            # issue is trying to CREATE/DROP the test database using a
+            # connection to a DB that was established with that test DB.
+            # MySQLdb doesn't allow it, and SQLAlchemy attempts to reuse
+            # the existing connection from its pool.
+            connection.close()
+            return True
+
+        # Reset auto-increment sequences. Apparently, SUMO's tests are
+        # horrid and coupled to certain numbers.
+        self._reset_sequences(connection)
+
+        # Each connection has its own creation object, so this affects
+        # only a single connection:
+        creation.create_test_db = MethodType(_skip_create_test_db, creation)
+        return False
+
+    def _remember_created_databases(self, created):
+        """Note the schema of freshly built DBs, and save their templates.
+
+        This lets the next run tell whether they (or their templates) are
+        still fit for reuse.
+        """
+        saved_templates = set()
+        for connection in created:
+            if connection.settings_dict["TEST"].get("MIRROR"):
+                continue
+            if _reusing_db() or _using_template_db():
+                _record_schema_fingerprint(connection)
+                record_sequence_positions(connection)
+                record_row_counts(connection)
+            if _reusing_db() and _uses_in_memory_db(connection):
+                _save_memory_snapshot(connection, self.verbosity)
+            test_db_name = connection.settings_dict["NAME"]
+            if (
+                _using_template_db()
+                and _can_use_template_db(connection)
+                and test_db_name not in saved_templates
+            ):
+                _save_template(connection, self.verbosity)
+                saved_templates.add(test_db_name)
+
+    def _set_up_test_db(self, alias):
+        """Prepare, create or reuse, and clone the test DB for one alias.
+
+        This does for a single DB what Django's setup_databases() does for
+        all of them, so it can run on a worker thread. Django's connections
+        are per-thread, so everything here happens on this thread's own
+        connection, which is returned along with the time it all took.
+        """
+        start = time.time()
+        connection = connections[alias]
+        created = self._prepare_database(alias)
+        connection.creation.create_test_db(
+            verbosity=self.verbosity,
+            autoclobber=not self.interactive,
+            keepdb=self.keepdb,
+            serialize=connection.settings_dict.get("TEST", {}).get("SERIALIZE", True),
+        )
+        if created:
+            self._remember_created_databases([connection])
+        parallel = getattr(self, "parallel", 1)
+        if parallel > 1:
+            for index in range(parallel):
+                connection.creation.clone_test_db(
+                    suffix=str(index + 1), verbosity=self.verbosity, keepdb=self.keepdb
+                )
+        return connection, time.time() - start
+
+    def _setup_databases_concurrently(self):
+        """Set up independent test DBs at the same time, on a thread pool.
+
+        A DB is started only once all the DBs it depends on (through
+        ``TEST['DEPENDENCIES']``, or implicitly on the default DB, just as
+        Django orders them) are done. Mirrors and aliases sharing a DB are
+        pointed at it afterward, like Django does. SQLite in-memory DBs live
+        only as long as a connection to them does, so they're set up on the
+        main thread.
+        """
+        test_databases, mirrored_aliases = get_unique_databases_and_mirrors()
+        dependencies = _test_db_dependencies(test_databases)
+        first_aliases = dict(
+            (sig, [a for a in connections if a in aliases][0])
+            for sig, (db_name, aliases) in test_databases.items()
+        )
+
+        def set_up_in_thread(alias):
+            connection, elapsed = self._set_up_test_db(alias)
+            # The connection belongs to this thread; nobody else may close it.
+            connection.close()
+            return connection, elapsed
+
+        def finished(sig, connection, elapsed):
+            alias = first_aliases[sig]
+            main_connection = connections[alias]
+            if connection is not main_connection:
+                # Hand over what the worker thread learned, and make the main
+                # thread's connection reconnect to the test DB:
+                contents = getattr(connection, "_test_serialized_contents", None)
+                if contents is not None:
+                    main_connection._test_serialized_contents = contents
+                main_connection.close()
+            if self.verbosity >= 1:
+                creation = main_connection.creation
+                creation.log(
+                    "Set up test database for alias %s in %.2fs."
+                    % (
+                        creation._get_database_display_str(
+                            self.verbosity, main_connection.settings_dict["NAME"]
+                        ),
+                        elapsed,
+                    )
+                )
+            done.add(sig)
+
+        done = set()
+        pending = list(test_databases)
+        running = {}
+        with ThreadPoolExecutor(max_workers=len(pending) or 1) as executor:
+            while pending or running:
+                ready = [s for s in pending if dependencies[s] <= done]
+                if not ready and not running:
+                    raise exceptions.ImproperlyConfigured(
+                        "Circular dependency in TEST[DEPENDENCIES]"
+                    )
+                for sig in ready:
+                    pending.remove(sig)
+                    alias = first_aliases[sig]
+                    if _uses_in_memory_db(connections[alias]):
+                        finished(sig, *self._set_up_test_db(alias))
+                    else:
+                        future = executor.submit(set_up_in_thread, alias)
+                        running[future] = sig
+                if not running:
+                    # Only in-memory DBs were ready; look again.
+                    continue
+                completed, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    finished(running.pop(future), *future.result())
+
+        old_names = []
+        for sig, (db_name, aliases) in test_databases.items():
+            first_alias = first_aliases[sig]
+            old_names.append((connections[first_alias], db_name, True))
+            for alias in aliases:
+                if alias != first_alias:
+                    old_names.append((connections[alias], db_name, False))
+                    connections[alias].creation.set_as_test_mirror(
+                        connections[first_alias].settings_dict
                     )
 
-                if hasattr(transaction, "atomic"):
-                    with transaction.atomic(using=connection.alias):
-                        for reset_statement in reset_statements:
-                            cursor.execute(reset_statement)
-                else:
-                    # Django < 1.6
-                    for reset_statement in reset_statements:
-                        cursor.execute(reset_statement)
-                    transaction.commit_unless_managed(using=connection.alias)
+        for alias, mirror_alias in mirrored_aliases.items():
+            connections[alias].creation.set_as_test_mirror(
+                connections[mirror_alias].settings_dict
+            )
+
+        if self.debug_sql:
+            for alias in connections:
+                connections[alias].force_debug_cursor = True
 
-                # Each connection has its own creation object, so this affects
-                # only a single connection:
-                creation.create_test_db = MethodType(_skip_create_test_db, creation)
+        return old_names
 
+    def setup_databases(self):
+        """Set up databases. Skip DB creation if requested and possible."""
         Command.handle = _foreign_key_ignoring_handle
 
-        # With our class patch, does nothing but return some connection
-        # objects:
-        return super(NoseTestSuiteRunner, self).setup_databases()
+        if _setting_up_concurrently():
+            old_names = self._setup_databases_concurrently()
+        else:
+            created = [
+                connections[alias]
+                for alias in connections
+                if self._prepare_database(alias)
+            ]
+
+            # With our class patch, does nothing but return some connection
+            # objects:
+            old_names = super(NoseTestSuiteRunner, self).setup_databases()
+
+            self._remember_created_databases(created)
+
+        if _reusing_db():
+            _mark_databases("in use")
+        if _env_flag("TRACKED_FLUSH"):
+            install_write_trackers()
+            flush.Command.handle = _tracked_flush_handle
+        return old_names
 
     def teardown_databases(self, *args, **kwargs):
         """Leave those poor, reusable databases alone if REUSE_DB is true."""
         if not _reusing_db():
             return super(NoseTestSuiteRunner, self).teardown_databases(*args, **kwargs)
-        # else skip tearing down the DB so we can reuse it next time
+        # else skip tearing down the DB so we can reuse it next time, but note
+        # that the tests left it clean:
+        _mark_databases("clean")
@@ -1,12 +1,27 @@
 # coding: utf-8
 """TestCases that enable extra django-nose functionality."""
+import time
+
 from django import test
 from django.conf import settings
 from django.core import cache, mail
 from django.core.management import call_command
 from django.db import connections, DEFAULT_DB_ALIAS, transaction
 
-from django_nose.fixture_tables import tables_used_by_fixtures
+from django_nose.compiled_fixtures import compiling_fixtures, load_compiled_fixtures
+from django_nose.fixture_profile import current_profile
+from django_nose.fixture_rows import (
+    delete_rows,
+    noting_added_rows,
+    record_added_rows,
+    rows_added_by,
+)
+from django_nose.fixture_snapshots import (
+    restore_fixture_snapshot,
+    save_fixture_snapshot,
+    snapshotting_fixtures,
+)
+from django_nose.fixture_tables import fixture_paths, tables_used_by_fixtures
 from django_nose.utils import uses_mysql
 
 
@@ -22,9 +37,9 @@ class FastFixtureTestCase(test.TransactionTestCase):
     in Django's standard TestCase), and each test is run. After each test, the
     monkeypatching is temporarily undone, and a rollback is issued, returning
     the DB content to the pristine fixture state. Finally, upon class teardown,
-    the DB is restored to a post-syncdb-like state by deleting the contents of
-    any table that had been touched by a fixture (keeping infrastructure tables
-    like django_content_type and auth_permission intact).
+    the DB is restored to a post-syncdb-like state by deleting the rows the
+    fixtures added (keeping infrastructure tables like django_content_type and
+    auth_permission, and rows that were there before, intact).
 
     Note that this is like Django's TestCase, not its TransactionTestCase, in
     that you cannot do your own commits or rollbacks from within tests.
@@ -65,59 +80,117 @@ class FastFixtureTestCase(test.TransactionTestCase):
     @classmethod
     def _fixture_setup(cls):
         """Load fixture data, and commit."""
+        fixtures = []
+        if hasattr(cls, "fixtures") and getattr(cls, "_fb_should_setup_fixtures", True):
+            # Iff the fixture-bundling test runner tells us we're the first
+            # suite having these fixtures, set them up. It may have left some
+            # of them loaded for us, in which case we add just the rest:
+            fixtures = getattr(cls, "_fb_fixtures_to_set_up", cls.fixtures)
+        profile = current_profile()
         for db in cls._databases():
-            if hasattr(cls, "fixtures") and getattr(
-                cls, "_fb_should_setup_fixtures", True
-            ):
-                # Iff the fixture-bundling test runner tells us we're the first
-                # suite having these fixtures, set them up:
+            if profile is not None and hasattr(cls, "fixtures"):
+                profile.bundled(cls.fixtures, fixtures, using=db)
+            if fixtures:
+                cls._load_fixtures(fixtures, db)
+            # No matter what, to preserve the effect of cursor start-up
+            # statements...
+            transaction.commit(using=db)
+
+    @classmethod
+    def _load_fixtures(cls, fixtures, db):
+        """Load some fixtures into a DB, from a snapshot if there is one."""
+        profile = current_profile()
+        start = time.time()
+        snapshotting = snapshotting_fixtures()
+        if snapshotting and restore_fixture_snapshot(fixtures, using=db):
+            if profile is not None:
+                rows = sum(len(pks) for pks in rows_added_by(fixtures, db).values())
+                profile.loaded(fixtures, time.time() - start, rows, using=db)
+            return
+        # Note what we add, so we can take just that away again, and what we
+        # write over, so a snapshot can write it again:
+        updated = {}
+        with noting_added_rows(using=db, updated=updated) as added:
+            # Compiled fixtures are much faster to load, when we're allowed
+            # and able to:
+            compiled = compiling_fixtures() and load_compiled_fixtures(
+                fixtures, using=db, added=added
+            )
+            if not compiled:
                 call_command(
                     "loaddata",
-                    *cls.fixtures,
+                    *fixture_paths(fixtures, using=db),
                     **{"verbosity": 0, "commit": False, "database": db}
                 )
-            # No matter what, to preserve the effect of cursor start-up
-            # statements...
-            transaction.commit(using=db)
+        record_added_rows(fixtures, added, using=db)
+        if compiled and profile is not None:
+            # loaddata's runs are timed by the profile itself.
+            rows = sum(len(pks) for pks in added.values())
+            profile.loaded(fixtures, time.time() - start, rows, using=db)
+        if snapshotting:
+            written = dict((model, set(pks)) for model, pks in added.items())
+            for model, pks in updated.items():
+                written.setdefault(model, set()).update(pks)
+            save_fixture_snapshot(fixtures, written, using=db)
 
     @classmethod
     def _fixture_teardown(cls):
-        """Empty (only) the tables we loaded fixtures into, then commit."""
+        """Delete (only) the rows our fixtures added, then commit."""
         if hasattr(cls, "fixtures") and getattr(
             cls, "_fb_should_teardown_fixtures", True
         ):
             # If the fixture-bundling test runner advises us that the next test
-            # suite is going to reuse these fixtures, don't tear them down.
+            # suite is going to reuse these fixtures, don't tear them down. It
+            # may advise us to tear down just some of them, in the groups they
+            # were loaded in.
+            groups = getattr(cls, "_fb_fixture_groups_to_tear_down", [cls.fixtures])
+            profile = current_profile()
             for db in cls._databases():
-                tables = tables_used_by_fixtures(cls.fixtures, using=db)
-                # TODO: Think about respecting _meta.db_tablespace, not just
-                # db_table.
-                if tables:
-                    connection = connections[db]
-                    cursor = connection.cursor()
-
-                    # TODO: Rather than assuming that anything added to by a
-                    # fixture can be emptied, remove only what the fixture
-                    # added. This would probably solve input.mozilla.com's
-                    # failures (since worked around) with Site objects; they
-                    # were loading additional Sites with a fixture, and then
-                    # the Django-provided example.com site was evaporating.
-                    if uses_mysql(connection):
-                        cursor.execute("SET FOREIGN_KEY_CHECKS=0")
-                        for table in tables:
-                            # Truncate implicitly commits.
-                            cursor.execute("TRUNCATE `%s`" % table)
-                        # TODO: necessary?
-                        cursor.execute("SET FOREIGN_KEY_CHECKS=1")
+                for fixtures in groups:
+                    start = time.time()
+                    # Removing only what the fixtures added leaves alone rows
+                    # that were there before, like the Django-provided
+                    # example.com Site, which used to evaporate when a fixture
+                    # added more.
+                    added = rows_added_by(fixtures, using=db)
+                    if added is not None:
+                        delete_rows(added, using=db)
                     else:
-                        for table in tables:
-                            cursor.execute("DELETE FROM %s" % table)
+                        cls._empty_fixture_tables(fixtures, db)
+                    if profile is not None:
+                        rows = sum(len(pks) for pks in (added or {}).values())
+                        profile.unloaded(fixtures, time.time() - start, rows, using=db)
 
                 transaction.commit(using=db)
                 # cursor.close()  # Should be unnecessary, since we committed
                 # any environment-setup statements that come with opening a new
                 # cursor when we committed the fixtures.
 
+    @classmethod
+    def _empty_fixture_tables(cls, fixtures, db):
+        """Empty the tables some fixtures loaded data into.
+
+        This is for when we didn't see the fixtures loaded, and so don't know
+        what rows they added.
+        """
+        tables = tables_used_by_fixtures(fixtures, using=db)
+        # TODO: Think about respecting _meta.db_tablespace, not just
+        # db_table.
+        if tables:
+            connection = connections[db]
+            cursor = connection.cursor()
+
+            if uses_mysql(connection):
+                cursor.execute("SET FOREIGN_KEY_CHECKS=0")
+                for table in tables:
+                    # Truncate implicitly commits.
+                    cursor.execute("TRUNCATE `%s`" % table)
+                # TODO: necessary?
+                cursor.execute("SET FOREIGN_KEY_CHECKS=1")
+            else:
+                for table in tables:
+                    cursor.execute("DELETE FROM %s" % table)
+
     def _pre_setup(self):
         """Disable transaction methods, and clear some globals."""
         # Repeat stuff from TransactionTestCase, because I'm not calling its
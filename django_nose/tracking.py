@@ -0,0 +1,126 @@
+# coding: utf-8
+"""Keep track of which tables tests write to.
+
+TransactionTestCases are cleaned up by flushing every table in the DB. On a
+schema with hundreds of tables, most of which a given test never touches, that
+is a lot of wasted work. A ``WriteTracker`` sits in a connection's execute
+wrappers, notes the tables each INSERT, UPDATE, DELETE, or TRUNCATE names, and
+lets the flush that follows a test empty only those.
+
+Each thread gets connections of its own, such as those of the server thread
+of a LiveServerTestCase, so trackers are attached to every connection as it's
+opened, through the ``connection_created`` signal, and shared by all the
+connections to a DB.
+"""
+import re
+import threading
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+__all__ = ("WriteTracker", "install_write_trackers", "write_tracker", "written_tables")
+
+# A possibly quoted table name, as Django writes them for every backend:
+_NAME = r"""[`"\[]?[^\s`"\]\(,;]+[`"\]]?"""
+_TABLE = r"(?P<tables>" + _NAME + ")"
+# TRUNCATE takes a comma-separated list of them:
+_TABLES = r"(?P<tables>" + _NAME + r"(?:\s*,\s*" + _NAME + r")*)"
+
+_WRITE_PATTERNS = [
+    re.compile(pattern, re.IGNORECASE)
+    for pattern in (
+        r"\s*INSERT\s+(?:OR\s+\w+\s+|IGNORE\s+)?INTO\s+" + _TABLE,
+        r"\s*REPLACE\s+INTO\s+" + _TABLE,
+        r"\s*UPDATE\s+(?:OR\s+\w+\s+|ONLY\s+)?" + _TABLE,
+        r"\s*DELETE\s+FROM\s+(?:ONLY\s+)?" + _TABLE,
+        r"\s*TRUNCATE\s+(?:TABLE\s+)?(?:ONLY\s+)?" + _TABLES,
+    )
+]
+
+# Statements starting like this may write to something. If we can't tell
+# what, we can't trust our list of written tables:
+_WRITE_VERBS = re.compile(
+    r"\s*(?:INSERT|REPLACE|UPDATE|DELETE|TRUNCATE|MERGE|COPY|WITH)\b",
+    re.IGNORECASE,
+)
+
+
+def written_tables(sql):
+    """Return the set of tables a SQL statement writes to, or None.
+
+    None means the statement writes, but we can't tell to which tables.
+    """
+    for pattern in _WRITE_PATTERNS:
+        match = pattern.match(sql)
+        if match:
+            return set(
+                name.strip().strip('`"[]') for name in match.group("tables").split(",")
+            )
+    if _WRITE_VERBS.match(sql):
+        return None
+    return set()
+
+
+class WriteTracker(object):
+    """Execute wrapper that records the tables written to through a connection.
+
+    ``tables`` holds the tables written to since the last ``reset()``. If a
+    statement wrote somewhere we couldn't make out, ``unsure`` is set, and the
+    only safe thing to do is flush everything. One tracker may sit in the
+    connections of several threads.
+    """
+
+    def __init__(self):
+        """Start with nothing written."""
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget what was written so far."""
+        with self._lock:
+            self.tables = set()
+            self.unsure = False
+
+    def __call__(self, execute, sql, params, many, context):
+        """Note the tables ``sql`` writes to, then run it."""
+        tables = written_tables(sql)
+        if tables is None:
+            with self._lock:
+                self.unsure = True
+        elif tables:
+            with self._lock:
+                self.tables.update(tables)
+        return execute(sql, params, many, context)
+
+
+# WriteTrackers by DB alias:
+_trackers = {}
+
+
+def _attach_tracker(sender, connection, **kwargs):
+    """Track writes on a connection, in whatever thread opened it."""
+    tracker = _trackers.get(connection.alias)
+    if tracker is not None and tracker not in connection.execute_wrappers:
+        connection.execute_wrappers.append(tracker)
+
+
+def install_write_trackers():
+    """Start tracking writes on every connection, if Django lets us.
+
+    That's this thread's connections now, and those of any thread as they're
+    opened. Execute wrappers appeared in Django 2.0; on older versions, this
+    does nothing, and ``write_tracker`` returns None for every alias.
+    """
+    for alias in connections:
+        connection = connections[alias]
+        if not hasattr(connection, "execute_wrappers"):
+            return
+        if alias not in _trackers:
+            _trackers[alias] = WriteTracker()
+        _attach_tracker(None, connection)
+    connection_created.connect(_attach_tracker, dispatch_uid="django_nose.tracking")
+
+
+def write_tracker(alias):
+    """Return the ``WriteTracker`` for a DB alias, or None if there isn't one."""
+    return _trackers.get(alias)
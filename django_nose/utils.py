@@ -1,5 +1,63 @@
 # coding: utf-8
 """django-nose utility methods."""
+import os
+import stat
+import tempfile
+
+# Where caches are kept between runs. Some of them are pickles, and anyone who
+# can write there can make us unpickle what they like, so each user gets a
+# directory of their own.
+CACHE_DIR = os.path.join(
+    tempfile.gettempdir(),
+    "django_nose_cache_%s" % (os.getuid() if hasattr(os, "getuid") else "user"),
+)
+
+
+def cache_dir():
+    """Return the directory to keep caches in, or None if it's unsafe.
+
+    The directory is made if need be. It has to be ours, and writable by
+    nobody else.
+    """
+    try:
+        os.mkdir(CACHE_DIR, 0o700)
+    except OSError:
+        pass
+    try:
+        info = os.lstat(CACHE_DIR)
+    except OSError:
+        return None
+    if not stat.S_ISDIR(info.st_mode) or info.st_mode & 0o022:
+        return None
+    if hasattr(os, "getuid") and info.st_uid != os.getuid():
+        return None
+    return CACHE_DIR
+
+
+def _atomic_write(path, write, mode="w"):
+    """Replace a file with what ``write`` writes, all at once.
+
+    ``write`` is called with the file opened in ``mode`` next to its final
+    place, or with that file's path if ``mode`` is None, and the file is then
+    moved over ``path``, so nobody ever reads half of it. Errors are raised
+    once the partial file is gone.
+    """
+    partial_path = "%s.%d.partial" % (path, os.getpid())
+    try:
+        if mode is None:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            write(partial_path)
+        else:
+            with open(partial_path, mode) as partial_file:
+                write(partial_file)
+        os.replace(partial_path, path)
+    except BaseException:
+        try:
+            os.remove(partial_path)
+        except OSError:
+            pass
+        raise
 
 
 def process_tests(suite, process):
@@ -21,19 +79,29 @@ def process_tests(suite, process):
     limit the granularity of bucketing to the first level that has setups or
     teardowns.
 
+    The tree is walked with a stack of iterators rather than by recursion, so
+    however deeply suites nest, we don't hit the recursion limit.
+
     :arg process: The thing to call once we get to a leaf or a test with setup
         or teardown
     """
-    if not hasattr(suite, "_tests") or (
-        hasattr(suite, "hasFixtures") and suite.hasFixtures()
-    ):
-        # We hit a Test or something with setup, so do the thing. (Note that
-        # "fixtures" here means setup or teardown routines, not Django
-        # fixtures.)
-        process(suite)
-    else:
-        for t in suite._tests:
-            process_tests(t, process)
+    stack = [iter([suite])]
+    while stack:
+        for t in stack[-1]:
+            if not hasattr(t, "_tests") or (
+                hasattr(t, "hasFixtures") and t.hasFixtures()
+            ):
+                # We hit a Test or something with setup, so do the thing.
+                # (Note that "fixtures" here means setup or teardown routines,
+                # not Django fixtures.)
+                process(t)
+            else:
+                # Go into the suite, and come back to the rest of this level
+                # once it's done:
+                stack.append(iter(t._tests))
+                break
+        else:
+            stack.pop()
 
 
 def is_subclass_at_all(cls, class_info):
@@ -161,16 +161,42 @@ export NOSE_PLUGINS="testapp.plugins.SanityCheckPlugin"
 django_test "./manage.py test testapp/plugin_t $NOINPUT" 1 'with plugins'
 
 reset_env
-django_test "./manage.py test unittests $NOINPUT" 4 'unittests'
+django_test "./manage.py test --parallel 2 $NOINPUT" $TESTAPP_COUNT 'with --parallel 2'
+
+xunit_summary() {
+    XUNIT_FILE=`mktemp 2>/dev/null || mktemp -t 'django-nose-runtests'`
+    ./manage.py test $NOINPUT --with-xunit --xunit-file=$XUNIT_FILE $1 >/dev/null 2>&1
+    grep -o '<testsuite [^>]*>' $XUNIT_FILE
+    rm $XUNIT_FILE
+}
+
+reset_env
+SERIAL_XUNIT=`xunit_summary`
+PARALLEL_XUNIT=`xunit_summary "--parallel 2"`
+if [ "$SERIAL_XUNIT" == "$PARALLEL_XUNIT" ]
+then
+    echo "PASS (xunit): plugins hear of tests run with --parallel 2"
+else
+    echo "FAIL (xunit): plugins hear of tests run with --parallel 2"
+    echo "serial:   $SERIAL_XUNIT"
+    echo "parallel: $PARALLEL_XUNIT"
+    exit 1
+fi
+
+reset_env
+django_test "./manage.py test unittests $NOINPUT" 116 'unittests'
+
+reset_env
+django_test "./manage.py test unittests --parallel 2 $NOINPUT" 116 'unittests with --parallel 2'
 
 reset_env
-django_test "./manage.py test unittests --verbosity 1 $NOINPUT" 4 'argument option without equals'
+django_test "./manage.py test unittests --verbosity 1 $NOINPUT" 116 'argument option without equals'
 
 reset_env
-django_test "./manage.py test unittests --nose-verbosity=2 $NOINPUT" 4 'argument with equals'
+django_test "./manage.py test unittests --nose-verbosity=2 $NOINPUT" 116 'argument with equals'
 
 reset_env
-django_test "./manage.py test unittests --testrunner=testapp.custom_runner.CustomNoseTestSuiteRunner $NOINPUT" 4 'unittests with testrunner'
+django_test "./manage.py test unittests --testrunner=testapp.custom_runner.CustomNoseTestSuiteRunner $NOINPUT" 116 'unittests with testrunner'
 
 reset_env
 django_test "./manage.py test unittests --attr special $NOINPUT" 1 'select by attribute'
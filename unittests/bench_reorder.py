@@ -0,0 +1,192 @@
+"""Time flattening and reordering synthetic trees of tests, old way and new.
+
+Run from the top of the checkout::
+
+    python unittests/bench_reorder.py [number of tests ...]
+
+By default, trees of 10,000, 50,000, and 100,000 tests are timed. The trees
+have packages of modules of classes, like a big project's, with a mix of
+TestCases, TransactionTestCases, and FastFixtureTestCases sharing a few sets
+of fixtures. Each step is timed, best of three with the garbage collector
+off, with the current code and with the recursive flattening and sorting it
+replaced, which are copied here; the "old" prepareTest is the current one with
+those two put back. A suite nested far deeper than the recursion limit is
+flattened, too.
+"""
+import gc
+import os
+import sys
+import time
+import types
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "testapp.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.test import TestCase, TransactionTestCase  # noqa: E402
+from nose.suite import ContextSuite  # noqa: E402
+
+from django_nose import plugin  # noqa: E402
+from django_nose.testcases import FastFixtureTestCase  # noqa: E402
+from django_nose.utils import is_subclass_at_all, process_tests  # noqa: E402
+
+TESTS_PER_CLASS = 10
+CLASSES_PER_MODULE = 10
+MODULES_PER_PACKAGE = 10
+FIXTURE_SETS = [["a"], ["a", "b"], ["c"], ["a", "b", "c"]]
+DEFAULT_SIZES = [10000, 50000, 100000]
+
+
+def _test(self):
+    pass
+
+
+def synthetic_tree(test_count):
+    """Return a ContextSuite of about ``test_count`` tests."""
+    bases = [TestCase, TransactionTestCase, FastFixtureTestCase]
+    packages = []
+    modules = []
+    for m in range(test_count // (TESTS_PER_CLASS * CLASSES_PER_MODULE)):
+        module = types.ModuleType("bench_package_%d.module_%d" % (len(packages), m))
+        classes = []
+        for c in range(CLASSES_PER_MODULE):
+            attrs = dict(("test_%d" % i, _test) for i in range(TESTS_PER_CLASS))
+            attrs["__module__"] = module.__name__
+            attrs["fixtures"] = FIXTURE_SETS[(m + c) % len(FIXTURE_SETS)]
+            cls = type("Bench%d" % c, (bases[c % len(bases)],), attrs)
+            tests = [cls("test_%d" % i) for i in range(TESTS_PER_CLASS)]
+            classes.append(ContextSuite(tests, context=cls))
+        modules.append(ContextSuite(classes, context=module))
+        if len(modules) == MODULES_PER_PACKAGE:
+            packages.append(ContextSuite(modules))
+            modules = []
+    if modules:
+        packages.append(ContextSuite(modules))
+    return ContextSuite(packages)
+
+
+def deep_tree(depth):
+    """Return a test nested in ``depth`` suites."""
+    suite = ContextSuite([TestCase("__init__")])
+    for _ in range(depth):
+        suite = ContextSuite([suite])
+    return suite
+
+
+def old_process_tests(suite, process):
+    """Flatten a tree of suites by recursion, as process_tests used to."""
+    if not hasattr(suite, "_tests") or (
+        hasattr(suite, "hasFixtures") and suite.hasFixtures()
+    ):
+        process(suite)
+    else:
+        for t in suite._tests:
+            old_process_tests(t, process)
+
+
+def old_put_transaction_test_cases_last(test):
+    """Flatten a tree of suites, and sort it by filthiness, as we used to."""
+
+    def filthiness(test):
+        test_class = test.context
+        if is_subclass_at_all(test_class, TestCase) or (
+            is_subclass_at_all(test_class, TransactionTestCase)
+            and getattr(test_class, "cleans_up_after_itself", False)
+        ):
+            return 1
+        return 2
+
+    flattened = []
+    old_process_tests(test, flattened.append)
+    flattened.sort(key=filthiness)
+    return ContextSuite(flattened)
+
+
+def _seconds(function, repeat=3):
+    """Return the least time a call takes, or the name of what it raised."""
+    times = []
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.time()
+            function()
+            times.append(time.time() - start)
+    except RecursionError as exc:
+        return type(exc).__name__
+    finally:
+        gc.enable()
+    return min(times)
+
+
+def _report(what, test_count, old, new):
+    def cell(seconds):
+        if isinstance(seconds, str):
+            return "%14s %12s" % (seconds, "")
+        return "%13.3fs %10.2fus" % (seconds, seconds * 1e6 / test_count)
+
+    print("%-40s %8d  %s  %s" % (what, test_count, cell(old), cell(new)))
+
+
+def _reorderer():
+    reorderer = plugin.TestReorderer()
+    reorderer.should_bundle = True
+    reorderer.bundling_strategy = "containment"
+    reorderer.duration_order = None
+    reorderer.changed_since = None
+    reorderer.shard = None
+    reorderer.failed_first = False
+    reorderer.parallel = 1
+    return reorderer
+
+
+def _old_prepare_test(tree):
+    reorderer = _reorderer()
+    reorderer._put_transaction_test_cases_last = old_put_transaction_test_cases_last
+    with mock.patch.object(plugin, "process_tests", old_process_tests):
+        reorderer.prepareTest(tree)
+
+
+def main(sizes):
+    """Time each step, and the whole of TestReorderer.prepareTest, per size."""
+    print(
+        "%-40s %8s  %14s %12s  %14s %12s"
+        % ("", "tests", "old", "per test", "new", "per test")
+    )
+    for test_count in sizes:
+        tree = synthetic_tree(test_count)
+        _report(
+            "flatten",
+            test_count,
+            _seconds(lambda: old_process_tests(tree, id)),
+            _seconds(lambda: process_tests(tree, id)),
+        )
+        _report(
+            "put TransactionTestCases last",
+            test_count,
+            _seconds(lambda: old_put_transaction_test_cases_last(tree)),
+            _seconds(lambda: _reorderer()._put_transaction_test_cases_last(tree)),
+        )
+        _report(
+            "prepareTest, with fixture bundling",
+            test_count,
+            _seconds(lambda: _old_prepare_test(tree)),
+            _seconds(lambda: _reorderer().prepareTest(tree)),
+        )
+
+    depth = sys.getrecursionlimit() * 10
+    tree = deep_tree(depth)
+    # Per suite, rather than per test, for this one:
+    _report(
+        "flatten a test %d suites deep" % depth,
+        depth,
+        _seconds(lambda: old_process_tests(tree, id)),
+        _seconds(lambda: process_tests(tree, id)),
+    )
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
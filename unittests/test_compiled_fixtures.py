@@ -0,0 +1,128 @@
+"""Test compiling fixtures and loading them in bulk."""
+import datetime
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from django_nose import compiled_fixtures, utils
+from django_nose.compiled_fixtures import compile_fixture, load_compiled_fixtures
+from testapp.models import Choice, Question
+
+FIXTURE = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "testapp", "fixtures", "testdata.json"
+)
+
+
+class CompiledFixturesTests(TestCase):
+    """Test compiled_fixtures on the SQLite test DB."""
+
+    def setUp(self):
+        """Keep compiled fixtures in a temporary directory."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.patcher = mock.patch.object(
+            utils, "CACHE_DIR", os.path.join(self.temp_dir, "compiled")
+        )
+        self.patcher.start()
+        compiled_fixtures._compiled.clear()
+
+    def tearDown(self):
+        """Remove the loaded objects and the compiled fixtures."""
+        Choice.objects.all().delete()
+        Question.objects.all().delete()
+        self.patcher.stop()
+        compiled_fixtures._compiled.clear()
+        shutil.rmtree(self.temp_dir)
+
+    def test_compile(self):
+        """Objects are deserialized and grouped by model."""
+        compiled = compile_fixture(FIXTURE, "json")
+        models = dict((label, rows) for label, _, rows, _ in compiled["models"])
+        self.assertEqual(
+            models["testapp.question"],
+            [(1, "What is your favorite color?", datetime.datetime(1975, 4, 9))],
+        )
+        self.assertEqual(models["testapp.choice"], [(1, 1, "Blue.", 3)])
+
+    def test_cached_on_disk(self):
+        """A compiled fixture is read back from disk rather than compiled again."""
+        compiled = compile_fixture(FIXTURE, "json")
+        compiled_fixtures._compiled.clear()
+        with mock.patch.object(compiled_fixtures, "_compile") as compile:
+            self.assertEqual(compile_fixture(FIXTURE, "json"), compiled)
+        self.assertFalse(compile.called)
+
+    def test_type_changed(self):
+        """A compiled fixture is stale once one of its columns changes type."""
+        compiled = compile_fixture(FIXTURE, "json")
+        self.assertTrue(compiled_fixtures._is_current(compiled))
+        compiled["types"]["testapp.choice"][-1] = "CharField"
+        self.assertFalse(compiled_fixtures._is_current(compiled))
+
+    def test_defaults_at_load(self):
+        """Fields a fixture leaves out get their defaults when it's loaded."""
+        path = os.path.join(self.temp_dir, "defaults.json")
+        with open(path, "w") as fixture:
+            json.dump(
+                [
+                    {
+                        "model": "testapp.question",
+                        "pk": 1,
+                        "fields": {"question_text": "Why?", "pub_date": "2000-01-01"},
+                    },
+                    {
+                        "model": "testapp.choice",
+                        "pk": 1,
+                        "fields": {"question": 1, "choice_text": "Because."},
+                    },
+                ],
+                fixture,
+            )
+        compiled = compile_fixture(path, "json")
+        rows = dict((label, rows) for label, _, rows, _ in compiled["models"])
+        self.assertIs(rows["testapp.choice"][0][-1], compiled_fixtures._Missing)
+        votes = Choice._meta.get_field("votes")
+        with mock.patch.object(votes, "get_default", return_value=7):
+            with mock.patch.object(
+                compiled_fixtures,
+                "find_fixture_files",
+                return_value=[(path, "json", None)],
+            ):
+                self.assertTrue(load_compiled_fixtures(["defaults"]))
+        self.assertEqual(Choice.objects.get().votes, 7)
+
+    def test_natural_keys(self):
+        """Fixtures with natural keys aren't compiled."""
+        path = os.path.join(self.temp_dir, "natural.json")
+        with open(path, "w") as fixture:
+            json.dump(
+                [
+                    {
+                        "model": "testapp.choice",
+                        "pk": 1,
+                        "fields": {"question": ["Why?"], "choice_text": "Because."},
+                    }
+                ],
+                fixture,
+            )
+        self.assertIsNone(compile_fixture(path, "json"))
+
+    def test_load(self):
+        """Loading a fixture twice leaves one copy of each object."""
+        self.assertTrue(load_compiled_fixtures(["testdata"]))
+        self.assertTrue(load_compiled_fixtures(["testdata"]))
+        self.assertEqual(
+            Question.objects.get().question_text, "What is your favorite color?"
+        )
+        self.assertEqual(Choice.objects.get().question_id, 1)
+
+    def test_added(self):
+        """The rows inserted in bulk are noted, by model."""
+        added = {}
+        load_compiled_fixtures(["testdata"], added=added)
+        self.assertEqual(added, {Question: set([1]), Choice: set([1])})
+
+    def test_missing(self):
+        """A fixture that doesn't exist is left to loaddata."""
+        self.assertFalse(load_compiled_fixtures(["no_such_fixture"]))
@@ -1,14 +1,39 @@
 """Test database access without a database."""
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
 from contextlib import contextmanager
-from unittest import TestCase
+from unittest import TestCase, mock
 
 try:
     from django.db.models.loading import cache as apps
 except ImportError:
     from django.apps import apps
 
+from django.db import connections
 from nose.plugins.attrib import attr
+from django_nose import databases, runner
+from django_nose.databases import (
+    METADATA_TABLE,
+    DatabasePool,
+    changed_tables,
+    clone_database,
+    connect_to,
+    database_exists,
+    moved_sequences,
+    prune_snapshots,
+    record_row_counts,
+    record_sequence_positions,
+    restore_snapshot,
+    save_snapshot,
+    schema_fingerprint,
+    sqlite_sequence_reset_sql,
+    template_db_name,
+)
 from django_nose.runner import NoseTestSuiteRunner
+from testapp.models import Question
 
 
 class GetModelsForConnectionTests(TestCase):
@@ -81,3 +106,390 @@ class GetModelsForConnectionTests(TestCase):
                 for m in self.runner._get_models_for_connection(connection)
             ]
         self.assertEqual(result_tables, self.tables)
+
+
+class SchemaFingerprintTests(TestCase):
+    """Test databases.schema_fingerprint."""
+
+    def setUp(self):
+        """Get the default connection."""
+        self.connection = connections["default"]
+
+    def test_stable(self):
+        """The fingerprint doesn't change if the schema doesn't."""
+        self.assertEqual(
+            schema_fingerprint(self.connection), schema_fingerprint(self.connection)
+        )
+
+    def test_model_change(self):
+        """Removing a model changes the fingerprint."""
+        before = schema_fingerprint(self.connection)
+        models = apps.get_models(include_auto_created=True)
+
+        old = apps.get_models
+        apps.get_models = lambda *args, **kwargs: models[1:]
+        databases._fingerprints.clear()
+        try:
+            after = schema_fingerprint(self.connection)
+        finally:
+            apps.get_models = old
+            databases._fingerprints.clear()
+        self.assertNotEqual(before, after)
+
+    def test_memoized(self):
+        """The migrations and models are looked at once per process."""
+        schema_fingerprint(self.connection)
+        with mock.patch.object(databases, "_migration_state") as migration_state:
+            with mock.patch.object(databases, "_model_state") as model_state:
+                schema_fingerprint(self.connection)
+        self.assertFalse(migration_state.called)
+        self.assertFalse(model_state.called)
+
+
+class DropStaleDatabaseTests(TestCase):
+    """Test runner._drop_stale_database."""
+
+    def test_drop(self):
+        """A stale test DB is dropped without asking."""
+        connection = mock.Mock(settings_dict={"NAME": "test_stale"})
+        runner._drop_stale_database(connection, 0)
+        self.assertTrue(connection.close.called)
+        connection.creation._destroy_test_db.assert_called_once_with("test_stale", 0)
+
+
+class CleanUpAfterCrashTests(TestCase):
+    """Test runner._clean_up_after_crash."""
+
+    def _clean_up(self, changed, other_counts):
+        connection = mock.MagicMock()
+        connection.introspection.table_names.return_value = [
+            "testapp_question",
+            "testapp_choice",
+        ]
+        connection.ops.sql_flush.return_value = []
+        with mock.patch.object(runner, "read_metadata", return_value="dirty"):
+            with mock.patch.object(runner, "changed_tables", return_value=changed):
+                with mock.patch.object(
+                    runner, "row_counts", return_value=other_counts
+                ) as counts:
+                    with mock.patch.object(runner, "transaction"):
+                        clean = runner._clean_up_after_crash(connection, 0)
+        return clean, connection, counts
+
+    def test_referencing_tables(self):
+        """Tables referring to the emptied ones are emptied with them."""
+        clean, connection, counts = self._clean_up(
+            {"testapp_question": (0, 1)}, {"testapp_choice": 0}
+        )
+        self.assertTrue(clean)
+        counts.assert_called_once_with(connection, ["testapp_choice"])
+        connection.ops.sql_flush.assert_called_once_with(
+            mock.ANY, ["testapp_choice", "testapp_question"], []
+        )
+
+    def test_referencing_rows(self):
+        """If a referring table has rows of its own, the DB is rebuilt."""
+        clean, connection, _ = self._clean_up(
+            {"testapp_question": (0, 1)}, {"testapp_choice": 2}
+        )
+        self.assertFalse(clean)
+        self.assertFalse(connection.ops.sql_flush.called)
+
+
+def _set_aside_metadata(connection):
+    """Empty the metadata table, and return what was in it, if it exists.
+
+    The unit tests share their DB with the REUSE_DB runs of runtests.sh, whose
+    metadata has to survive them.
+    """
+    if METADATA_TABLE not in connection.introspection.table_names():
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name, value FROM %s" % METADATA_TABLE)
+        rows = cursor.fetchall()
+        cursor.execute("DELETE FROM %s" % METADATA_TABLE)
+    return rows
+
+
+def _put_back_metadata(connection, rows):
+    """Put the metadata table back the way ``_set_aside_metadata`` found it."""
+    with connection.cursor() as cursor:
+        if rows is None:
+            cursor.execute("DROP TABLE IF EXISTS %s" % METADATA_TABLE)
+            return
+        cursor.execute("DELETE FROM %s" % METADATA_TABLE)
+        cursor.executemany(
+            "INSERT INTO %s (name, value) VALUES (%%s, %%s)" % METADATA_TABLE, rows
+        )
+
+
+class MovedSequencesTests(TestCase):
+    """Test databases.moved_sequences on the SQLite test DB."""
+
+    def setUp(self):
+        """Make a table with an auto-increment sequence, and no metadata."""
+        self.connection = connections["default"]
+        self.metadata = _set_aside_metadata(self.connection)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TABLE sequence_test "
+                "(id integer NOT NULL PRIMARY KEY AUTOINCREMENT)"
+            )
+
+    def tearDown(self):
+        """Drop the table, and put back the metadata from before."""
+        with self.connection.cursor() as cursor:
+            cursor.execute("DROP TABLE sequence_test")
+        _put_back_metadata(self.connection, self.metadata)
+
+    def _insert_row(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute("INSERT INTO sequence_test DEFAULT VALUES")
+
+    def test_moved(self):
+        """Only tables that got new rows since recording have moved."""
+        self._insert_row()
+        record_sequence_positions(self.connection)
+        self.assertEqual(moved_sequences(self.connection), set())
+        self._insert_row()
+        self.assertEqual(moved_sequences(self.connection), set(["sequence_test"]))
+
+    def test_reset(self):
+        """Moved SQLite sequences are put back where they were recorded."""
+        self._insert_row()
+        record_sequence_positions(self.connection)
+        self._insert_row()
+        self._insert_row()
+        with self.connection.cursor() as cursor:
+            for statement in sqlite_sequence_reset_sql(
+                self.connection, moved_sequences(self.connection)
+            ):
+                cursor.execute(statement)
+        self.assertEqual(moved_sequences(self.connection), set())
+
+    def test_unrecorded(self):
+        """Without a high-water mark, we can't tell what moved."""
+        record_sequence_positions(self.connection)
+        with self.connection.cursor() as cursor:
+            cursor.execute("DELETE FROM %s" % METADATA_TABLE)
+        self.assertIsNone(moved_sequences(self.connection))
+
+
+class ChangedTablesTests(TestCase):
+    """Test databases.changed_tables on the SQLite test DB."""
+
+    def setUp(self):
+        """Get the default connection, with no metadata."""
+        self.connection = connections["default"]
+        self.metadata = _set_aside_metadata(self.connection)
+
+    def tearDown(self):
+        """Remove the junk, and put back the metadata from before."""
+        Question.objects.all().delete()
+        _put_back_metadata(self.connection, self.metadata)
+
+    def test_unrecorded(self):
+        """Without a baseline, we can't tell what changed."""
+        self.assertIsNone(changed_tables(self.connection))
+
+    def test_changed(self):
+        """Tables with more or fewer rows than the baseline are reported."""
+        record_row_counts(self.connection)
+        self.assertEqual(changed_tables(self.connection), {})
+        Question.objects.create(question_text="Junk?", pub_date="2020-01-01")
+        self.assertEqual(
+            changed_tables(self.connection), {"testapp_question": (0, 1)}
+        )
+
+
+class SQLiteCloneTests(TestCase):
+    """Test cloning SQLite test DBs to and from their templates."""
+
+    def _connection_mock(self):
+        class FakeConnection(object):
+            vendor = "sqlite"
+
+        return FakeConnection()
+
+    def setUp(self):
+        """Make a scratch directory."""
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Remove the scratch directory."""
+        shutil.rmtree(self.dir)
+
+    def test_template_name(self):
+        """The template lives next to the test DB, with the same extension."""
+        self.assertEqual(
+            template_db_name(self._connection_mock(), "/tmp/test.db"),
+            "/tmp/test_template.db",
+        )
+
+    def test_exists(self):
+        """A SQLite DB exists if its file does, and probing doesn't create it."""
+        name = os.path.join(self.dir, "test.db")
+        self.assertFalse(database_exists(self._connection_mock(), name))
+        self.assertFalse(os.path.exists(name))
+        sqlite3.connect(name).close()
+        self.assertTrue(database_exists(self._connection_mock(), name))
+
+    def test_snapshot(self):
+        """An in-memory DB survives a round-trip through a snapshot file."""
+        path = os.path.join(self.dir, "snapshot.db")
+        memory_db = connect_to(
+            connections["default"], "file:memorydb_snapshot?mode=memory&cache=shared"
+        )
+        with memory_db.cursor() as cursor:
+            cursor.execute("CREATE TABLE snapshot_table (value TEXT)")
+            cursor.execute("INSERT INTO snapshot_table VALUES ('saved')")
+        save_snapshot(memory_db, path)
+        memory_db.close()
+
+        restored = connect_to(
+            connections["default"], "file:memorydb_restored?mode=memory&cache=shared"
+        )
+        try:
+            restore_snapshot(restored, path)
+            with restored.cursor() as cursor:
+                cursor.execute("SELECT value FROM snapshot_table")
+                rows = cursor.fetchall()
+        finally:
+            restored.close()
+        self.assertEqual(rows, [("saved",)])
+
+    def test_snapshot_path(self):
+        """Snapshots go in the cache directory, and older ones are pruned."""
+        connection = connections["default"]
+        with mock.patch("django_nose.utils.CACHE_DIR", os.path.join(self.dir, "c")):
+            path = databases.snapshot_path(connection)
+            self.assertEqual(os.path.dirname(path), os.path.join(self.dir, "c"))
+            old_path = path.replace(path[-24:-8], "0" * 16)
+            other_alias = os.path.join(self.dir, "c", "snapshot_other_%s" % path[-24:])
+            for name in (path, old_path, other_alias):
+                open(name, "w").close()
+            prune_snapshots(connection, path)
+            self.assertEqual(
+                sorted(os.listdir(os.path.join(self.dir, "c"))),
+                sorted([os.path.basename(path), os.path.basename(other_alias)]),
+            )
+
+    def test_snapshot_path_unsafe(self):
+        """Without a safe cache directory, no snapshot is kept."""
+        with mock.patch("django_nose.databases.cache_dir", return_value=None):
+            self.assertIsNone(databases.snapshot_path(connections["default"]))
+
+    def test_clone(self):
+        """The clone replaces the target DB with the source's contents."""
+        source = os.path.join(self.dir, "source.db")
+        target = os.path.join(self.dir, "target.db")
+        for name, value in ((source, "source"), (target, "target")):
+            db = sqlite3.connect(name)
+            db.execute("CREATE TABLE %s_table (value TEXT)" % value)
+            db.execute("INSERT INTO %s_table VALUES ('%s')" % (value, value))
+            db.commit()
+            db.close()
+
+        clone_database(self._connection_mock(), source, target)
+
+        db = sqlite3.connect(target)
+        tables = [r[0] for r in db.execute("SELECT name FROM sqlite_master")]
+        rows = list(db.execute("SELECT value FROM source_table"))
+        db.close()
+        self.assertEqual(tables, ["source_table"])
+        self.assertEqual(rows, [("source",)])
+
+
+class DatabasePoolTests(TestCase):
+    """Test databases.DatabasePool."""
+
+    def setUp(self):
+        """Keep the pool in a scratch directory."""
+        self.dir = tempfile.mkdtemp()
+        self.pool = DatabasePool(connections["default"], "test_db")
+        self.pool.path = os.path.join(self.dir, "pool.json")
+        connection = connections["default"]
+        self.names = dict(
+            (letter, databases.pooled_db_name(connection, "test_db", letter * 40))
+            for letter in "abc"
+        )
+
+    def tearDown(self):
+        """Remove the scratch directory."""
+        shutil.rmtree(self.dir)
+
+    def test_fits(self):
+        """Nothing is evicted while the pool has room."""
+        names = self.names
+        self.assertEqual(self.pool.use(names["a"], 2), [])
+        self.assertEqual(self.pool.use(names["b"], 2), [])
+        self.assertEqual(self.pool.use(names["a"], 2), [])
+
+    def test_least_recently_used(self):
+        """The DB used longest ago is evicted first."""
+        names = self.names
+        for letter in "aba":
+            self.pool.use(names[letter], 3)
+        self.assertEqual(self.pool.use(names["c"], 1), [names["b"], names["a"]])
+
+    def test_planted_names(self):
+        """Names of anything but pooled DBs for the test DB are never evicted."""
+        with open(self.pool.path, "w") as pool_file:
+            json.dump(
+                {"production": 1, "test_db_template": 2, self.names["a"]: 3}, pool_file
+            )
+        self.assertEqual(self.pool.use(self.names["b"], 1), [self.names["a"]])
+
+    def test_corrupt(self):
+        """A pool file that isn't a dict of counts is ignored."""
+        with open(self.pool.path, "w") as pool_file:
+            json.dump(["production"], pool_file)
+        self.assertEqual(self.pool.use(self.names["a"], 1), [])
+
+    def test_no_cache_dir(self):
+        """Without a safe place to keep the pool, nothing is evicted."""
+        self.pool.path = None
+        self.assertEqual(self.pool.use(self.names["a"], 0), [])
+
+
+class TestDBDependenciesTests(TestCase):
+    """Test runner._test_db_dependencies."""
+
+    def _connection_mock(self, signature, test_settings):
+        class FakeCreation(object):
+            def test_db_signature(self):
+                return signature
+
+        class FakeConnection(object):
+            creation = FakeCreation()
+            settings_dict = {"TEST": test_settings}
+
+        return FakeConnection()
+
+    @contextmanager
+    def _connections_mock(self, **aliases):
+        old = runner.connections
+        runner.connections = dict(
+            (alias, self._connection_mock(*spec)) for alias, spec in aliases.items()
+        )
+        yield dict((spec[0], (alias, [alias])) for alias, spec in aliases.items())
+        runner.connections = old
+
+    def test_implicit_default(self):
+        """Without DEPENDENCIES, other DBs wait for the default DB."""
+        with self._connections_mock(default=("a", {}), other=("b", {})) as dbs:
+            self.assertEqual(
+                runner._test_db_dependencies(dbs), {"a": set(), "b": set(["a"])}
+            )
+
+    def test_explicit_dependencies(self):
+        """DEPENDENCIES replaces the implicit dependency on the default DB."""
+        with self._connections_mock(
+            default=("a", {}),
+            other=("b", {"DEPENDENCIES": []}),
+            third=("c", {"DEPENDENCIES": ["other"]}),
+        ) as dbs:
+            self.assertEqual(
+                runner._test_db_dependencies(dbs),
+                {"a": set(), "b": set(), "c": set(["b"])},
+            )
@@ -0,0 +1,80 @@
+"""Test profiling fixture loading."""
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from django.core.management import call_command
+from django.core.management.commands import loaddata
+
+from django_nose.fixture_profile import FixtureProfile, current_profile
+from testapp.models import Choice, Question
+
+FIXTURE = os.path.join("testapp", "fixtures", "testdata.json")
+
+
+class FixtureProfileTests(TestCase):
+    """Test fixture_profile.FixtureProfile."""
+
+    def setUp(self):
+        """Start a profile."""
+        self.profile = FixtureProfile()
+        self.profile.start()
+
+    def tearDown(self):
+        """Stop the profile, if need be, and remove the loaded objects."""
+        if current_profile() is self.profile:
+            self.profile.stop()
+        Choice.objects.all().delete()
+        Question.objects.all().delete()
+
+    def test_loaddata(self):
+        """Runs of loaddata are timed, and the rows they load counted."""
+        call_command("loaddata", "testdata", verbosity=0)
+        stats = self.profile.fixtures[os.path.relpath(os.path.abspath(FIXTURE))]
+        self.assertEqual((stats["loads"], stats["rows_loaded"]), (1, 2))
+
+    def test_stop(self):
+        """Stopping puts loaddata back the way it was."""
+        self.profile.stop()
+        self.assertIsNone(current_profile())
+        self.assertEqual(loaddata.Command.load_label.__name__, "load_label")
+
+    def test_bundled(self):
+        """Fixtures a class didn't have to load are bundle hits."""
+        self.profile.bundled(["testdata"], [])
+        self.profile.bundled(["testdata"], ["testdata"])
+        stats = self.profile.fixtures[FIXTURE]
+        self.assertEqual((stats["bundle_hits"], stats["bundle_misses"]), (1, 1))
+
+    def test_merge(self):
+        """A worker's profile, as taken, adds to the parent's."""
+        worker = FixtureProfile()
+        worker.loaded(["testdata"], 1.0, 2)
+        worker.flushes = 1
+        self.profile.loaded(["testdata"], 1.0, 2)
+        self.profile.merge(worker.take())
+        stats = self.profile.fixtures[FIXTURE]
+        self.assertEqual((stats["loads"], stats["rows_loaded"]), (2, 4))
+        self.assertEqual(self.profile.flushes, 1)
+        self.assertEqual(worker.fixtures, {})
+
+    def test_report(self):
+        """The summary lists the costliest fixtures first; the file has all."""
+        self.profile.loaded(["both"], 0.5, 10)
+        self.profile.loaded(["load"], 1.0, 10)
+        self.profile.unloaded(["both"], 1.0, 10)
+        lines = self.profile.summary()
+        self.assertTrue(lines[1].endswith("both"))
+        self.assertTrue(lines[2].endswith("load"))
+
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, "profile.json")
+            self.profile.write(path)
+            with open(path) as profile_file:
+                written = json.load(profile_file)
+        finally:
+            shutil.rmtree(temp_dir)
+        self.assertEqual(written["fixtures"]["load"]["load_seconds"], 1.0)
@@ -0,0 +1,41 @@
+"""Test removing just the rows fixtures added."""
+from unittest import TestCase
+
+from django.core.management import call_command
+
+from django_nose.fixture_rows import delete_rows, noting_added_rows
+from testapp.models import Choice, Question
+
+
+class FixtureRowsTests(TestCase):
+    """Test fixture_rows on the SQLite test DB."""
+
+    def tearDown(self):
+        """Remove the loaded objects."""
+        Choice.objects.all().delete()
+        Question.objects.all().delete()
+
+    def test_noted(self):
+        """The rows loaddata inserts are noted, by model."""
+        with noting_added_rows() as added:
+            call_command("loaddata", "testdata", verbosity=0)
+        self.assertEqual(added, {Question: set([1]), Choice: set([1])})
+
+    def test_saved_over(self):
+        """Rows that were there already are noted as updated, not added."""
+        Question.objects.create(pk=1, question_text="Old?", pub_date="2020-01-01")
+        updated = {}
+        with noting_added_rows(updated=updated) as added:
+            call_command("loaddata", "testdata", verbosity=0)
+        self.assertEqual(added, {Choice: set([1])})
+        self.assertEqual(updated, {Question: set([1])})
+
+    def test_delete(self):
+        """Just the given rows are deleted."""
+        question = Question.objects.create(
+            pk=2, question_text="Kept?", pub_date="2020-01-01"
+        )
+        call_command("loaddata", "testdata", verbosity=0)
+        delete_rows({Question: set([1]), Choice: set([1])})
+        self.assertEqual(list(Question.objects.all()), [question])
+        self.assertFalse(Choice.objects.exists())
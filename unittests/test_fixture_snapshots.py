@@ -0,0 +1,75 @@
+"""Test snapshots of the state fixtures leave the DB in."""
+from unittest import TestCase
+
+from django.core.management import call_command
+
+from django_nose import fixture_snapshots
+from django_nose.fixture_rows import noting_added_rows
+from django_nose.fixture_snapshots import (
+    restore_fixture_snapshot,
+    save_fixture_snapshot,
+)
+from testapp.models import Choice, Question
+
+
+class FixtureSnapshotTests(TestCase):
+    """Test fixture_snapshots on the SQLite test DB."""
+
+    def setUp(self):
+        """Load the test fixture, and snapshot it."""
+        with noting_added_rows() as added:
+            call_command("loaddata", "testdata", verbosity=0)
+        save_fixture_snapshot(["testdata"], added)
+
+    def tearDown(self):
+        """Remove the loaded objects, and forget the snapshot."""
+        Choice.objects.all().delete()
+        Question.objects.all().delete()
+        fixture_snapshots._snapshots.clear()
+
+    def test_restore(self):
+        """The rows the fixture added come back, and changes to them go."""
+        Choice.objects.all().delete()
+        Question.objects.update(question_text="Changed?")
+        self.assertTrue(restore_fixture_snapshot(["testdata"]))
+        self.assertEqual(
+            Question.objects.get().question_text, "What is your favorite color?"
+        )
+        self.assertEqual(Choice.objects.get().choice_text, "Blue.")
+
+    def test_just_added_rows(self):
+        """Rows the fixture didn't add aren't part of the snapshot."""
+        Question.objects.create(pk=2, question_text="Later?", pub_date="2020-01-01")
+        save_fixture_snapshot(["testdata"], {Question: set([1])})
+        Question.objects.filter(pk=2).update(question_text="Changed?")
+        self.assertTrue(restore_fixture_snapshot(["testdata"]))
+        self.assertEqual(Question.objects.get(pk=2).question_text, "Changed?")
+
+    def test_saved_over(self):
+        """Rows saved over ones from underneath come back on another base."""
+        Choice.objects.all().delete()
+        Question.objects.update(question_text="Underneath?")
+        updated = {}
+        with noting_added_rows(updated=updated) as added:
+            call_command("loaddata", "testdata", verbosity=0)
+        added.update(updated)
+        save_fixture_snapshot(["testdata"], added)
+        Choice.objects.all().delete()
+        Question.objects.all().delete()
+        self.assertTrue(restore_fixture_snapshot(["testdata"]))
+        self.assertEqual(
+            Question.objects.get().question_text, "What is your favorite color?"
+        )
+        self.assertEqual(Choice.objects.get().question_id, 1)
+
+    def test_other_fixtures(self):
+        """There's no snapshot of fixtures that weren't snapshotted."""
+        self.assertFalse(restore_fixture_snapshot(["testdata", "other"]))
+
+    def test_closed_connection(self):
+        """A snapshot goes away with the connection holding it."""
+        # Closing an in-memory SQLite DB would lose it, so pretend to:
+        key = ("default", ("testdata",))
+        fixture_snapshots._snapshots[key] = (object(), [])
+        self.assertFalse(restore_fixture_snapshot(["testdata"]))
+        self.assertNotIn(key, fixture_snapshots._snapshots)
@@ -0,0 +1,228 @@
+"""Test finding the tables fixtures load data into."""
+import io
+import multiprocessing
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock, skipIf
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+from django_nose import fixture_tables, utils
+from django_nose.fixture_tables import (
+    _scan_json,
+    _scan_xml,
+    _scan_yaml,
+    dependency_order,
+    find_fixture_files,
+    fixture_paths,
+    models_in_fixture,
+    tables_used_by_fixtures,
+)
+from testapp.models import Choice, Question
+
+FIXTURE = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "testapp", "fixtures", "testdata.json"
+)
+
+
+class TablesUsedByFixturesTests(TestCase):
+    """Test fixture_tables.tables_used_by_fixtures."""
+
+    def test_tables(self):
+        """The tables of every model in the fixture are found."""
+        self.assertEqual(
+            tables_used_by_fixtures(["testdata"]),
+            set(["testapp_question", "testapp_choice"]),
+        )
+
+    def test_missing(self):
+        """A fixture that doesn't exist uses no tables."""
+        self.assertEqual(tables_used_by_fixtures(["nonexistent"]), set())
+
+
+class DependencyOrderTests(TestCase):
+    """Test fixture_tables.dependency_order."""
+
+    def test_order(self):
+        """Models come after the models their FKs point to."""
+        self.assertEqual(dependency_order([Choice, Question]), [Question, Choice])
+
+
+class FindFixtureFilesTests(TestCase):
+    """Test fixture_tables.find_fixture_files."""
+
+    def test_label(self):
+        """A bare label is found in the app's fixtures directory."""
+        self.assertEqual(find_fixture_files("testdata"), [(FIXTURE, "json", None)])
+
+    def test_format(self):
+        """A label with a format only matches files in that format."""
+        self.assertEqual(find_fixture_files("testdata.xml"), [])
+
+    def test_unknown_format(self):
+        """A label with an unknown format is no good."""
+        self.assertIsNone(find_fixture_files("testdata.txt"))
+
+    def test_paths(self):
+        """Labels are resolved to absolute paths for loaddata, if they can be."""
+        self.assertEqual(
+            fixture_paths(["testdata", "nonexistent"]),
+            [os.path.abspath(FIXTURE), "nonexistent"],
+        )
+
+
+class ModelsInFixtureCacheTests(TestCase):
+    """Test the cache behind fixture_tables.models_in_fixture."""
+
+    def setUp(self):
+        """Start with an empty cache in a scratch directory."""
+        self.dir = tempfile.mkdtemp()
+        self.fixture = os.path.join(self.dir, "testdata.json")
+        shutil.copy(FIXTURE, self.fixture)
+        self.patcher = mock.patch.object(
+            utils, "CACHE_DIR", os.path.join(self.dir, "cache")
+        )
+        self.patcher.start()
+        fixture_tables._cache = None
+        self.scans = 0
+        self.old_scan_models = fixture_tables._scan_models
+
+        def scan_models(*args, **kwargs):
+            self.scans += 1
+            return self.old_scan_models(*args, **kwargs)
+
+        fixture_tables._scan_models = scan_models
+
+    def tearDown(self):
+        """Put the real cache back."""
+        fixture_tables._scan_models = self.old_scan_models
+        self.patcher.stop()
+        fixture_tables._cache = None
+        shutil.rmtree(self.dir)
+
+    def _models(self):
+        return models_in_fixture(self.fixture, "json")
+
+    def test_memoized(self):
+        """A fixture is only scanned once per process."""
+        self.assertEqual(self._models(), ["testapp.question", "testapp.choice"])
+        self.assertEqual(self._models(), ["testapp.question", "testapp.choice"])
+        self.assertEqual(self.scans, 1)
+
+    def test_persisted(self):
+        """Later processes find the models in the cache file."""
+        self._models()
+        fixture_tables._cache = None
+        self._models()
+        self.assertEqual(self.scans, 1)
+
+    def test_modified(self):
+        """Changing the fixture invalidates what was cached for it."""
+        self._models()
+        stat = os.stat(self.fixture)
+        os.utime(self.fixture, (stat.st_atime, stat.st_mtime + 10))
+        self._models()
+        self.assertEqual(self.scans, 2)
+
+    def test_parallel(self):
+        """Fixtures scanned in other processes are cached in this one."""
+        if multiprocessing.current_process().daemon:
+            self.skipTest("A --parallel worker can't start processes.")
+        self._scan_in_parallel()
+        other = os.path.join(self.dir, "other.json")
+        self.assertEqual(self._models(), ["testapp.question", "testapp.choice"])
+        self.assertEqual(
+            models_in_fixture(other, "json"), ["testapp.question", "testapp.choice"]
+        )
+        self.assertEqual(self.scans, 0)
+
+    def _scan_in_parallel(self):
+        other = os.path.join(self.dir, "other.json")
+        shutil.copy(FIXTURE, other)
+        old_min_bytes = fixture_tables._PARALLEL_SCAN_MIN_BYTES
+        fixture_tables._PARALLEL_SCAN_MIN_BYTES = 0
+        try:
+            fixture_tables._scan_in_parallel(
+                [(self.fixture, "json", None), (other, "json", None)]
+            )
+        finally:
+            fixture_tables._PARALLEL_SCAN_MIN_BYTES = old_min_bytes
+
+    def test_parallel_in_daemon(self):
+        """Daemonic processes leave the scanning to models_in_fixture."""
+        with mock.patch.object(
+            fixture_tables.multiprocessing, "current_process"
+        ) as current_process:
+            current_process.return_value.daemon = True
+            with mock.patch.object(fixture_tables, "ProcessPoolExecutor") as pool:
+                self._scan_in_parallel()
+        self.assertFalse(pool.called)
+        self.assertEqual(self._models(), ["testapp.question", "testapp.choice"])
+        self.assertEqual(self.scans, 1)
+
+    def test_parallel_pool_fails(self):
+        """If the processes can't start, models_in_fixture scans in-process."""
+        with mock.patch.object(
+            fixture_tables, "ProcessPoolExecutor", side_effect=OSError
+        ):
+            self._scan_in_parallel()
+        self.assertEqual(self._models(), ["testapp.question", "testapp.choice"])
+        self.assertEqual(self.scans, 1)
+
+
+class ScanTests(TestCase):
+    """Test scanning fixtures for model labels."""
+
+    def _scan(self, scanner, text):
+        return list(scanner(io.BytesIO(text.encode("utf-8"))))
+
+    def test_json(self):
+        """Objects split across chunks are found, and nested keys ignored."""
+        old_chunk_size = fixture_tables._JSON_CHUNK_SIZE
+        fixture_tables._JSON_CHUNK_SIZE = 7
+        try:
+            models = self._scan(
+                _scan_json,
+                '[{"model": "cars.car", "fields": {"model": "Civic"}},\n'
+                ' {"pk": 2, "model": "cars.maker", "fields": {}}]',
+            )
+        finally:
+            fixture_tables._JSON_CHUNK_SIZE = old_chunk_size
+        self.assertEqual(models, ["cars.car", "cars.maker"])
+
+    def test_json_truncated(self):
+        """A fixture that ends too soon is an error."""
+        with self.assertRaises(ValueError):
+            self._scan(_scan_json, '[{"model": "cars.car", "fields": {')
+
+    @skipIf(yaml is None, "PyYAML isn't installed")
+    def test_yaml(self):
+        """The model of each object is found, wherever the key is."""
+        models = self._scan(
+            _scan_yaml,
+            "- model: cars.car\n"
+            "  fields: {model: Civic, parts: [1, 2]}\n"
+            "- pk: 2\n"
+            "  fields:\n"
+            "    model: Accord\n"
+            "  model: cars.maker\n",
+        )
+        self.assertEqual(models, ["cars.car", "cars.maker"])
+
+    def test_xml(self):
+        """Objects with models are found; related objects are not."""
+        models = self._scan(
+            _scan_xml,
+            '<?xml version="1.0" encoding="utf-8"?>'
+            '<django-objects version="1.0">'
+            '<object model="cars.car" pk="1">'
+            '<field name="parts" rel="ManyToManyRel" to="cars.part">'
+            '<object pk="1"></object></field></object>'
+            '<object model="cars.maker" pk="2"></object>'
+            "</django-objects>",
+        )
+        self.assertEqual(models, ["cars.car", "cars.maker"])
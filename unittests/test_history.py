@@ -0,0 +1,39 @@
+"""Test remembering things about tests between runs."""
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from django_nose.history import context_name, read_history, write_history
+
+
+class HistoryTests(TestCase):
+    """Test reading and writing history files."""
+
+    def setUp(self):
+        """Keep history in a temporary directory."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "history.json")
+
+    def tearDown(self):
+        """Remove the history."""
+        shutil.rmtree(self.temp_dir)
+
+    def test_round_trip(self):
+        """What's written is read back."""
+        write_history(self.path, {"a.B": 1.5})
+        self.assertEqual(read_history(self.path), {"a.B": 1.5})
+        self.assertEqual(os.listdir(self.temp_dir), ["history.json"])
+
+    def test_missing(self):
+        """A missing or garbled file is no history."""
+        self.assertEqual(read_history(self.path), {})
+        with open(self.path, "w") as history_file:
+            history_file.write("[")
+        self.assertEqual(read_history(self.path), {})
+
+    def test_context_name(self):
+        """Classes and modules are named by their dotted paths."""
+        self.assertEqual(context_name(HistoryTests), "test_history.HistoryTests")
+        self.assertEqual(context_name(os), "os")
+        self.assertIsNone(context_name(None))
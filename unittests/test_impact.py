@@ -0,0 +1,105 @@
+"""Test finding out which files tests run, and which files changed."""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase
+
+from django_nose.impact import FileRecorder, changed_files, check_ref
+
+
+class FileRecorderTests(TestCase):
+    """Test noting the files that run while contexts are open."""
+
+    def setUp(self):
+        """Make a module to run in a temporary project."""
+        self.root = tempfile.mkdtemp()
+        with open(os.path.join(self.root, "impacted.py"), "w") as module:
+            module.write("def run():\n    return 1\n")
+        sys.path.insert(0, self.root)
+        import impacted
+
+        self.module = impacted
+
+    def tearDown(self):
+        """Forget the module, and remove the project."""
+        sys.path.remove(self.root)
+        del sys.modules["impacted"]
+        shutil.rmtree(self.root)
+
+    def test_record(self):
+        """Files are noted against every open context, and only in the root."""
+        recorder = FileRecorder(root=self.root)
+        recorder.start()
+        try:
+            recorder.open_context("outer")
+            recorder.open_context("inner")
+            self.module.run()
+            inner = recorder.close_context("inner")
+            self.module.run()
+            outer = recorder.close_context("outer")
+        finally:
+            recorder.stop()
+        self.assertEqual(inner, set(["impacted.py"]))
+        self.assertEqual(outer, set(["impacted.py"]))
+        self.assertIsNone(recorder.relpath(__file__))
+
+    def test_module_files(self):
+        """The project modules a module refers to are followed, however deep."""
+        with open(os.path.join(self.root, "impacted_constants.py"), "w") as module:
+            module.write("ANSWER = 42\n")
+        with open(os.path.join(self.root, "impacted_models.py"), "w") as module:
+            module.write(
+                "import impacted_constants\n\nclass Model(object):\n    pass\n"
+            )
+        with open(os.path.join(self.root, "impacted_tests.py"), "w") as module:
+            module.write("import os\nfrom impacted_models import Model\n")
+        try:
+            import impacted_tests
+
+            files = FileRecorder(root=self.root).module_files(impacted_tests)
+        finally:
+            for name in ("impacted_constants", "impacted_models", "impacted_tests"):
+                sys.modules.pop(name, None)
+        self.assertEqual(
+            files,
+            set(["impacted_constants.py", "impacted_models.py", "impacted_tests.py"]),
+        )
+
+
+class ChangedFilesTests(TestCase):
+    """Test asking git what changed."""
+
+    def setUp(self):
+        """Make a git checkout with a commit, and go into it."""
+        self.root = tempfile.mkdtemp()
+        self.old_cwd = os.getcwd()
+        os.chdir(self.root)
+        for args in (
+            ["init", "-q"],
+            ["-c", "user.name=t", "-c", "user.email=t@t", "commit", "-q"]
+            + ["--allow-empty", "-m", "first"],
+        ):
+            subprocess.check_call(["git"] + args)
+
+    def tearDown(self):
+        """Go back, and remove the checkout."""
+        os.chdir(self.old_cwd)
+        shutil.rmtree(self.root)
+
+    def test_changed(self):
+        """New files count, even before git tracks them."""
+        os.mkdir("app")
+        with open(os.path.join("app", "models.py"), "w") as module:
+            module.write("")
+        self.assertEqual(changed_files("HEAD"), set(["app/models.py"]))
+
+    def test_bad_ref(self):
+        """A ref git doesn't know is an error."""
+        self.assertRaises(ValueError, changed_files, "no-such-ref")
+
+    def test_check_ref(self):
+        """Refs git knows as commits pass the check, and others don't."""
+        check_ref("HEAD")
+        self.assertRaises(ValueError, check_ref, "no-such-ref")
@@ -0,0 +1,101 @@
+"""Test splitting suites up for parallel runs."""
+import unittest
+from unittest import TestCase, mock
+
+from django_nose import parallel
+from django_nose.parallel import ParallelSuite, partition_suite
+
+
+class PartitionSuiteTests(TestCase):
+    """Test parallel.partition_suite."""
+
+    def _suite_mock(self, name, teardown=None):
+        context = type(name, (object,), {})
+        if teardown is not None:
+            context._fb_should_teardown_fixtures = teardown
+
+        class FakeContextSuite(object):
+            def __repr__(self):
+                return name
+
+        suite = FakeContextSuite()
+        suite.context = context
+        return suite
+
+    def test_independent_classes(self):
+        """Classes that clean up after themselves each get their own chunk."""
+        suites = [self._suite_mock(n) for n in "abc"]
+        self.assertEqual(partition_suite(suites), [[s] for s in suites])
+
+    def test_fixture_bundles_stay_together(self):
+        """Classes sharing bundled fixtures end up in the same chunk."""
+        a = self._suite_mock("a", teardown=False)
+        b = self._suite_mock("b", teardown=False)
+        c = self._suite_mock("c", teardown=True)
+        d = self._suite_mock("d")
+        self.assertEqual(partition_suite([a, b, c, d]), [[a, b, c], [d]])
+
+    def test_nested_fixtures_stay_together(self):
+        """A class tearing down only some of its fixtures stays with the next."""
+        a = self._suite_mock("a", teardown=True)
+        a.context._fb_leaves_fixtures = True
+        b = self._suite_mock("b", teardown=True)
+        b.context._fb_leaves_fixtures = False
+        c = self._suite_mock("c")
+        self.assertEqual(partition_suite([a, b, c]), [[a, b], [c]])
+
+
+class WorkerReportTests(TestCase):
+    """Test sending what plugins keep in workers back to the parent."""
+
+    def test_report_and_merge(self):
+        """Plugins with workerReport have it sent to their mergeWorkerReport."""
+        reporter = mock.Mock(spec=["name", "workerReport", "mergeWorkerReport"])
+        reporter.name = "reporter"
+        reporter.workerReport.return_value = {"m.T": 1.5}
+        quiet = mock.Mock(spec=["name"])
+        quiet.name = "quiet"
+        with mock.patch.object(parallel, "_plugins", [reporter, quiet]):
+            reports = parallel._worker_reports()
+        self.assertEqual(reports, {"reporter": {"m.T": 1.5}})
+        config = mock.Mock()
+        config.plugins.plugins = [reporter, quiet]
+        ParallelSuite([], 1, config)._merge_reports(reports)
+        reporter.mergeWorkerReport.assert_called_once_with({"m.T": 1.5})
+
+
+class ReplayTests(TestCase):
+    """Test replaying what happened in a worker."""
+
+    def test_plugins_hear(self):
+        """Plugins get each event, as they would in a serial run."""
+        config = mock.Mock()
+        config.plugins.handleError.return_value = None
+        config.plugins.formatError.return_value = None
+        suite = ParallelSuite([], 1, config)
+        result = unittest.TestResult()
+        description = ("test_x (m.T)", "m.T.test_x", None)
+        suite._replay(
+            [
+                ("startTest", description, ()),
+                ("addError", description, (KeyError, "Traceback...")),
+                ("stopTest", description, ()),
+            ],
+            result,
+        )
+        self.assertEqual(result.testsRun, 1)
+        self.assertEqual(len(result.errors), 1)
+        plugins = config.plugins
+        self.assertEqual(
+            [call[0] for call in plugins.method_calls],
+            [
+                "beforeTest",
+                "startTest",
+                "handleError",
+                "formatError",
+                "addError",
+                "stopTest",
+                "afterTest",
+            ],
+        )
+        self.assertEqual(plugins.startTest.call_args[0][0].id(), "m.T.test_x")
@@ -0,0 +1,393 @@
+"""Test the fixture bundler's planning."""
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from django_nose import plugin
+from django_nose.history import read_history, write_history
+from django_nose.plugin import (
+    _advise_fixture_loading,
+    _containment_order,
+    _nearest_order,
+    _transition,
+)
+
+
+def _suite_mock(name, fixtures):
+    context = type(name, (object,), {"fixtures": fixtures})
+
+    class FakeContextSuite(object):
+        def __repr__(self):
+            return name
+
+    suite = FakeContextSuite()
+    suite.context = context
+    return suite
+
+
+class ContainmentOrderTests(TestCase):
+    """Test plugin._containment_order."""
+
+    def test_order(self):
+        """Each set comes after the biggest set it contains, the first if tied."""
+        a, ab, abc, c, ac = (
+            frozenset(labels) for labels in ("a", "ab", "abc", "c", "ac")
+        )
+        self.assertEqual(_containment_order([abc, c, ab, a, ac]), [c, ac, a, ab, abc])
+
+
+class NearestOrderTests(TestCase):
+    """Test plugin._nearest_order."""
+
+    def test_transition(self):
+        """Groups are unloaded until the rest is wanted, then the rest loaded."""
+        self.assertEqual(
+            _transition([["a"], ["b", "c"]], frozenset("ad")), ([["b", "c"]], ["d"])
+        )
+
+    def test_order(self):
+        """Each set is followed by the one cheapest to go to."""
+        sizes = {"big": 100, "small": 1, "other": 10}
+        big, big_small, other = (
+            frozenset(labels) for labels in (["big"], ["big", "small"], ["other"])
+        )
+        with mock.patch.object(plugin, "_fixture_size", sizes.get):
+            self.assertEqual(
+                _nearest_order([big, other, big_small]), [other, big, big_small]
+            )
+
+
+class AdviseFixtureLoadingTests(TestCase):
+    """Test plugin._advise_fixture_loading."""
+
+    def test_nested(self):
+        """Supersets load and unload only the fixtures they add."""
+        core = _suite_mock("core", ["users"])
+        more = _suite_mock("more", ["users", "orders"])
+        other = _suite_mock("other", ["items"])
+        _advise_fixture_loading(
+            [
+                (frozenset(["users"]), [core], False),
+                (frozenset(["users", "orders"]), [more], False),
+                (frozenset(["items"]), [other], False),
+            ]
+        )
+        self.assertEqual(core.context._fb_fixtures_to_set_up, ["users"])
+        self.assertFalse(core.context._fb_should_teardown_fixtures)
+        self.assertTrue(core.context._fb_leaves_fixtures)
+        self.assertEqual(more.context._fb_fixtures_to_set_up, ["orders"])
+        self.assertEqual(
+            more.context._fb_fixture_groups_to_tear_down, [["orders"], ["users"]]
+        )
+        self.assertFalse(more.context._fb_leaves_fixtures)
+        self.assertEqual(other.context._fb_fixture_groups_to_tear_down, [["items"]])
+
+    def test_bundle(self):
+        """Only the first and last class of a bundle set up and tear down."""
+        first = _suite_mock("first", ["users"])
+        last = _suite_mock("last", ["users"])
+        _advise_fixture_loading([(frozenset(["users"]), [first, last], False)])
+        self.assertTrue(first.context._fb_should_setup_fixtures)
+        self.assertFalse(first.context._fb_should_teardown_fixtures)
+        self.assertFalse(last.context._fb_should_setup_fixtures)
+        self.assertTrue(last.context._fb_should_teardown_fixtures)
+
+    def test_exempt(self):
+        """Exempt classes find nothing loaded, and leave nothing behind."""
+        core = _suite_mock("core", ["users"])
+        exempt = _suite_mock("exempt", ["users", "orders"])
+        _advise_fixture_loading(
+            [
+                (frozenset(["users"]), [core], False),
+                (frozenset(["users", "orders"]), [exempt], True),
+            ]
+        )
+        self.assertEqual(core.context._fb_fixture_groups_to_tear_down, [["users"]])
+        self.assertEqual(exempt.context._fb_fixtures_to_set_up, ["users", "orders"])
+        self.assertFalse(exempt.context._fb_leaves_fixtures)
+
+
+class DurationOrderTests(TestCase):
+    """Test ordering suites by how long they took last time."""
+
+    def _reorderer(self, order, history):
+        reorderer = plugin.TestReorderer()
+        reorderer.duration_order = order
+        reorderer.duration_history_file = "durations.json"
+        patcher = mock.patch.object(plugin, "read_history", return_value=history)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return reorderer
+
+    def _suites(self):
+        return [_suite_mock(name, []) for name in "abc"]
+
+    def test_longest_first(self):
+        """Unknown suites are taken to last as long as the average."""
+        suites = self._suites()
+        history = {"unittests.test_plugin.a": 1, "unittests.test_plugin.b": 5}
+        for suite in suites:
+            suite.context.__module__ = "unittests.test_plugin"
+        self._reorderer("longest-first", history)._sort_by_duration(suites)
+        self.assertEqual([repr(s) for s in suites], ["b", "c", "a"])
+
+    def test_shortest_first(self):
+        """Ties keep their order."""
+        suites = self._suites()
+        for suite in suites:
+            suite.context.__module__ = "m"
+        history = {"m.a": 2, "m.b": 1, "m.c": 2}
+        self._reorderer("shortest-first", history)._sort_by_duration(suites)
+        self.assertEqual([repr(s) for s in suites], ["b", "a", "c"])
+
+
+class FailedFirstTests(TestCase):
+    """Test keeping failures and running them first."""
+
+    def setUp(self):
+        """Keep the failure cache in a temporary directory."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.temp_dir, "failures.json")
+
+    def tearDown(self):
+        """Remove the failure cache."""
+        shutil.rmtree(self.temp_dir)
+
+    def _result_plugin(self):
+        result_plugin = plugin.ResultPlugin()
+        result_plugin.configure(
+            mock.Mock(failed_first=True, failure_cache_file=self.cache_file),
+            mock.Mock(),
+        )
+        return result_plugin
+
+    def _test(self, test_id):
+        return mock.Mock(id=mock.Mock(return_value=test_id))
+
+    def test_cache_failures(self):
+        """Failures are kept until their tests run and pass."""
+        result_plugin = self._result_plugin()
+        result_plugin.startTest(self._test("m.A.test_one"))
+        result_plugin.startTest(self._test("m.B.test_two"))
+        result_plugin.finalize(
+            mock.Mock(errors=[(self._test("m.A.test_one"), "")], failures=[])
+        )
+        self.assertEqual(read_history(self.cache_file), {"m.A.test_one": "error"})
+
+        result_plugin = self._result_plugin()
+        result_plugin.startTest(self._test("m.B.test_two"))
+        result_plugin.finalize(
+            mock.Mock(errors=[], failures=[(self._test("m.B.test_two"), "")])
+        )
+        self.assertEqual(
+            read_history(self.cache_file),
+            {"m.A.test_one": "error", "m.B.test_two": "failure"},
+        )
+
+        result_plugin = self._result_plugin()
+        result_plugin.startTest(self._test("m.A.test_one"))
+        result_plugin.finalize(mock.Mock(errors=[], failures=[]))
+        self.assertEqual(read_history(self.cache_file), {"m.B.test_two": "failure"})
+
+        result_plugin = self._result_plugin()
+        result_plugin.startTest(self._test("m.B.test_two"))
+        result_plugin.finalize(mock.Mock(errors=[], failures=[]))
+        self.assertFalse(os.path.exists(self.cache_file))
+
+    def test_gone(self):
+        """Failures of tests that no longer exist are forgotten."""
+        write_history(
+            self.cache_file,
+            {
+                "unittests.test_plugin.FailedFirstTests.test_gone": "failure",
+                "test_plugin.FailedFirstTests.test_no_more": "failure",
+                "not_loaded.Tests.test_one": "error",
+            },
+        )
+        result_plugin = self._result_plugin()
+        result_plugin.finalize(mock.Mock(errors=[], failures=[]))
+        self.assertEqual(
+            sorted(read_history(self.cache_file)),
+            [
+                "not_loaded.Tests.test_one",
+                "unittests.test_plugin.FailedFirstTests.test_gone",
+            ],
+        )
+
+    def test_off(self):
+        """Without --failed-first, no cache is kept."""
+        result_plugin = plugin.ResultPlugin()
+        result_plugin.configure(
+            mock.Mock(failed_first=False, failure_cache_file=self.cache_file),
+            mock.Mock(),
+        )
+        result_plugin.startTest(self._test("m.A.test_one"))
+        result_plugin.finalize(
+            mock.Mock(errors=[(self._test("m.A.test_one"), "")], failures=[])
+        )
+        self.assertFalse(os.path.exists(self.cache_file))
+
+    def test_green_run(self):
+        """A green run with nothing cached writes no cache."""
+        result_plugin = self._result_plugin()
+        result_plugin.startTest(self._test("m.A.test_one"))
+        result_plugin.finalize(mock.Mock(errors=[], failures=[]))
+        self.assertFalse(os.path.exists(self.cache_file))
+
+    def test_split_failed(self):
+        """Suites with failed tests go first, in the order they had."""
+        write_history(self.cache_file, {"m.c.test_x": "failure", "m.a": "error"})
+        suites = [_suite_mock(name, []) for name in "abc"]
+        for suite in suites:
+            suite.context.__module__ = "m"
+        reorderer = plugin.TestReorderer()
+        reorderer.failure_cache_file = self.cache_file
+        failed, passed = reorderer._split_failed(suites)
+        self.assertEqual([repr(s) for s in failed], ["a", "c"])
+        self.assertEqual([repr(s) for s in passed], ["b"])
+
+
+class SelectImpactedTests(TestCase):
+    """Test running only the suites changes may affect."""
+
+    def test_select(self):
+        """Suites that ran changed files, or that we know nothing of, run."""
+        suites = [_suite_mock(name, []) for name in "abc"]
+        for suite in suites:
+            suite.context.__module__ = "m"
+        reorderer = plugin.TestReorderer()
+        reorderer.test_impact_file = "impact.json"
+        reorderer.changed_since = "main"
+        impact = {"m.a": ["app/models.py"], "m.b": ["app/views.py"]}
+        with mock.patch.object(plugin, "read_history", return_value=impact):
+            with mock.patch.object(
+                plugin, "changed_files", return_value=set(["app/models.py"])
+            ) as changed:
+                selected = reorderer._select_impacted(suites)
+        changed.assert_called_once_with("main")
+        self.assertEqual([repr(s) for s in selected], ["a", "c"])
+
+    def test_bad_ref(self):
+        """A ref git doesn't know is a usage error."""
+        conf = mock.Mock()
+        conf.getParser.return_value.error.side_effect = SystemExit(2)
+        reorderer = plugin.TestReorderer()
+        with mock.patch.object(plugin, "check_ref", side_effect=ValueError):
+            self.assertRaises(
+                SystemExit,
+                reorderer.configure,
+                mock.Mock(changed_since="nope", shard=None),
+                conf,
+            )
+        self.assertTrue(conf.getParser.return_value.error.called)
+
+
+class DurationHistoryTests(TestCase):
+    """Test remembering how long classes took."""
+
+    def test_worker_report(self):
+        """Durations timed in a worker are handed over once, and merged."""
+        worker = plugin.DurationHistory()
+        worker.durations = {"m.T": 1.5}
+        parent = plugin.DurationHistory()
+        parent.durations = {"m.U": 2.0}
+        parent.mergeWorkerReport(worker.workerReport())
+        self.assertEqual(parent.durations, {"m.T": 1.5, "m.U": 2.0})
+        self.assertEqual(worker.workerReport(), {})
+
+
+class RecordImpactTests(TestCase):
+    """Test noting the files each test class runs."""
+
+    def test_import_time(self):
+        """Files run while a class's module or package was imported count."""
+        impact = plugin.TestImpact()
+        impact.configure(
+            mock.Mock(test_impact_file="impact.json", enable_plugin_test_impact=True),
+            mock.Mock(),
+        )
+        impact.recorder = mock.Mock()
+        for module, files in (("app", ["app/__init__.py"]), ("app.tests", [])):
+            impact.recorder.close_context.return_value = set(files)
+            impact.beforeImport(module.replace(".", "/") + ".py", module)
+            impact.afterImport(module.replace(".", "/") + ".py", module)
+        impact.recorder.close_context.return_value = set(["app/views.py"])
+        context = _suite_mock("Case", []).context
+        context.__module__ = "app.tests"
+        impact.stopContext(context)
+        self.assertEqual(
+            impact.impact, {"app.tests.Case": set(["app/__init__.py", "app/views.py"])}
+        )
+
+    def test_worker_report(self):
+        """Files noted in a worker are handed over once, and merged."""
+        worker = plugin.TestImpact()
+        worker.impact = {"m.T": set(["a.py"])}
+        parent = plugin.TestImpact()
+        parent.impact = {"m.T": set(["b.py"])}
+        parent.mergeWorkerReport(worker.workerReport())
+        self.assertEqual(parent.impact, {"m.T": set(["a.py", "b.py"])})
+        self.assertEqual(worker.workerReport(), {})
+
+
+class ShardTests(TestCase):
+    """Test splitting the suites across machines."""
+
+    def _reorderer(self, shard, history, should_bundle=False):
+        reorderer = plugin.TestReorderer()
+        reorderer.shard = plugin._parse_shard(shard)
+        reorderer.should_bundle = should_bundle
+        reorderer.duration_history_file = "durations.json"
+        patcher = mock.patch.object(plugin, "read_history", return_value=history)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return reorderer
+
+    def _suites(self, names, base=object):
+        suites = []
+        for name in names:
+            suite = _suite_mock(name, [])
+            suite.context = type(name, (base,), {"fixtures": ["f%s" % len(name)]})
+            suite.context.__module__ = "m"
+            suites.append(suite)
+        return suites
+
+    def test_parse(self):
+        """Shards are numbered from 1."""
+        self.assertEqual(plugin._parse_shard("1/12"), (0, 12))
+        for value in ("0/2", "3/2", "1", "a/b"):
+            self.assertRaises(ValueError, plugin._parse_shard, value)
+
+    def test_bad_option(self):
+        """A bad --shard is a usage error."""
+        conf = mock.Mock()
+        conf.getParser.return_value.error.side_effect = SystemExit(2)
+        reorderer = plugin.TestReorderer()
+        self.assertRaises(
+            SystemExit,
+            reorderer.configure,
+            mock.Mock(shard="3/2", changed_since=None),
+            conf,
+        )
+        conf.getParser.return_value.error.assert_called_once_with(
+            "--shard takes i/N, with i from 1 to N, not '3/2'."
+        )
+
+    def test_balance(self):
+        """The longest go first to the least loaded shard, keeping the order."""
+        history = {"m.a": 5, "m.b": 3, "m.c": 2, "m.d": 2}
+        suites = self._suites("abcd")
+        first = self._reorderer("1/2", history)._select_shard(suites)
+        second = self._reorderer("2/2", history)._select_shard(suites)
+        self.assertEqual([repr(s) for s in first], ["a", "d"])
+        self.assertEqual([repr(s) for s in second], ["b", "c"])
+
+    def test_bundles(self):
+        """Classes sharing fixtures go to the same shard."""
+        history = {"m.a": 1, "m.bb": 1, "m.cc": 1}
+        suites = self._suites(["a", "bb", "cc"], base=plugin.FastFixtureTestCase)
+        first = self._reorderer("1/2", history, True)._select_shard(suites)
+        second = self._reorderer("2/2", history, True)._select_shard(suites)
+        self.assertEqual([repr(s) for s in first], ["bb", "cc"])
+        self.assertEqual([repr(s) for s in second], ["a"])
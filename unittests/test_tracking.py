@@ -0,0 +1,102 @@
+"""Test tracking which tables tests write to."""
+import threading
+from unittest import TestCase, mock
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from django_nose import tracking
+from django_nose.runner import _with_referencing_tables
+from django_nose.tracking import WriteTracker, written_tables
+
+
+class WrittenTablesTests(TestCase):
+    """Test tracking.written_tables."""
+
+    def test_writes(self):
+        """The table each kind of write names is found, however it's quoted."""
+        for sql in (
+            'INSERT INTO "testapp_question" ("question_text") VALUES (%s)',
+            "INSERT IGNORE INTO `testapp_question` VALUES (1)",
+            'UPDATE "testapp_question" SET "question_text" = %s',
+            "DELETE FROM testapp_question WHERE id IN (1, 2)",
+            "UPDATE ONLY testapp_question SET id = 1",
+            "DELETE FROM testapp_question;",
+        ):
+            self.assertEqual(written_tables(sql), set(["testapp_question"]))
+
+    def test_truncate(self):
+        """Every table a TRUNCATE lists is found."""
+        for sql in (
+            'TRUNCATE "testapp_question", "testapp_choice";',
+            "TRUNCATE TABLE ONLY testapp_question,testapp_choice RESTART IDENTITY",
+        ):
+            self.assertEqual(
+                written_tables(sql), set(["testapp_question", "testapp_choice"])
+            )
+
+    def test_reads(self):
+        """Statements that don't write name no table."""
+        self.assertEqual(written_tables('SELECT * FROM "testapp_question"'), set())
+
+    def test_unknown_write(self):
+        """Writes we can't make sense of are flagged."""
+        self.assertIsNone(
+            written_tables("WITH q AS (SELECT 1) DELETE FROM testapp_question")
+        )
+
+    def test_tracker(self):
+        """The tracker notes written tables, and passes the statement on."""
+        tracker = WriteTracker()
+
+        def execute(sql, params, many, context):
+            return "done"
+
+        self.assertEqual(
+            tracker(execute, 'DELETE FROM "testapp_choice"', None, False, {}), "done"
+        )
+        tracker(execute, 'SELECT 1 FROM "testapp_question"', None, False, {})
+        tracker(execute, 'TRUNCATE "testapp_question", "a";', None, False, {})
+        self.assertEqual(
+            tracker.tables, set(["testapp_choice", "testapp_question", "a"])
+        )
+        tracker.reset()
+        self.assertEqual(tracker.tables, set())
+
+    def test_other_threads(self):
+        """Connections opened by other threads get the tracker too."""
+        tracker = WriteTracker()
+        wrappers = []
+
+        def connect():
+            connection = connections["default"]
+            connection.ensure_connection()
+            wrappers.extend(connection.execute_wrappers)
+            connection.close()
+
+        connection_created.connect(tracking._attach_tracker)
+        try:
+            with mock.patch.dict(tracking._trackers, {"default": tracker}):
+                thread = threading.Thread(target=connect)
+                thread.start()
+                thread.join()
+        finally:
+            connection_created.disconnect(tracking._attach_tracker)
+        self.assertIn(tracker, wrappers)
+
+
+class ReferencingTablesTests(TestCase):
+    """Test runner._with_referencing_tables."""
+
+    def test_referencing(self):
+        """Tables with foreign keys into the given ones are added."""
+        self.assertEqual(
+            _with_referencing_tables(["testapp_question"]),
+            set(["testapp_question", "testapp_choice"]),
+        )
+
+    def test_not_referenced(self):
+        """Tables nothing refers to stay on their own."""
+        self.assertEqual(
+            _with_referencing_tables(["testapp_choice"]), set(["testapp_choice"])
+        )
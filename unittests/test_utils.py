@@ -0,0 +1,102 @@
+"""Test django-nose's utility functions."""
+import os
+import shutil
+import sys
+import tempfile
+from unittest import TestCase, mock
+
+from nose.suite import ContextSuite
+
+from django_nose import utils
+
+
+class ProcessTestsTests(TestCase):
+    """Test walking trees of suites."""
+
+    def test_order(self):
+        """Tests are processed in order, and suites with setup aren't entered."""
+        leaves = [ContextSuite([], context=ProcessTestsTests) for _ in range(3)]
+        tree = ContextSuite(
+            [ContextSuite([leaves[0], ContextSuite([leaves[1]])]), leaves[2]]
+        )
+        processed = []
+        utils.process_tests(tree, processed.append)
+        self.assertEqual(processed, leaves)
+
+    def test_deep(self):
+        """Suites nested deeper than the recursion limit are no trouble."""
+        leaf = ContextSuite([], context=ProcessTestsTests)
+        tree = leaf
+        for _ in range(sys.getrecursionlimit() * 2):
+            tree = ContextSuite([tree])
+        processed = []
+        utils.process_tests(tree, processed.append)
+        self.assertEqual(processed, [leaf])
+
+
+class CacheDirTests(TestCase):
+    """Test choosing where caches are kept."""
+
+    def setUp(self):
+        """Point the cache directory into a scratch directory."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.temp_dir, "cache")
+        self.patcher = mock.patch.object(utils, "CACHE_DIR", self.cache_dir)
+        self.patcher.start()
+
+    def tearDown(self):
+        """Remove the scratch directory."""
+        self.patcher.stop()
+        shutil.rmtree(self.temp_dir)
+
+    def test_made(self):
+        """The directory is made, for its owner alone."""
+        self.assertEqual(utils.cache_dir(), self.cache_dir)
+        self.assertEqual(os.stat(self.cache_dir).st_mode & 0o777, 0o700)
+
+    def test_shared(self):
+        """A directory others can write to isn't used."""
+        os.mkdir(self.cache_dir)
+        os.chmod(self.cache_dir, 0o777)
+        self.assertIsNone(utils.cache_dir())
+
+    def test_not_a_dir(self):
+        """Nor is something that isn't a directory."""
+        os.symlink(self.temp_dir, self.cache_dir)
+        self.assertIsNone(utils.cache_dir())
+
+
+class AtomicWriteTests(TestCase):
+    """Test replacing files all at once."""
+
+    def setUp(self):
+        """Start with a file in a scratch directory."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "file")
+        with open(self.path, "w") as old_file:
+            old_file.write("old")
+
+    def tearDown(self):
+        """Remove the scratch directory."""
+        shutil.rmtree(self.temp_dir)
+
+    def _contents(self):
+        with open(self.path) as new_file:
+            return new_file.read()
+
+    def test_replaced(self):
+        """The file is replaced with what's written."""
+        utils._atomic_write(self.path, lambda new_file: new_file.write("new"))
+        self.assertEqual(self._contents(), "new")
+        self.assertEqual(os.listdir(self.temp_dir), ["file"])
+
+    def test_failed(self):
+        """If writing fails, the old file stays, and no partial one is left."""
+
+        def write(new_file):
+            new_file.write("new")
+            raise ValueError("Oops.")
+
+        self.assertRaises(ValueError, utils._atomic_write, self.path, write)
+        self.assertEqual(self._contents(), "old")
+        self.assertEqual(os.listdir(self.temp_dir), ["file"])